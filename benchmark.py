@@ -0,0 +1,762 @@
+# %%
+# 为兼容低版本python（不支持函数的参数类别声明），导入__future__模块
+from __future__ import annotations
+
+# %% md
+# 性能测试
+# %%
+import contextlib
+import csv
+import glob
+import importlib.util
+import io
+import os
+import py_compile
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import my_sdt
+import my_sdt_action
+import task1_package
+import task3
+from task1_package import DFA, DFA_SPEC, LEXER_BACKEND, TABLE_LEXER, ChunkedTokenList, check_backend_equivalence, parse, \
+    relex
+
+
+# %%
+# 构造大规模输入
+def get_large_code(repeat: int = 300, sample_filepath: str = './data/input/1_sample.c') -> str:
+    """
+    将样例文件重复若干次，构造一个大规模的C语言输入，用于性能测试
+    :param repeat: 重复次数
+    :param sample_filepath: 样例文件路径
+    :return: 代码字符串
+    """
+    with open(sample_filepath, 'r', encoding='utf-8') as f:
+        code = f.read()
+    return (code + '\n') * repeat
+
+
+def get_large_program(repeat: int = 300, sample_filepath: str = './data/input/1_sample.c') -> str:
+    """
+    将样例文件中main函数的函数体作为循环体重复若干次，构造一个语法正确的大规模C语言程序，用于语法分析的性能测试
+    (放在循环中，函数体中不在循环中的break和continue不会因为重复而出现多次)
+    :param repeat: 重复次数
+    :param sample_filepath: 样例文件路径
+    :return: 代码字符串
+    """
+    with open(sample_filepath, 'r', encoding='utf-8') as f:
+        code = f.read()
+    body_start, body_end = code.index('{') + 1, code.rindex('}')
+    return code[:body_start] + ('\nwhile (0 < 1) {' + code[body_start:body_end] + '}\n') * repeat + code[body_end:]
+
+
+# 计时函数
+def best_time(func: callable, *args, repeat: int = 3) -> float:
+    """
+    多次运行函数，返回最短的一次耗时(秒)
+    :param func: 要计时的函数
+    :param args: 函数的参数
+    :param repeat: 运行次数
+    :return: 最短耗时
+    """
+    result = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+# %%
+# 词法分析：每个token重新构造DFA vs 预编译DFA
+class RebuildDFA(dict):
+    """模拟旧实现：每次取用DFA时都根据DFA_SPEC重新构造一个DFA"""
+
+    def __getitem__(self, name):
+        return DFA(**DFA_SPEC[name])
+
+
+def benchmark_lexer_dfa(code: str, repeat: int = 3):
+    """
+    对比每个token重新构造DFA(旧实现)和使用模块级预编译DFA(新实现)时，词法分析每个token的平均耗时
+    :param code: 代码字符串
+    :param repeat: 运行次数
+    """
+    token_count = len(parse(code))
+    compiled_dfa = task1_package.LEXER_DFA
+    try:
+        task1_package.LEXER_DFA = RebuildDFA()
+        before = best_time(parse, code, repeat=repeat)
+    finally:
+        task1_package.LEXER_DFA = compiled_dfa
+    after = best_time(parse, code, repeat=repeat)
+    print(f"[lexer] {len(code)} chars, {token_count} tokens")
+    print(f"[lexer] rebuild DFA per token: {before:.3f}s, {before / token_count * 1e6:.2f}us/token")
+    print(f"[lexer] precompiled DFA:       {after:.3f}s, {after / token_count * 1e6:.2f}us/token")
+
+
+# 词法分析：各个词法分析实现的对比
+def benchmark_lexer_backend(code: str, repeat: int = 3):
+    """
+    对比LEXER_BACKEND中各个词法分析实现，每个token的平均耗时
+    :param code: 代码字符串
+    :param repeat: 运行次数
+    """
+    token_count = len(parse(code))
+    for backend, backend_parse in LEXER_BACKEND.items():
+        cost = best_time(backend_parse, code, repeat=repeat)
+        print(f"[lexer] backend {backend!r}: {cost:.3f}s, {cost / token_count * 1e6:.2f}us/token")
+
+
+def measure_memory(func, *args) -> tuple[object, int]:
+    """运行函数，返回结果和结果占用的内存(字节，不含输入)"""
+    tracemalloc.start()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def benchmark_token_store(code: str, repeat: int = 3):
+    """
+    对比Token对象列表和紧凑的token存储(TokenStore)的耗时和每个token占用的内存
+    :param code: 代码字符串
+    :param repeat: 运行次数
+    """
+    token_list, list_size = measure_memory(TABLE_LEXER.parse, code)
+    _store, store_size = measure_memory(TABLE_LEXER.tokenize, code)
+    token_count = len(token_list)
+    print(f"[lexer] token list:  {best_time(TABLE_LEXER.parse, code, repeat=repeat):.3f}s, "
+          f"{list_size / token_count:.1f}B/token")
+    print(f"[lexer] token store: {best_time(TABLE_LEXER.tokenize, code, repeat=repeat):.3f}s, "
+          f"{store_size / token_count:.1f}B/token")
+
+
+def benchmark_token_stream(code: str, scales: tuple[int, ...] = (1, 4, 16), window_size: int = 1 << 16):
+    """
+    流式词法分析(mmap + 窗口)的耗时和内存峰值：输入变大时内存峰值应该基本不变
+    :param code: 代码字符串(按scales中的倍数重复后写入临时文件)
+    :param scales: 输入规模的倍数
+    :param window_size: 窗口大小(字节)
+    """
+
+    def consume(file_path: str) -> int:
+        # 只计数，不保留token
+        return sum(1 for _ in TABLE_LEXER.stream(file_path, window_size))
+
+    for scale in scales:
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.c', delete=False) as f:
+            f.write(code * scale)
+        try:
+            tracemalloc.start()
+            token_count = consume(f.name)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            cost = best_time(consume, f.name, repeat=1)
+        finally:
+            os.remove(f.name)
+        print(f"[lexer] token stream x{scale}: {token_count} tokens, {cost:.3f}s, "
+              f"{cost / token_count * 1e6:.2f}us/token, peak memory {peak / 1024:.0f}KiB")
+
+
+def benchmark_long_token_stream(lengths: tuple[int, ...] = (1 << 18, 1 << 20, 1 << 22), window_size: int = 1 << 12):
+    """
+    流式词法分析遇到比窗口长得多的token(没有结束的块注释、很长的字符串)：结果应该和tokenize相同，耗时应该和token长度成正比
+    :param lengths: token的长度(字符)
+    :param window_size: 窗口大小(字节)
+    """
+    for name, template in [('unterminated comment', 'int a;\n/* {}'), ('string', 'int a;\n"{}";\n')]:
+        for length in lengths:
+            code = template.format('x' * length)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.c', delete=False) as f:
+                f.write(code)
+            try:
+                start = time.perf_counter()
+                streamed = [(token.type, token.value, token.start, token.line, token.column)
+                            for token in TABLE_LEXER.stream(f.name, window_size)]
+                cost = time.perf_counter() - start
+            finally:
+                os.remove(f.name)
+            expected = [(token.type, token.value, token.start, token.line, token.column)
+                        for token in TABLE_LEXER.tokenize(code)]
+            assert streamed == expected, f"流式词法分析的结果不同: {name} x{length}"
+            print(f"[lexer] token stream, {name} of {length} chars (window {window_size}B): {cost:.3f}s, "
+                  f"{cost / length * 1e9:.0f}ns/char")
+
+
+def benchmark_relex(repeats: tuple[int, ...] = (300, 3000), edit_count: int = 20, repeat: int = 3):
+    """
+    编辑固定不变(在文件开头附近和文件中间各插入再删除一个字符)，文件越来越大，增量词法分析的耗时应当基本不变
+    (和重新分析整个文件对比)
+    :param repeats: 样例文件的重复次数(文件大小)
+    :param edit_count: 每个位置编辑的次数，取最短的一次耗时
+    :param repeat: 重新分析整个文件的运行次数
+    """
+    edit_costs = []
+    for repeat_count in repeats:
+        code = get_large_code(repeat_count)
+        tokens = ChunkedTokenList(TABLE_LEXER.parse(code))
+        costs = []
+        for offset in (len(get_large_code(1)) + 10, len(code) // 2):
+            cost = float('inf')
+            for _ in range(edit_count):
+                for edit, new_code in (((offset, 0, 'x'), code[:offset] + 'x' + code[offset:]), ((offset, 1, ''), code)):
+                    start = time.perf_counter()
+                    tokens = relex(tokens, new_code, edit)
+                    cost = min(cost, time.perf_counter() - start)
+            costs.append(cost)
+        expected = [(token.type, token.value, token.start, token.line, token.column) for token in TABLE_LEXER.parse(code)]
+        assert [(token.type, token.value, token.start, token.line, token.column) for token in tokens] == expected, \
+            "增量词法分析的结果不同"
+        full_cost = best_time(TABLE_LEXER.parse, code, repeat=repeat)
+        print(f"[lexer] relex after 1-char edit, {len(tokens)} tokens: near start {costs[0] * 1000:.3f}ms, "
+              f"mid-file {costs[1] * 1000:.3f}ms (full relex {full_cost:.3f}s)")
+        edit_costs.append(costs)
+    for costs in edit_costs[1:]:
+        for cost, base_cost in zip(costs, edit_costs[0]):
+            assert cost < base_cost * 3 + 1e-4, f"增量词法分析的耗时随文件大小增长: {base_cost * 1000:.3f}ms -> {cost * 1000:.3f}ms"
+
+
+# %%
+# 词法分析实现的差分测试
+# 覆盖各个DFA的每一个终态(包括各种错误提示)的代码片段
+lexer_edge_cases = [
+    '#include <stdio.h>\n  #define X 1\nint a; #define Y 2',
+    '0x1F 0xZZ 0x 0b101 0b12 0b 0777 0789 08 0e5 12abc 1.5e+3 1.5e 1.5e- 1.5ex .5 . 3.x 1e5 9. 0.',
+    "'a' '\\n' 'ab' '\\' '\n'\\\n'",
+    '"abc\\"def" "unterminated\n"esc\\\n"ok" "\\',
+    '/* comment ** / still */ /* a **/ b */ // line comment\n/* x *',
+    'x <<= 1; y >>= 2; z->w; a && b || c; a &= b; a |= b; !x; ~x; a ? b : c; a\\b; a /b; a/=b;',
+    '`@$ 中文标识符 "字符串中的中文" \'中\' /* 注释中的中文 */ // 中文\r\n',
+]
+
+
+def check_token_positions(code: str):
+    """检查'dfa'实现记录的token位置和逐字符扫描得到的位置(旧的get_token_place的做法)相同"""
+    line, column, offset = 1, 1, 0
+    for token in parse(code):
+        assert (token.start, token.line, token.column) == (offset, line, column), \
+            f"token位置错误: {token.value!r}, 期望{(offset, line, column)}, 实际{(token.start, token.line, token.column)}"
+        for char in token.value:
+            if char == '\n':
+                line, column = line + 1, 1
+            else:
+                column += 1
+        offset += len(token.value)
+
+
+def check_lexer_backends(random_case_count: int = 2000, seed: int = 0):
+    """
+    差分测试：在语料(输入样例、边界情况、随机生成的代码片段)上检查token的位置正确，且所有词法分析实现的token序列和'dfa'实现完全相同
+    :param random_case_count: 随机生成的代码片段数量
+    :param seed: 随机数种子
+    """
+    corpus = []
+    for sample_filepath in sorted(glob.glob('./data/input/*.c')):
+        with open(sample_filepath, 'r', encoding='utf-8') as f:
+            corpus.append(f.read())
+    corpus += lexer_edge_cases
+    alphabet = list("abxXeEbB0189_ .+-*/\\\"'#\n\t<>=&|;(){}[]!?:,~^%中`@$\r") + ['/*', '*/', '//', '0x', '0b', '1e']
+    rng = random.Random(seed)
+    for _ in range(random_case_count):
+        corpus.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))))
+    for code in corpus:
+        check_token_positions(code)
+        check_backend_equivalence(code)
+    print(f"[lexer] {len(corpus)} cases, backends {list(LEXER_BACKEND)} are equivalent")
+
+
+def check_relex(random_case_count: int = 2000, seed: int = 0):
+    """
+    差分测试：对随机代码做随机编辑，增量词法分析的结果(包括位置)必须和重新分析整个代码的结果相同
+    :param random_case_count: 随机编辑的次数
+    :param seed: 随机数种子
+    """
+    alphabet = list("abxeE019_ .+-*/\\\"'#\n\t<>=&|;(){}!中") + ['/*', '*/', '//', '\n#define x\n', 'int ']
+    rng = random.Random(seed)
+    code = ''
+    tokens = []
+    for _ in range(random_case_count):
+        if rng.random() < 0.05:  # 偶尔换一段新的代码
+            code = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+            tokens = TABLE_LEXER.parse(code)
+            if rng.random() < 0.5:  # 用很小的块，覆盖跨块的替换、块的拆分和平移量的延迟应用
+                tokens = ChunkedTokenList(tokens, chunk_size=rng.choice([1, 2, 4]))
+        offset = rng.randint(0, len(code))
+        deleted_length = rng.randint(0, min(5, len(code) - offset))
+        inserted_text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 4)))
+        new_code = code[:offset] + inserted_text + code[offset + deleted_length:]
+        tokens = relex(tokens, new_code, (offset, deleted_length, inserted_text))
+        expected = [(token.type, token.value, token.hint, token.start, token.line, token.column)
+                    for token in TABLE_LEXER.parse(new_code)]
+        actual = [(token.type, token.value, token.hint, token.start, token.line, token.column) for token in tokens]
+        assert actual == expected, f"增量词法分析的结果不同: {code!r}, 编辑{(offset, deleted_length, inserted_text)}"
+        code = new_code
+    print(f"[lexer] {random_case_count} random edits, relex is equivalent to a full relex")
+
+
+# %%
+# 语法分析表的构造
+def get_large_grammar(repeat: int = 10, grammar: dict = my_sdt.sdt_grammar) -> dict:
+    """
+    将文法复制若干份(非终结符加上编号后缀)，构造一个更大的文法，用于测试First集、Follow集的耗时
+    第k份的Program可以推出第k+1份的Program，使各份文法连通
+    :param repeat: 复制的份数
+    :param grammar: 增广文法
+    :return: 增广文法
+    """
+    large_grammar = {"S'": [["Program0"]]}
+    for k in range(repeat):
+        for A, rights in grammar.items():
+            if A == "S'":
+                continue
+            large_grammar[f"{A}{k}"] = [[f"{X}{k}" if X in grammar else X for X in right] for right in rights]
+        if k + 1 < repeat:
+            large_grammar[f"Program{k}"].append([f"Program{k + 1}"])
+    return large_grammar
+
+
+def benchmark_first_follow(repeat: int = 3, scales: tuple[int, ...] = (1, 10, 30)):
+    """
+    不同规模的文法上First集和Follow集的耗时
+    :param repeat: 运行次数
+    :param scales: 文法复制的份数
+    """
+    for scale in scales:
+        grammar = get_large_grammar(scale)
+        _, nonterminal_symbol_list, terminal_symbol_list = task3.get_symbol_list(grammar)
+        cost = best_time(
+            lambda: task3.get_follow(grammar, nonterminal_symbol_list, terminal_symbol_list,
+                                     task3.get_first(grammar, nonterminal_symbol_list, terminal_symbol_list)),
+            repeat=repeat)
+        production_count = sum(len(rights) for rights in grammar.values())
+        print(f"[parser] grammar x{scale}: {production_count} productions, first/follow {cost * 1000:.2f}ms")
+
+
+def benchmark_parser_tables(repeat: int = 3):
+    """
+    语法分析表构造各个阶段的耗时：First集和Follow集、项集族、SLR分析表
+    :param repeat: 运行次数
+    """
+    grammar = my_sdt.sdt_grammar
+    symbol_list, nonterminal_symbol_list, terminal_symbol_list = task3.get_symbol_list(grammar)
+    productions = task3.ProductionTable(grammar)
+    first = task3.get_first(grammar, nonterminal_symbol_list, terminal_symbol_list)
+    follow = task3.get_follow(grammar, nonterminal_symbol_list, terminal_symbol_list, first)
+    item_set_family, transitions = task3.get_itemSetFamily(productions, symbol_list)
+    first_follow_cost = best_time(
+        lambda: task3.get_follow(grammar, nonterminal_symbol_list, terminal_symbol_list,
+                                 task3.get_first(grammar, nonterminal_symbol_list, terminal_symbol_list)),
+        repeat=repeat)
+    family_cost = best_time(task3.get_itemSetFamily, productions, symbol_list, repeat=repeat)
+    print(f"[parser] {len(productions)} productions, {len(item_set_family)} states: first/follow {first_follow_cost:.4f}s, "
+          f"item set family {family_cost:.4f}s")
+    for mode in task3.PARSER_MODES:
+        table_cost = best_time(task3.get_SLR_table, productions, symbol_list, nonterminal_symbol_list,
+                               terminal_symbol_list, first, follow, item_set_family, transitions, mode, repeat=repeat)
+        action, _goto = task3.get_SLR_table(productions, symbol_list, nonterminal_symbol_list, terminal_symbol_list,
+                                            first, follow, item_set_family, transitions, mode)
+        print(f"[parser] {mode} table {table_cost:.4f}s, {len(task3.get_conflicts(action))} conflicts")
+
+
+def benchmark_parser_cache(repeat: int = 3):
+    """
+    对比构造分析表和从磁盘缓存加载分析表的耗时(使用临时的缓存目录)
+    :param repeat: 运行次数
+    """
+    grammar = my_sdt.sdt_grammar
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_cost = best_time(task3.build_parser_tables, grammar, repeat=repeat)
+        task3.load_parser_tables(grammar, cache_dir=cache_dir)  # 写入缓存
+        load_cost = best_time(lambda: task3.load_parser_tables(grammar, cache_dir=cache_dir), repeat=repeat)
+        assert task3.load_parser_tables(grammar, cache_dir=cache_dir) == task3.build_parser_tables(grammar), \
+            "缓存中的分析表和重新构造的不同"
+        # 修改构造分析表的代码后，指纹不同，旧的缓存不会被加载
+        original_code = task3.digraph.__code__
+        fingerprint = task3.get_grammar_fingerprint(grammar)
+        try:
+            task3.digraph.__code__ = original_code.replace(co_consts=original_code.co_consts + ('changed',))
+            task3._generator_fingerprint = None
+            assert task3.get_grammar_fingerprint(grammar) != fingerprint, "修改分析表构造代码后缓存没有失效"
+        finally:
+            task3.digraph.__code__ = original_code
+            task3._generator_fingerprint = None
+        assert task3.get_grammar_fingerprint(grammar) == fingerprint
+    print(f"[parser] build tables {build_cost * 1000:.2f}ms, load cached tables {load_cost * 1000:.2f}ms")
+
+
+def check_compressed_tables(mode: str = 'SLR'):
+    """
+    检查压缩后的分析表的查表结果和原表相同：不使用缺省归约时完全相同；使用缺省归约时只有报错的格子可以变为归约；
+    推导用的一维列表(get_lists，状态用偏移表示时)查到的结果也相同
+    :param mode: 分析表的类型
+    """
+    tables = task3.build_parser_tables(my_sdt.sdt_grammar, mode)
+    action, goto = tables['action'], tables['goto']
+    nonterminal_symbol_list, terminal_symbol_list = tables['nonterminal_symbol_list'], tables['terminal_symbol_list']
+    for default_reductions in [False, True]:
+        compressed = task3.compress_parser_tables(action, goto, nonterminal_symbol_list, terminal_symbol_list,
+                                                  default_reductions)
+        for state in action:
+            for terminal_id, X in enumerate(terminal_symbol_list):
+                expected, actual = task3.encode_action(action[state][X]), compressed.action_of(state, terminal_id)
+                assert actual == expected or default_reductions and expected == task3.ACTION_ERROR and \
+                       actual & task3.ACTION_TAG_MASK == task3.ACTION_REDUCE, \
+                    f"压缩后的action表不同: I{state}遇到{X}, 期望{action[state][X]!r}, 实际{task3.decode_action(actual)!r}"
+            for nonterminal_id, X in enumerate(nonterminal_symbol_list):
+                expected = int(goto[state][X]) if goto[state][X] != '' else -1
+                assert compressed.goto_of(state, nonterminal_id) == expected, f"压缩后的goto表不同: I{state}遇到{X}"
+    compressed = task3.compress_parser_tables(action, goto, nonterminal_symbol_list, terminal_symbol_list,
+                                              default_reductions=False)
+    base = list(compressed.table.base)
+    assert len(set(base)) == len(base), "不同状态的偏移相同"
+    _, check, value = compressed.get_lists(base)
+    for state in action:
+        offset = base[state]
+        for terminal_id, X in enumerate(terminal_symbol_list):
+            actual = value[offset + terminal_id] if check[offset + terminal_id] == offset else task3.ACTION_ERROR
+            if actual & task3.ACTION_TAG_MASK == task3.ACTION_SHIFT:
+                actual = base.index(actual >> task3.ACTION_TAG_BITS) << task3.ACTION_TAG_BITS | task3.ACTION_SHIFT
+            assert actual == task3.encode_action(action[state][X]), f"一维列表的action表不同: I{state}遇到{X}"
+        for nonterminal_id, X in enumerate(nonterminal_symbol_list):
+            if goto[state][X] != '':
+                assert value[offset + len(terminal_symbol_list) + nonterminal_id] == base[int(goto[state][X])], \
+                    f"一维列表的goto表不同: I{state}遇到{X}"
+    print(f"[parser] compressed {mode} tables are equivalent")
+
+
+def benchmark_compressed_tables():
+    """
+    对比字典形式的分析表和压缩后的分析表占用的内存(查表的耗时见benchmark_generated_parser)
+    """
+    grammar = my_sdt.sdt_grammar
+    tables = task3.build_parser_tables(grammar)
+    nonterminal_symbol_list, terminal_symbol_list = tables['nonterminal_symbol_list'], tables['terminal_symbol_list']
+    productions = task3.ProductionTable(grammar)
+    first = task3.get_first(grammar, nonterminal_symbol_list, terminal_symbol_list)
+    follow = task3.get_follow(grammar, nonterminal_symbol_list, terminal_symbol_list, first)
+    item_set_family = [task3.ItemSet(kernel, productions) for kernel in tables['kernels']]
+    (action, goto), dict_size = measure_memory(
+        task3.get_SLR_table, productions, tables['symbol_list'], nonterminal_symbol_list, terminal_symbol_list,
+        first, follow, item_set_family, tables['transitions'])
+    compressed = task3.compress_parser_tables(action, goto, nonterminal_symbol_list, terminal_symbol_list,
+                                              default_reductions=False)
+    cell_count = len(action) * (len(terminal_symbol_list) + len(nonterminal_symbol_list))
+    print(f"[parser] dict tables {dict_size / 1024:.1f}KiB, compressed tables {compressed.__sizeof__() / 1024:.1f}KiB "
+          f"({len(compressed.table.value)} cells vs {cell_count})")
+
+
+class ParsingBenchmark:
+    """推导的性能测试共用的分析表和输入"""
+
+    def __init__(self, grammar: dict = my_sdt.sdt_grammar):
+        tables = task3.load_parser_tables(grammar)
+        productions = task3.ProductionTable(grammar)
+        self.item_set_family = [task3.ItemSet(kernel, productions) for kernel in tables['kernels']]
+        _, self.augmented_grammar_order_list = task3.get_augmented_grammar_to_index(grammar)
+        self.nonterminal_symbol_list = tables['nonterminal_symbol_list']
+        self.terminal_symbol_list = tables['terminal_symbol_list']
+        self.action, self.goto, self.table = tables['action'], tables['goto'], tables['table']
+        self.tokens_per_repeat = len(self.get_tokens(2)) - len(self.get_tokens(1))
+
+    def get_tokens(self, repeat: int) -> list:
+        """get_large_program(repeat)预处理后的tokens"""
+        return task3.preprocessing_tokens(TABLE_LEXER.tokenize(get_large_program(repeat)),
+                                          _terminal_symbol_list=self.terminal_symbol_list)[0]
+
+    def parse(self, tokens: list, trace: bool | str = False,
+              context: my_sdt_action.CompilationContext | None = None) -> float:
+        """推导一次(context为None时使用新的编译状态)，返回耗时"""
+        start = time.perf_counter()
+        task3.SLR_parsing(tokens, None, self.augmented_grammar_order_list, self.nonterminal_symbol_list,
+                          self.terminal_symbol_list, self.item_set_family, self.action, self.goto, trace,
+                          _context=context, _table=self.table)
+        return time.perf_counter() - start
+
+
+def benchmark_parsing_scaling(scales: tuple[int, ...] = (1_000, 10_000, 100_000, 1_000_000)):
+    """
+    SLR推导(包括语义动作，不记录推导过程)的耗时随输入规模的变化：推导是线性的，每个token的平均耗时应该基本不变
+    :param scales: 输入的token数(近似)
+    """
+    parsing = ParsingBenchmark()
+    for scale in scales:
+        tokens = parsing.get_tokens(max(1, scale // parsing.tokens_per_repeat))
+        cost = parsing.parse(tokens)
+        print(f"[parser] SLR parsing {len(tokens)} tokens: {cost:.3f}s, {cost / len(tokens) * 1e6:.2f}us/token")
+
+
+def benchmark_symbol_records(scale: int = 10_000):
+    """
+    语义分析中文法符号记录的分配：每个归约新建的记录数(单链归约复用右部的记录)，以及__slots__记录和普通实例的大小
+    :param scale: 输入的token数(近似)
+    """
+    parsing = ParsingBenchmark()
+    tokens = parsing.get_tokens(max(1, scale // parsing.tokens_per_repeat))
+    reused_productions = {
+        index for index, (left_symbol, right_symbol_list) in enumerate(parsing.augmented_grammar_order_list)
+        if left_symbol.isidentifier() and task3.get_copy_chain_child(left_symbol, right_symbol_list) is not None}
+    reused_actions = {f"Reduce by `{left_symbol} -> {' '.join(right_symbol_list)}`"
+                      for index, (left_symbol, right_symbol_list) in enumerate(parsing.augmented_grammar_order_list)
+                      if index in reused_productions}
+    procedure = task3.SLR_parsing(tokens, None, parsing.augmented_grammar_order_list, parsing.nonterminal_symbol_list,
+                                  parsing.terminal_symbol_list, parsing.item_set_family, parsing.action, parsing.goto,
+                                  'actions')[0]
+    reduce_count = sum(row[3].startswith('Reduce by') for row in procedure)
+    reused_count = sum(row[3] in reused_actions for row in procedure)
+    print(f"[parser] {reduce_count} reductions on {len(tokens)} tokens, {reused_count} reuse the child record "
+          f"({len(reused_productions)} copy-chain productions), {reduce_count - reused_count} records allocated")
+
+    # 同样属性的普通实例(有__dict__)作为对比
+    class PlainExpr:
+        def __init__(self):
+            self.type = None
+            self.addr = None
+
+    plain = PlainExpr()
+    print(f"[parser] Symbol.Expr record: {sys.getsizeof(my_sdt_action.Symbol.Expr())}B, "
+          f"plain instance: {sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)}B")
+
+
+def benchmark_trace_levels(scale: int = 5_000):
+    """
+    各个推导过程记录级别(task3.TRACE_LEVELS)的推导耗时
+    :param scale: 输入的token数(近似)
+    """
+    parsing = ParsingBenchmark()
+    tokens = parsing.get_tokens(max(1, scale // parsing.tokens_per_repeat))
+    for trace_level in task3.TRACE_LEVELS:
+        cost = parsing.parse(tokens, trace_level)
+        print(f"[parser] trace {trace_level!r} on {len(tokens)} tokens: {cost:.3f}s, "
+              f"{cost / len(tokens) * 1e6:.2f}us/token")
+
+
+def check_trace_ring(ring_size: int = 8):
+    """
+    检查'ring'级别的推导过程(出错时才由栈的增量渲染)：每一行都和完整推导过程中的某一行按顺序对应，
+    stack、symbols、action列相同，input列是完整推导过程的input列的前缀
+    :param ring_size: 错误前后各保留的步数
+    """
+    parsing = ParsingBenchmark()
+    lines = [f"a = a + {i} * 2;\n" if i % 40 else f"a = * {i};\n" for i in range(1, 200)]  # 每40行一个语法错误
+    tokens = task3.preprocessing_tokens(TABLE_LEXER.tokenize("int main() {\nint a;\n" + ''.join(lines) + "}\n"),
+                                        _terminal_symbol_list=parsing.terminal_symbol_list)[0]
+
+    def get_procedure(trace: str | bool) -> list[list[str]]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return task3.SLR_parsing(tokens, None, parsing.augmented_grammar_order_list, parsing.nonterminal_symbol_list,
+                                     parsing.terminal_symbol_list, parsing.item_set_family, parsing.action, parsing.goto,
+                                     trace, ring_size, _table=parsing.table)[0]
+
+    full, ring = get_procedure(True), get_procedure('ring')
+    def is_same_step(full_row: list[str], row: list[str]) -> bool:
+        return (full_row[0], full_row[1], full_row[3]) == (row[0], row[1], row[3]) and \
+            full_row[2].startswith(row[2].removesuffix(' …'))
+
+    full_index = 0
+    for row in ring:
+        if row[0] == '…':
+            continue
+        while full_index < len(full) and not is_same_step(full[full_index], row):
+            full_index += 1
+        assert full_index < len(full), f"'ring'级别的推导过程中的一步不在完整的推导过程中: {row}"
+        full_index += 1
+    error_count = sum(row[3].startswith('[ERROR]') for row in full)
+    assert error_count > 0 and error_count == sum(row[3].startswith('[ERROR]') for row in ring)
+    print(f"[parser] trace 'ring' keeps {len(ring)} of {len(full)} steps around {error_count} errors")
+
+
+def benchmark_trace_sinks(scale: int = 2_000):
+    """
+    推导过程的输出方式：完整的推导过程保存在列表中(再写成csv作为对比) vs 栈的增量流式写入csv/jsonl vs 流式写入两个excel文件，
+    比较耗时、推导时的内存峰值和文件大小
+    :param scale: 输入的token数(近似)
+    """
+    parsing = ParsingBenchmark()
+    tokens = parsing.get_tokens(max(1, scale // parsing.tokens_per_repeat))
+    with tempfile.TemporaryDirectory() as output_dir:
+        def get_sinks():
+            yield 'list', True, None
+            for extension in task3.TRACE_FILE_SINKS:
+                filepath = os.path.join(output_dir, f'trace{extension}')
+                yield extension, task3.open_trace_file(filepath), filepath
+            filepaths = [os.path.join(output_dir, 'all.xlsx'), os.path.join(output_dir, 'symbol_action.xlsx')]
+            yield 'excel', task3.ExcelTraceSink({filepaths[0]: ("Stack", "Symbols", "Input", "Action"),
+                                                 filepaths[1]: ("Symbols", "Action")}), filepaths[0]
+
+        for name, trace, filepath in get_sinks():
+            tracemalloc.start()
+            start = time.perf_counter()
+            procedure = task3.SLR_parsing(tokens, None, parsing.augmented_grammar_order_list,
+                                          parsing.nonterminal_symbol_list, parsing.terminal_symbol_list,
+                                          parsing.item_set_family, parsing.action, parsing.goto, trace)[0]
+            if isinstance(trace, task3.TraceSink):
+                trace.close()
+            cost = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if filepath is None:  # 完整的推导过程写成csv，作为文件大小的对比
+                filepath = os.path.join(output_dir, 'snapshot.csv')
+                with open(filepath, 'w', encoding='utf-8', newline='') as f:
+                    csv.writer(f).writerows(procedure)
+            print(f"[parser] trace sink {name!r} on {len(tokens)} tokens: {cost:.3f}s, "
+                  f"peak {peak / 1024 / 1024:.2f}MB, file {os.path.getsize(filepath) / 1024:.1f}KB")
+
+
+def benchmark_compilation_contexts(repeats: tuple[int, ...] = (1, 2, 4, 8, 16, 32), workers: int = 4):
+    """
+    每次编译使用独立的CompilationContext：同一个进程中先后编译、以及多个线程同时编译多个程序，结果应该和单独编译时相同
+    :param repeats: 每个程序的get_large_program(repeat)的repeat
+    :param workers: 线程数
+    """
+    parsing = ParsingBenchmark()
+    programs = [parsing.get_tokens(repeat) for repeat in repeats]
+
+    def compile_program(tokens: list) -> tuple[list[str], list[str]]:
+        context = my_sdt_action.CompilationContext()
+        parsing.parse(tokens, context=context)
+        return context.result_code, context.error_list
+
+    start = time.perf_counter()
+    expected = [compile_program(tokens) for tokens in programs]
+    sequential_cost = time.perf_counter() - start
+    # 同一个进程中再编译一遍，状态不会从上一次编译中泄漏
+    assert [compile_program(tokens) for tokens in programs] == expected, "先后编译的结果不同"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(compile_program, programs))
+    threaded_cost = time.perf_counter() - start
+    assert results == expected, "多线程编译的结果不同"
+    print(f"[parser] {len(programs)} programs ({sum(map(len, programs))} tokens): "
+          f"sequential {sequential_cost:.3f}s, {workers} threads {threaded_cost:.3f}s, results identical")
+
+
+def benchmark_sdt_actions(repeat: int = 100):
+    """
+    语义动作按文法缓存：第一次生成源码并编译，之后每次编译只用新的CompilationContext调用一次工厂函数；
+    语义动作的代码不同时不能命中缓存
+    :param repeat: 命中缓存的调用次数
+    """
+    _, order_list = task3.get_augmented_grammar_to_index(my_sdt.sdt_grammar)
+    nonterminal_symbol_list = task3.get_symbol_list(my_sdt.sdt_grammar)[1]
+    task3._sdt_action_code_cache.clear()
+    start = time.perf_counter()
+    task3.compile_sdt_actions(order_list, nonterminal_symbol_list, my_sdt_action.CompilationContext())
+    miss_cost = time.perf_counter() - start
+    hit_cost = best_time(lambda: [task3.compile_sdt_actions(order_list, nonterminal_symbol_list,
+                                                            my_sdt_action.CompilationContext())
+                                  for _ in range(repeat)]) / repeat
+    assert hit_cost * 20 < miss_cost, f"语义动作缓存命中时仍然很慢: {hit_cost * 1000:.3f}ms"
+    # 修改一个语义动作后生成的函数也要改变
+    index = next(i for i, (left_symbol, _) in enumerate(order_list) if left_symbol.isidentifier())
+    left_symbol, right = order_list[index]
+    changed_right = my_sdt.SDT_right(right.rights, right.a + "\npass")
+    changed_list = order_list[:index] + [(left_symbol, changed_right)] + order_list[index + 1:]
+    actions = task3.compile_sdt_actions(changed_list, nonterminal_symbol_list, my_sdt_action.CompilationContext())
+    cached_actions = task3.compile_sdt_actions(order_list, nonterminal_symbol_list, my_sdt_action.CompilationContext())
+    assert actions[index].__code__.co_filename != cached_actions[index].__code__.co_filename, \
+        "修改语义动作后仍然使用了缓存的函数"
+    print(f"[parser] sdt actions: first compile {miss_cost * 1000:.2f}ms, cached {hit_cost * 1e6:.1f}us per compilation")
+
+
+def parse_with_table_rows(terminal_ids: list[int], action_rows: list[list[int]], goto_rows: list[list[int]],
+                          production_left: list[int], production_length: list[int], on_reduce=None) -> int | None:
+    """
+    和生成的语法分析器相同的推导循环，但是查未压缩的二维列表(get_table_rows)，用于对比查表的耗时
+    :return: None表示接受，否则为出错的token在输入中的序号
+    """
+    tag_mask, tag_bits = task3.ACTION_TAG_MASK, task3.ACTION_TAG_BITS
+    shift, reduce, accept = task3.ACTION_SHIFT, task3.ACTION_REDUCE, task3.ACTION_ACCEPT
+    stack = [0]
+    position = -1
+    for position, terminal_id in enumerate(terminal_ids):
+        if terminal_id < 0:
+            return position
+        while True:
+            code = action_rows[stack[-1]][terminal_id]
+            tag = code & tag_mask
+            if tag == shift:
+                stack.append(code >> tag_bits)
+                break
+            if tag == reduce:
+                production_id = code >> tag_bits
+                length = production_length[production_id]
+                if length:
+                    del stack[-length:]
+                stack.append(goto_rows[stack[-1]][production_left[production_id]])
+                if on_reduce is not None:
+                    on_reduce(production_id)
+                continue
+            if tag == accept:
+                return None
+            return position
+    return position + 1
+
+
+def benchmark_generated_parser(code: str, repeat: int = 3):
+    """
+    预先生成的语法分析器模块：导入耗时(有.pyc缓存时)和推导耗时，推导耗时和查未压缩的二维列表的相同推导循环对比
+    :param code: 语法正确的代码字符串
+    :param repeat: 运行次数
+    """
+    with tempfile.TemporaryDirectory() as module_dir:
+        module_filepath = os.path.join(module_dir, 'generated_parser.py')
+        task3.generate_parser_module(my_sdt.sdt_grammar, output_filepath=module_filepath)
+        py_compile.compile(module_filepath, cfile=importlib.util.cache_from_source(module_filepath))
+
+        def import_module():
+            spec = importlib.util.spec_from_file_location('generated_parser', module_filepath)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+
+        import_cost = best_time(import_module, repeat=repeat)
+        generated_parser = import_module()
+    terminal_ids = list(generated_parser.get_terminal_ids(TABLE_LEXER.tokenize(code)))
+    assert generated_parser.parse(terminal_ids) is None, "生成的语法分析器推导失败"
+    parse_cost = best_time(generated_parser.parse, terminal_ids, repeat=repeat)
+    tables = task3.load_parser_tables(my_sdt.sdt_grammar)
+    action_rows, goto_rows = task3.get_table_rows(tables['action'], tables['goto'],
+                                                  tables['nonterminal_symbol_list'], tables['terminal_symbol_list'])
+    rows_args = (action_rows, goto_rows, generated_parser.PRODUCTION_LEFT, generated_parser.PRODUCTION_LENGTH)
+    reductions, rows_reductions = [], []
+    generated_parser.parse(terminal_ids, reductions.append)
+    parse_with_table_rows(terminal_ids, *rows_args, rows_reductions.append)
+    assert reductions == rows_reductions, "压缩的分析表和二维列表的归约序列不同"
+    rows_cost = best_time(parse_with_table_rows, terminal_ids, *rows_args, repeat=repeat)
+    print(f"[parser] generated parser: import {import_cost * 1000:.2f}ms, "
+          f"parse {len(terminal_ids)} tokens {parse_cost:.3f}s, {parse_cost / len(terminal_ids) * 1e6:.2f}us/token "
+          f"(table rows {rows_cost / len(terminal_ids) * 1e6:.2f}us/token)")
+
+
+# %%
+# 主函数
+if __name__ == '__main__':
+    check_lexer_backends()
+    check_relex()
+    for parser_mode in task3.PARSER_MODES:
+        check_compressed_tables(parser_mode)
+    large_code = get_large_code()
+    benchmark_lexer_dfa(large_code)
+    benchmark_lexer_backend(large_code)
+    benchmark_token_store(large_code)
+    benchmark_token_stream(large_code)
+    benchmark_long_token_stream()
+    benchmark_relex()
+    benchmark_first_follow()
+    benchmark_parser_tables()
+    benchmark_parser_cache()
+    benchmark_compressed_tables()
+    benchmark_generated_parser(get_large_program())
+    benchmark_symbol_records()
+    check_trace_ring()
+    benchmark_trace_levels()
+    benchmark_trace_sinks()
+    benchmark_parsing_scaling()
+    benchmark_sdt_actions()
+    benchmark_compilation_contexts()
@@ -0,0 +1,401 @@
+# 词法分析器生成器
+from __future__ import annotations  # 为兼容低版本python（不支持函数类别定义），导入__future__模块
+
+import hashlib
+import marshal
+import os
+
+from task1_package import DFA, SignSet, TableLexer
+
+# 生成器版本号，修改生成算法或表格式时需要加一，使磁盘缓存失效
+GENERATOR_VERSION = 1
+# 磁盘缓存目录
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# 词法规则(正则表达式, 类型, 提示)：正则表达式的字符集写法和DFA.parse_single_regexp相同，非字母数字的字符需要转义，
+# 支持连接、|、*、+、?和括号。匹配时取最长匹配，长度相同时取靠前的规则(因此关键字要写在标识符之前)
+_string_body = r'([^\"\\\n]|\\.)*'
+_char_body = r"([^\'\\\n]|\\.)"
+_comment_body = r'([^\*]|\*[^\/])*'
+_float_body = r'(0|[1-9]\d*)\.\d*|\.\d+'  # 数字DFA中的13号状态(小数)
+_exponent = rf'([1-9]\d*|{_float_body})[eE]'  # 数字DFA中的14号状态(科学计数法的e)
+LEXER_SPEC = [
+    # whitespace
+    (r'\s+', 'whitespace', ''),
+    # command(是否在行首在匹配后再判断)
+    (r'\#.*', 'command', ''),
+    # string
+    (rf'\"{_string_body}\"', 'string', ''),
+    (rf'\"{_string_body}', 'error', '双引号不成对'),
+    (rf'\"{_string_body}\\', 'error', '转义符无内容'),
+    # char
+    (rf"\'{_char_body}\'", 'char', ''),
+    (rf"\'{_char_body}?", 'error', '单引号不成对'),
+    (r"\'\\", 'error', '转义符无内容'),
+    # keyword|identifier
+    *[(keyword, 'keyword', '') for keyword in SignSet.keyword_set],
+    (r'[a-zA-Z_]\w*', 'identifier', ''),
+    # number
+    (r'0|[1-9]\d*', 'int_dec', ''),
+    (r'0[0-7]+', 'int_oct', ''),
+    (r'0([0-7]+[89a-zA-Z_\.]|[89])[\w\.]*', 'error', '错误的八进制数'),
+    (r'0[bB]', 'error', '缺少数值的二进制数'),
+    (r'0[bB][01]+', 'int_bin', ''),
+    (r'0[bB][01]*[2-9a-zA-Z_\.][\w\.]*', 'error', '错误的二进制数'),
+    (r'0[xX]', 'error', '缺少数值的十六进制数'),
+    (r'0[xX][\da-fA-F]+', 'int_hex', ''),
+    (r'0[xX][\da-fA-F]*[g-zG-Z_\.][\w\.]*', 'error', '错误的十六进制数'),
+    (r'(0[ac-wyzAC-WYZ_]|[1-9]\d*[a-df-zA-DF-Z_])\w*', 'error', '数字开头的标识符'),
+    (_float_body, 'float', ''),
+    (_exponent, 'error', '科学计数法缺少指数'),
+    (rf'{_exponent}[\+\-]', 'error', '科学计数法缺少指数值'),
+    (rf'{_exponent}[\+\-]?\d+', 'float', ''),
+    (rf'(({_float_body})[a-df-zA-DF-Z_\.]|{_exponent}[\+\-]?\d*[a-zA-Z_\.])[\w\.]*', 'error', '带有非法字符的小数'),
+    # operator
+    (r'\.|[\?\:\,\;\(\)\[\]\{\}\~]|\+[\+\=]?|\-[\-\=\>]?|[\*\%\!\^\=]\=?|\<\<?\=?|\>\>?\=?|\&[\&\=]?|\|[\|\=]?',
+     'operator', ''),
+    (r'\\', 'error', '不在字符串中的转义字符'),
+    # comment
+    (r'\/\/.*', 'comment', ''),
+    (rf'\/\*{_comment_body}\*\/', 'comment', ''),
+    (rf'\/\*{_comment_body}\*?', 'error', '未成对的/*'),
+    (r'\/', 'operator', ''),
+]
+# 不在字符集中的字符(如中文等)单独成为一个token
+LEXER_SPEC_OTHER = ('error', '不应出现的字符(如中文等)')
+
+
+# %%
+# 解析规则中的正则表达式，得到语法树
+def parse_regexp(pattern: str) -> tuple:
+    """
+    解析正则表达式，返回语法树：('set', 字符集)、('cat', [子树])、('alt', [子树])、('star'|'plus'|'opt', 子树)
+    :param pattern: 正则表达式
+    :return: 语法树
+    """
+    index = 0
+
+    def parse_alt() -> tuple:
+        nonlocal index
+        branches = [parse_cat()]
+        while index < len(pattern) and pattern[index] == '|':
+            index += 1
+            branches.append(parse_cat())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def parse_cat() -> tuple:
+        items = []
+        while index < len(pattern) and pattern[index] not in '|)':
+            items.append(parse_repeat())
+        assert len(items) > 0, f"正则表达式中有空的分支: {pattern}"
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def parse_repeat() -> tuple:
+        nonlocal index
+        node = parse_atom()
+        while index < len(pattern) and pattern[index] in '*+?':
+            node = ({'*': 'star', '+': 'plus', '?': 'opt'}[pattern[index]], node)
+            index += 1
+        return node
+
+    def parse_atom() -> tuple:
+        nonlocal index
+        char = pattern[index]
+        if char == '(':
+            index += 1
+            node = parse_alt()
+            assert index < len(pattern) and pattern[index] == ')', f"正则表达式的括号不成对: {pattern}"
+            index += 1
+            return node
+        if char == '[':  # 字符集，找到没有被转义的]
+            end = index + 1
+            while pattern[end] != ']':
+                end += 2 if pattern[end] == '\\' else 1
+            atom = pattern[index:end + 1]
+        elif char == '\\':
+            atom = pattern[index:index + 2]
+        else:
+            assert char not in '*+?)', f"正则表达式的{char}前没有内容: {pattern}"
+            atom = char
+        index += len(atom)
+        return 'set', frozenset(DFA.parse_single_regexp(atom))
+
+    tree = parse_alt()
+    assert index == len(pattern), f"正则表达式的括号不成对: {pattern}"
+    return tree
+
+
+# %%
+# 定义NFA类
+class NFA:
+    """NFA非确定有限自动机类：Thompson构造，每个状态有若干ε边和字符集边"""
+
+    def __init__(self):
+        self.epsilon = []  # epsilon[state]为ε边的终点列表
+        self.edges = []  # edges[state]为(字符集, 终点)的列表
+        self.accept = {}  # 终态 -> 规则编号
+
+    def add_state(self) -> int:
+        self.epsilon.append([])
+        self.edges.append([])
+        return len(self.epsilon) - 1
+
+    def add_tree(self, tree: tuple) -> tuple[int, int]:
+        """按照语法树构造NFA片段，返回片段的(起点, 终点)"""
+        start, end = self.add_state(), self.add_state()
+        if tree[0] == 'set':
+            self.edges[start].append((tree[1], end))
+        elif tree[0] == 'cat':
+            current = start
+            for child in tree[1]:
+                child_start, child_end = self.add_tree(child)
+                self.epsilon[current].append(child_start)
+                current = child_end
+            self.epsilon[current].append(end)
+        elif tree[0] == 'alt':
+            for child in tree[1]:
+                child_start, child_end = self.add_tree(child)
+                self.epsilon[start].append(child_start)
+                self.epsilon[child_end].append(end)
+        else:  # star、plus、opt
+            child_start, child_end = self.add_tree(tree[1])
+            self.epsilon[start].append(child_start)
+            self.epsilon[child_end].append(end)
+            if tree[0] in ['star', 'opt']:
+                self.epsilon[start].append(end)
+            if tree[0] in ['star', 'plus']:
+                self.epsilon[child_end].append(child_start)
+        return start, end
+
+    def epsilon_closure(self, states) -> frozenset:
+        """求状态集合的ε闭包"""
+        closure = set(states)
+        stack = list(states)
+        while stack:
+            for next_state in self.epsilon[stack.pop()]:
+                if next_state not in closure:
+                    closure.add(next_state)
+                    stack.append(next_state)
+        return frozenset(closure)
+
+
+# %%
+# 划分字符类别
+def get_char_classes(char_sets: list[frozenset]) -> dict[str, int]:
+    """
+    将字符集SignSet.sign_set_all划分为字符类别：属于的字符集完全相同的字符为同一类别。
+    类别0保留给不在字符集中的字符(如中文等)
+    :param char_sets: 所有规则中出现的字符集
+    :return: 字符 -> 字符类别编号
+    """
+    signature_to_class = {}
+    char_class = {}
+    for char in sorted(SignSet.sign_set_all):
+        signature = tuple(char in char_set for char_set in char_sets)
+        if signature not in signature_to_class:
+            signature_to_class[signature] = len(signature_to_class) + 1
+        char_class[char] = signature_to_class[signature]
+    return char_class
+
+
+# 子集构造：NFA转DFA
+def subset_construction(nfa: NFA, start: int, class_count: int, rule_kind: list[int]) -> tuple[list, list]:
+    """
+    子集构造法将NFA转为DFA，DFA的状态0为初态，没有转移的地方为-1
+    :param nfa: NFA(字符集边已经转为字符类别集合)
+    :param start: NFA的初态
+    :param class_count: 字符类别数量
+    :param rule_kind: 规则编号 -> 词素种类编号
+    :return: DFA的转移表(每个状态一行)、每个状态接受的词素种类编号(-1表示不是终态)
+    """
+    start_set = nfa.epsilon_closure([start])
+    state_to_index = {start_set: 0}
+    state_list = [start_set]
+    transitions = []
+    accept = []
+    while len(transitions) < len(state_list):
+        nfa_states = state_list[len(transitions)]
+        # 接受的词素种类：取编号最小(最靠前)的规则
+        rules = [nfa.accept[state] for state in nfa_states if state in nfa.accept]
+        accept.append(rule_kind[min(rules)] if rules else -1)
+        moves = [set() for _ in range(class_count)]
+        for state in nfa_states:
+            for class_set, next_state in nfa.edges[state]:
+                for class_index in class_set:
+                    moves[class_index].add(next_state)
+        row = [-1] * class_count
+        for class_index in range(class_count):
+            if moves[class_index]:
+                next_set = nfa.epsilon_closure(moves[class_index])
+                if next_set not in state_to_index:
+                    state_to_index[next_set] = len(state_list)
+                    state_list.append(next_set)
+                row[class_index] = state_to_index[next_set]
+        transitions.append(row)
+    return transitions, accept
+
+
+# Hopcroft算法最小化DFA
+def hopcroft_minimize(transitions: list[list[int]], accept: list[int]) -> tuple[list, list]:
+    """
+    Hopcroft算法最小化DFA：初始按照接受的词素种类划分，再不断用"能转移到某个块的状态集合"细分，直到稳定
+    :param transitions: DFA的转移表(每个状态一行，状态0为初态，-1表示没有转移)
+    :param accept: 每个状态接受的词素种类编号(-1表示不是终态)
+    :return: 最小化后的转移表和接受的词素种类编号(状态0为初态，已去掉死状态)
+    """
+    class_count = len(transitions[0])
+    dead = len(transitions)  # 补一个死状态，使转移函数完整
+    complete = [[dead if next_state < 0 else next_state for next_state in row] for row in transitions]
+    complete.append([dead] * class_count)
+    labels = accept + [-1]
+    # 反向转移：inverse[class][state]为能通过class转移到state的状态列表
+    inverse = [[[] for _ in complete] for _ in range(class_count)]
+    for state, row in enumerate(complete):
+        for class_index, next_state in enumerate(row):
+            inverse[class_index][next_state].append(state)
+    # 初始划分
+    label_to_block = {}
+    for state, label in enumerate(labels):
+        label_to_block.setdefault(label, set()).add(state)
+    blocks = list(label_to_block.values())
+    block_of = [0] * len(complete)
+    for block_index, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = block_index
+    waiting = set(range(len(blocks)))
+    while waiting:
+        splitter = set(blocks[waiting.pop()])
+        for class_index in range(class_count):
+            predecessors = {state for target in splitter for state in inverse[class_index][target]}
+            touched = {}
+            for state in predecessors:
+                touched.setdefault(block_of[state], set()).add(state)
+            for block_index, inside in touched.items():
+                if len(inside) == len(blocks[block_index]):
+                    continue
+                # 细分：块中能转移到splitter的部分留在原位置，其余部分成为新块
+                outside = blocks[block_index] - inside
+                blocks[block_index] = inside
+                blocks.append(outside)
+                for state in outside:
+                    block_of[state] = len(blocks) - 1
+                if block_index in waiting:
+                    waiting.add(len(blocks) - 1)
+                else:
+                    waiting.add(block_index if len(inside) <= len(outside) else len(blocks) - 1)
+    # 按照从初态出发的访问顺序重新编号，并去掉死状态所在的块
+    dead_block = block_of[dead]
+    block_to_state = {block_of[0]: 0}
+    block_order = [block_of[0]]
+    new_transitions, new_accept = [], []
+    while len(new_transitions) < len(block_order):
+        block_index = block_order[len(new_transitions)]
+        representative = next(iter(blocks[block_index]))
+        row = []
+        for next_state in complete[representative]:
+            next_block = block_of[next_state]
+            if next_block == dead_block:
+                row.append(-1)
+                continue
+            if next_block not in block_to_state:
+                block_to_state[next_block] = len(block_order)
+                block_order.append(next_block)
+            row.append(block_to_state[next_block])
+        new_transitions.append(row)
+        new_accept.append(labels[representative])
+    return new_transitions, new_accept
+
+
+# %%
+# 词法分析器生成器
+def generate_lexer_tables(rules: list[tuple[str, str, str]], other_kind: tuple[str, str]) -> dict:
+    """
+    由词法规则生成词法分析表：正则表达式 -> NFA -> 子集构造得到DFA -> Hopcroft最小化
+    :param rules: 词法规则列表，每一项为(正则表达式, 类型, 提示)
+    :param other_kind: 不在字符集中的字符(如中文等)对应的(类型, 提示)
+    :return: 词法分析表(可以直接传给TableLexer)
+    """
+    trees = [parse_regexp(pattern) for pattern, _type, hint in rules]
+    # 收集所有字符集，划分字符类别
+    char_sets = []
+
+    def collect(tree: tuple):
+        if tree[0] == 'set':
+            if tree[1] not in char_sets:
+                char_sets.append(tree[1])
+        elif tree[0] in ['cat', 'alt']:
+            for child in tree[1]:
+                collect(child)
+        else:
+            collect(tree[1])
+
+    for tree in trees:
+        collect(tree)
+    char_class = get_char_classes(char_sets)
+    class_count = max(char_class.values()) + 1
+    # 词素种类
+    kinds = []
+    for _type, hint in [(_type, hint) for pattern, _type, hint in rules] + [other_kind]:
+        if (_type, hint) not in kinds:
+            kinds.append((_type, hint))
+    rule_kind = [kinds.index((_type, hint)) for pattern, _type, hint in rules] + [kinds.index(other_kind)]
+    # 构造NFA：新的初态通过ε边连接到每条规则的起点，最后一条规则为不在字符集中的字符(字符类别0)
+    nfa = NFA()
+    start = nfa.add_state()
+    for rule_index, tree in enumerate(trees + [('set', None)]):
+        rule_start, rule_end = nfa.add_tree(tree)
+        nfa.epsilon[start].append(rule_start)
+        nfa.accept[rule_end] = rule_index
+    for state in range(len(nfa.edges)):
+        nfa.edges[state] = [(frozenset({0}) if char_set is None else frozenset(char_class[char] for char in char_set),
+                             next_state) for char_set, next_state in nfa.edges[state]]
+    transitions, accept = subset_construction(nfa, start, class_count, rule_kind)
+    transitions, accept = hopcroft_minimize(transitions, accept)
+    return {
+        'char_class': char_class,
+        'other_class': 0,
+        'class_count': class_count,
+        'transitions': [next_state for row in transitions for next_state in row],
+        'accept': accept,
+        'kinds': kinds,
+    }
+
+
+# 获取规则的哈希值，作为缓存的键
+def get_spec_hash(rules: list[tuple[str, str, str]], other_kind: tuple[str, str]) -> str:
+    """规则、生成器版本和字符集都相同时哈希值才相同"""
+    return hashlib.sha256(
+        repr((GENERATOR_VERSION, rules, other_kind, sorted(SignSet.sign_set_all))).encode('utf-8')).hexdigest()
+
+
+def load_lexer(rules: list[tuple[str, str, str]] = None, other_kind: tuple[str, str] = None,
+               cache_dir: str = CACHE_DIR) -> TableLexer:
+    """
+    获取由规则生成的表驱动词法分析器：磁盘缓存中有对应的表时直接加载，否则生成并写入缓存
+    :param rules: 词法规则列表，默认为LEXER_SPEC
+    :param other_kind: 不在字符集中的字符对应的(类型, 提示)，默认为LEXER_SPEC_OTHER
+    :param cache_dir: 缓存目录
+    :return: 表驱动的词法分析器
+    """
+    rules = LEXER_SPEC if rules is None else rules
+    other_kind = LEXER_SPEC_OTHER if other_kind is None else other_kind
+    cache_filepath = os.path.join(cache_dir, f'lexer_{get_spec_hash(rules, other_kind)[:16]}.bin')
+    tables = None
+    if os.path.exists(cache_filepath):
+        try:
+            with open(cache_filepath, 'rb') as f:
+                tables = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):  # 缓存损坏时重新生成
+            tables = None
+    if tables is None:
+        tables = generate_lexer_tables(rules, other_kind)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_filepath + '.tmp', 'wb') as f:
+                marshal.dump(tables, f)
+            os.replace(cache_filepath + '.tmp', cache_filepath)
+        except OSError:  # 无法写入缓存时，只是下次启动需要重新生成
+            pass
+    return TableLexer(char_class=tables['char_class'], other_class=tables['other_class'],
+                      class_count=tables['class_count'], transitions=list(tables['transitions']),
+                      accept=list(tables['accept']), kinds=[tuple(kind) for kind in tables['kinds']])
@@ -3,7 +3,8 @@ class SDT_right(list):
         """
         定义一个产生式右部类
         :param rights: 产生式右部
-        :param a: 语义动作，a是一个字符串，直接exec执行，注意命名空间
+        :param a: 语义动作，a是一个字符串，编译为函数执行(见task3.compile_sdt_actions)，右部符号的值为参数，
+                  top、gen、nextinstr等为这次编译的CompilationContext的属性，其他名字在my_sdt_action中查找
         """
         # 这里删掉序号防止报错
         super().__init__([right.replace("1", "").replace("2", "").replace("3", "") for right in rights])
@@ -1,10 +1,14 @@
 # 记录id
+import ast
 import builtins
 
+import my_sdt
+
 
 class Top:
-    def __init__(self):
+    def __init__(self, context: "CompilationContext"):
         self.id_dict = {}
+        self._context = context  # 报错时使用
 
     def get_addr(self, lexeme) -> str:
         """
@@ -13,7 +17,7 @@ class Top:
         :return: id的地址addr
         """
         if self.id_dict.get(lexeme) is None:
-            error('use of undeclared id ' + lexeme)
+            self._context.error('use of undeclared id ' + lexeme)
             # 错误处理：未声明的id，默认声明一个类型为int的id
             self.put(lexeme, Symbol.Type.Type_('int'))
             return lexeme
@@ -26,7 +30,7 @@ class Top:
         :return: id的类型type
         """
         if self.id_dict.get(lexeme) is None:
-            error('use of undeclared id ' + lexeme)
+            self._context.error('use of undeclared id ' + lexeme)
             # 错误处理：未声明的id，默认声明一个类型为int的id
             self.put(lexeme, Symbol.Type.Type_('int'))
             return Symbol.Type.Type_('int')
@@ -34,7 +38,7 @@ class Top:
 
     def put(self, lexeme, type):
         if self.id_dict.get(lexeme) is not None:
-            error(lexeme + ' has been redefined')
+            self._context.error(lexeme + ' has been redefined')
             # 错误处理：重复声明的id，不再重复声明
             pass
         self.id_dict[lexeme] = (lexeme, type)
@@ -42,101 +46,11 @@ class Top:
 
 class Symbol:
     class _symbol:
-        def __init__(self):
-            pass
-
-    class Program(_symbol):
-        pass
-
-    class Decls(_symbol):
-        pass
-
-    class Decl(Decls):
-        pass
-
-    class Stmts(_symbol):
-        def __init__(self, nextlist: list[builtins.int] | None = None, breaklist: list[builtins.int] | None = None,
-                     continuelist: list[builtins.int] | None = None):
-            super().__init__()
-            self.nextlist = nextlist
-            self.breaklist = breaklist
-            self.continuelist = continuelist
-
-    class Stmt(Stmts):
-        pass
-
-    class Stmt_Open(Stmt):
-        pass
-
-    class Block(Stmt):
-        pass
-
-    class Stmt_Closed(Stmt):
-        pass
-
-    class M(_symbol):
-        def __init__(self, instr: builtins.int | None = None):
-            super().__init__()
-            self.instr = instr
-
-    class N(_symbol):
-        def __init__(self, nextlist: list[builtins.int] | None = None):
-            super().__init__()
-            self.nextlist = nextlist
-
-    class Bool(_symbol):
-        def __init__(self, truelist: list[builtins.int] | None = None, falselist: list[builtins.int] | None = None):
-            super().__init__()
-            self.truelist = truelist
-            self.falselist = falselist
-
-    class Bool_Join(Bool):
-        pass
-
-    class Bool_Unary(Bool):
-        pass
-
-    class Rel(_symbol):
-        def __init__(self, op: str | None = None):
-            super().__init__()
-            self.op = op
-
-    class L(_symbol):
-        pass
-
-    class K(_symbol):
-        pass
-
-    class Expr(_symbol):
-        def __init__(self, type: "Symbol.Type.Type_|None" = None, addr: str | None = None):
-            super().__init__()
-            self.type = type
-            self.addr = addr
-
-    class Expr_Assign(Expr):
-        pass
-
-    class Expr_Arith(Expr):
-        pass
-
-    class Expr_Term(Expr):
-        pass
+        """文法符号的属性记录的基类，子类由make_symbol_record生成(只有__slots__中的属性，没有__dict__)"""
+        __slots__ = ()
 
-    class Expr_Unary(Expr):
-        pass
-
-    class Loc(_symbol):
-        def __init__(self, array_addr: str | None = None, type: "Symbol.Type.Type_|None" = None,
-                     offset_addr: str | None = None):
-            super().__init__()
-            assert isinstance(array_addr, str) or array_addr is None
-            assert isinstance(type, Symbol.Type.Type_) or type is None
-            assert isinstance(offset_addr, str) or offset_addr is None
-            self.array_addr = array_addr
-            self.type = type
-            self.offset_addr = offset_addr
-
-    class Type(_symbol):
+    class Type:
+        # Type的记录类也由make_symbol_record生成，这里只定义类型的值Type_和Array_(生成时保留)
         class Type_:
             def __init__(self, type: str, elem_type: "Symbol.Type.Type_|None" = None,
                          width: builtins.int | None = None):
@@ -172,51 +86,52 @@ class Symbol:
                     return False
                 return self.type == other.type and self.elem_type == other.elem_type and self._num == other._num
 
-        def __init__(self, type: Type_ | None = None, width: builtins.int | None = None):
-            super().__init__()
-            self.type = type
-            self.width = width
-
-    class Basic(_symbol):
-        def __init__(self, type: "Symbol.Type.Type_|None" = None, width: builtins.int | None = None):
-            super().__init__()
-            self.type = type
-            self.width = width
-
-    class num(_symbol):
-        def __init__(self, lexval, lextype: "Symbol.Type.Type_|None" = None):
-            super().__init__()
-            self.lexval = lexval
-            self.lextype = lextype
-
-    class id(_symbol):
-        def __init__(self, lexeme):
-            super().__init__()
-            self.lexeme = lexeme
-
-
-# 记录最终的三元式
-_result_code = []
-# 记录下一个指令的位置
-nextinstr = 0
-# 记录变量
-_temp_var_list = {
-    'int': [],
-    'long': [],
-    'float': [],
-    'double': [],
-}
-# 记录id
-top = Top()
-# 记录错误
-_error_list = []
+
+# 词法单元的属性(由词法分析结果按位置构造)，非终结符的属性由SDT的语义动作求出
+TOKEN_FIELDS = {'num': ('lexval', 'lextype'), 'id': ('lexeme',)}
+
+
+def get_symbol_fields(_grammar: dict[str, list[my_sdt.SDT_right[str]]]) -> dict[str, list[str]]:
+    """
+    由SDT的语义动作(语法树)求每个文法符号的记录需要的属性：语义动作中读写过的`符号.属性`(按出现的顺序)
+    :param _grammar: SDT文法
+    :return: 文法符号 -> 属性列表
+    """
+    fields = {symbol: list(TOKEN_FIELDS.get(symbol, ())) for symbol in ['num', 'id'] + list(_grammar.keys())
+              if symbol.isidentifier()}
+    for left_symbol, rights in _grammar.items():
+        for right in rights:
+            # 语义动作中的变量名 -> 文法符号(右部的变量名带序号，例如Expr1)
+            symbol_names = {**{right.rights[i]: right[i] for i in range(len(right))}, left_symbol: left_symbol}
+            for node in ast.walk(ast.parse(right.a)):
+                if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) \
+                        and symbol_names.get(node.value.id) in fields \
+                        and node.attr not in fields[symbol_names[node.value.id]]:
+                    fields[symbol_names[node.value.id]].append(node.attr)
+    return fields
+
+
+def make_symbol_record(name: str, fields: list[str], namespace: dict | None = None) -> type:
+    """
+    生成文法符号的__slots__记录类，构造时所有属性都可以按位置或关键字传入，没有传入的属性为None
+    :param name: 文法符号
+    :param fields: 属性列表
+    :param namespace: 记录类额外的类属性
+    :return: 记录类
+    """
+    class_namespace = {**(namespace or {}), '__slots__': tuple(fields), '__module__': __name__,
+                       '__qualname__': f"Symbol.{name}"}
+    if fields:  # 没有属性时直接用object的__init__
+        init_source = f"def __init__(self, {', '.join(f'{field}=None' for field in fields)}):\n" + \
+                      ''.join(f"    self.{field} = {field}\n" for field in fields)
+        exec(init_source, {}, class_namespace)
+    return type(name, (Symbol._symbol,), class_namespace)
 
 
-def backpatch(lst, instr):
-    for i in lst:
-        assert "goto" in _result_code[i]
-        # 将goto以及后面的全部内容替换为goto instr
-        _result_code[i] = _result_code[i].split("goto")[0] + "goto " + str(instr)
+# 按my_sdt.py中的语义动作生成所有文法符号的记录类(保留原来的类中定义的嵌套类，例如Type.Type_)
+for _name, _fields in get_symbol_fields(my_sdt.sdt_grammar).items():
+    setattr(Symbol, _name, make_symbol_record(_name, _fields, {
+        key: value for key, value in vars(getattr(Symbol, _name, object)).items() if isinstance(value, type)}))
 
 
 def merge(lst1, lst2) -> list[builtins.int]:
@@ -227,78 +142,107 @@ def makelist(instr):
     return [instr]
 
 
-def gen(*symbols):
-    # 如果是break和continue生成的goto语句，标记它们的token_place，之后如果未替换，就可以追踪位置
-    if 'break' in _tmp_right or 'continue' in _tmp_right:
-        assert len(symbols) == 1
-        assert "goto_____" in symbols[0]
-        # 把位置放进goto语句里（暂时放置作为标记）
-        symbols = ("goto_____" + str(_tmp_token_place[0][0]) + "_" + str(_tmp_token_place[0][1]),)
+def array(num: int, type: Symbol.Type.Type_) -> Symbol.Type.Array_:
+    return Symbol.Type.Array_(num, type, num * type.width)
 
-    global nextinstr
-    # 转为字符串
-    symbols = [str(symbol) for symbol in symbols]
-    instr = ' '.join(symbols)
-    _result_code.append(instr)
-    nextinstr += 1
-    return nextinstr - 1
 
+# 语义动作中可以直接使用的、属于一次编译的名字(编译语义动作时绑定到CompilationContext的同名属性)
+CONTEXT_NAMES = ('top', 'backpatch', 'gen', 'newTemp', 'error', 'resultAccuracy')
+# 语义动作中可以直接读取的、会变化的编译状态(每次执行语义动作前读取)
+CONTEXT_VALUES = ('nextinstr',)
 
-def newTemp(type: str | Symbol.Type.Type_) -> str:
+
+class CompilationContext:
     """
-    生成临时变量，返回临时变量的addr
-    :param type: 临时变量的类型
-    :return: 临时变量的addr
+    一次编译(语义分析)的全部状态，推导时传给语义动作；
+    每次编译使用新的CompilationContext，多个编译可以在同一个进程中先后或者在多个线程中同时进行
     """
-    if isinstance(type, str):
-        _temp_var_list[type].append(type[0] + str(len(_temp_var_list[type])))
-        return _temp_var_list[type][-1]
-    elif isinstance(type, Symbol.Type.Type_):
-        _temp_var_list[type.type].append(type.type[0] + str(len(_temp_var_list[type.type])))
-        return _temp_var_list[type.type][-1]
-    else:
-        raise TypeError('type must be str or Symbol.Type.Type_')
-
-
-def array(num: int, type: Symbol.Type.Type_) -> Symbol.Type.Array_:
-    return Symbol.Type.Array_(num, type, num * type.width)
-
 
-# 传递正在处理的token的位置列表，便于报错
-_tmp_token_place = list()
-# 传递正在处理的产生式右部，便于报错
-_tmp_right = list()
-
-
-def error(msg):
-    # 数组头的四则运算
-    if len(_tmp_token_place) == 3 and "Expr" in _tmp_right[0] and "Expr" in _tmp_right[2]:
-        error_token_index = 1
-        error_token_place = _tmp_token_place[error_token_index]
-        _error_list.append(f'Line {error_token_place[0]}, Column {error_token_place[1]}, Error: {msg}')
-    # id相关错误，未定义、重复定义、非数组下标访问
-    elif "id" in _tmp_right and _tmp_right != ["Basic", "id", "(", ")", "Block"]:
-        error_token_index = _tmp_right.index("id")
-        error_token_place = _tmp_token_place[error_token_index]
-        _error_list.append(f'Line {error_token_place[0]}, Column {error_token_place[1]}, Error: {msg}')
-    else:
-        _error_list.append(f'Error: {msg}')
-
-
-def resultAccuracy(type1: Symbol.Type.Type_, type2: Symbol.Type.Type_) -> Symbol.Type.Type_:
-    type_priority = {'double': 3, 'float': 2, 'long': 2, 'int': 1}
-    if type1.type == 'array' or type2.type == 'array':
-        error('array type cannot be operated')
-        return Symbol.Type.Type_('double')
-    if type_priority[type1.type] > type_priority[type2.type]:
-        return type1
-    elif type_priority[type1.type] < type_priority[type2.type]:
-        return type2
-    else:
-        if type1.type == type2.type:
-            return type1
-        else:  # long float
+    def __init__(self):
+        # 记录最终的三元式
+        self.result_code = []
+        # 记录下一个指令的位置
+        self.nextinstr = 0
+        # 记录变量
+        self.temp_var_list = {
+            'int': [],
+            'long': [],
+            'float': [],
+            'double': [],
+        }
+        # 记录id
+        self.top = Top(self)
+        # 记录错误
+        self.error_list = []
+        # 传递正在处理的token的位置列表，便于报错
+        self.tmp_token_place = list()
+        # 传递正在处理的产生式右部，便于报错
+        self.tmp_right = list()
+
+    def backpatch(self, lst, instr):
+        for i in lst:
+            assert "goto" in self.result_code[i]
+            # 将goto以及后面的全部内容替换为goto instr
+            self.result_code[i] = self.result_code[i].split("goto")[0] + "goto " + str(instr)
+
+    def gen(self, *symbols):
+        # 如果是break和continue生成的goto语句，标记它们的token_place，之后如果未替换，就可以追踪位置
+        if 'break' in self.tmp_right or 'continue' in self.tmp_right:
+            assert len(symbols) == 1
+            assert "goto_____" in symbols[0]
+            # 把位置放进goto语句里（暂时放置作为标记）
+            symbols = ("goto_____" + str(self.tmp_token_place[0][0]) + "_" + str(self.tmp_token_place[0][1]),)
+
+        # 转为字符串
+        symbols = [str(symbol) for symbol in symbols]
+        instr = ' '.join(symbols)
+        self.result_code.append(instr)
+        self.nextinstr += 1
+        return self.nextinstr - 1
+
+    def newTemp(self, type: str | Symbol.Type.Type_) -> str:
+        """
+        生成临时变量，返回临时变量的addr
+        :param type: 临时变量的类型
+        :return: 临时变量的addr
+        """
+        if isinstance(type, str):
+            self.temp_var_list[type].append(type[0] + str(len(self.temp_var_list[type])))
+            return self.temp_var_list[type][-1]
+        elif isinstance(type, Symbol.Type.Type_):
+            self.temp_var_list[type.type].append(type.type[0] + str(len(self.temp_var_list[type.type])))
+            return self.temp_var_list[type.type][-1]
+        else:
+            raise TypeError('type must be str or Symbol.Type.Type_')
+
+    def error(self, msg):
+        # 数组头的四则运算
+        if len(self.tmp_token_place) == 3 and "Expr" in self.tmp_right[0] and "Expr" in self.tmp_right[2]:
+            error_token_index = 1
+            error_token_place = self.tmp_token_place[error_token_index]
+            self.error_list.append(f'Line {error_token_place[0]}, Column {error_token_place[1]}, Error: {msg}')
+        # id相关错误，未定义、重复定义、非数组下标访问
+        elif "id" in self.tmp_right and self.tmp_right != ["Basic", "id", "(", ")", "Block"]:
+            error_token_index = self.tmp_right.index("id")
+            error_token_place = self.tmp_token_place[error_token_index]
+            self.error_list.append(f'Line {error_token_place[0]}, Column {error_token_place[1]}, Error: {msg}')
+        else:
+            self.error_list.append(f'Error: {msg}')
+
+    def resultAccuracy(self, type1: Symbol.Type.Type_, type2: Symbol.Type.Type_) -> Symbol.Type.Type_:
+        type_priority = {'double': 3, 'float': 2, 'long': 2, 'int': 1}
+        if type1.type == 'array' or type2.type == 'array':
+            self.error('array type cannot be operated')
             return Symbol.Type.Type_('double')
+        if type_priority[type1.type] > type_priority[type2.type]:
+            return type1
+        elif type_priority[type1.type] < type_priority[type2.type]:
+            return type2
+        else:
+            if type1.type == type2.type:
+                return type1
+            else:  # long float
+                return Symbol.Type.Type_('double')
 
 
 # FIXME test declare
@@ -1,12 +1,22 @@
 # 词法分析器
 from __future__ import annotations  # 为兼容低版本python（不支持函数类别定义），导入__future__模块
 
+import codecs
+import io
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+from itertools import compress
+from typing import Iterable, Iterator
+
 from colorama import Fore, Style  # 导入可视化相关的库(用于改变输出字体的颜色)
 
 
 # 定义Token类
 class Token:
-    """定义Token类：包含三个信息，词法的类型，词法类型对应的颜色，词法错误的提示"""
+    """定义Token类：包含词法的类型，词法类型对应的颜色，词法错误的提示，以及token在代码中的位置(起始偏移量、行号、列号)"""
     type_to_name = {
         'whitespace': '空白符',
         'command': '预处理命令',
@@ -40,10 +50,16 @@ class Token:
         'error': Fore.RED,  # 红色
     }
 
-    def __init__(self, _type, value, hint=""):
+    __slots__ = ('type', 'value', 'hint', 'start', 'line', 'column', 'terminal')  # 不使用实例字典，减少每个token的内存
+
+    def __init__(self, _type, value, hint="", start=-1, line=-1, column=-1):
         self.type = _type
         self.value = value
         self.hint = hint
+        self.start = start  # 起始偏移量(code[start:start + len(value)])，-1表示不在代码中(如结束符$)
+        self.line = line  # 行号(从1开始)
+        self.column = column  # 列号(从1开始)
+        self.terminal = -1  # 语法分析时的终结符编号，在预处理时赋值，-1表示还没有赋值
 
     def __str__(self):
         if self.type == 'whitespace':
@@ -54,6 +70,296 @@ class Token:
             return f"<{self.type}, {self.value}>\n"
 
 
+# 定义行首位置索引
+class LineIndex:
+    """行首位置索引：一次性记录代码中每一行的起始偏移量，之后由偏移量求行号、列号只需二分查找，不需要重新扫描代码"""
+
+    def __init__(self, code: str):
+        self.line_starts = [0] + [match.end() for match in re.finditer('\n', code)]
+
+    def locate(self, offset: int) -> tuple[int, int]:
+        """由偏移量求(行号, 列号)，均从1开始"""
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+
+# 定义紧凑的token存储
+class TokenStore:
+    """
+    紧凑的token存储(按列存储)：每个token只占用数组中的一个种类编号和两个偏移量，
+    值为源代码的切片code[start:end]，只有在访问时才创建Token对象
+    """
+
+    def __init__(self, code: str, kinds: list[tuple[str, str]]):
+        """
+        :param code: 源代码
+        :param kinds: 词素种类列表，每一项为(类型, 提示)，种类编号为其下标
+        """
+        assert len(kinds) <= 256, "词素种类过多，种类编号无法用一个字节存储"
+        self.code = code
+        self.kinds = kinds
+        self.kind_codes = array('B')  # 种类编号
+        self.starts = array('q')  # 起始偏移量
+        self.ends = array('q')  # 结束偏移量(不含)
+        self._line_index = None  # 行首位置索引，第一次求行号、列号时才构造
+
+    @property
+    def line_index(self) -> LineIndex:
+        if self._line_index is None:
+            self._line_index = LineIndex(self.code)
+        return self._line_index
+
+    def append(self, kind_code: int, start: int, end: int):
+        self.kind_codes.append(kind_code)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.kind_codes)
+
+    def __getitem__(self, index: int | slice) -> Token | list[Token]:
+        if isinstance(index, slice):
+            return [self.token(i) for i in range(*index.indices(len(self)))]
+        return self.token(index if index >= 0 else index + len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.token(index)
+
+    def type(self, index: int) -> str:
+        """获取token的类型(不创建Token对象)"""
+        return self.kinds[self.kind_codes[index]][0]
+
+    def value(self, index: int) -> str:
+        """获取token的值(不创建Token对象)"""
+        return self.code[self.starts[index]:self.ends[index]]
+
+    def token(self, index: int) -> Token:
+        """创建第index个token对应的Token对象"""
+        _type, hint = self.kinds[self.kind_codes[index]]
+        start = self.starts[index]
+        return Token(_type, self.code[start:self.ends[index]], hint, start, *self.line_index.locate(start))
+
+    def exclude_types(self, types: list[str]) -> TokenStore:
+        """返回去掉了指定类型的token的新存储(只复制数组，不创建Token对象)"""
+        kept_codes = bytes(kind[0] not in types for kind in self.kinds)
+        selectors = [kept_codes[kind_code] for kind_code in self.kind_codes]
+        store = TokenStore.__new__(TokenStore)
+        store.code, store.kinds, store._line_index = self.code, self.kinds, self._line_index
+        store.kind_codes = array('B', compress(self.kind_codes, selectors))
+        store.starts = array('q', compress(self.starts, selectors))
+        store.ends = array('q', compress(self.ends, selectors))
+        return store
+
+
+# 定义token流
+class TokenStream:
+    """
+    token流：包装token列表或token生成器，支持peek(向后查看而不消耗)和advance(消耗)。
+    包装生成器时只缓冲已经查看但还没有消耗的token，已消耗的token会被丢弃
+    """
+
+    def __init__(self, tokens: list[Token] | Iterable[Token]):
+        if isinstance(tokens, list):
+            self._buffer = tokens  # 列表直接作为缓冲区
+            self._iterator = None
+        else:
+            self._buffer = []
+            self._iterator = iter(tokens)
+        self._index = 0  # 下一个token在缓冲区中的下标
+
+    def peek(self, offset: int = 0) -> Token | None:
+        """查看之后第offset个token(0为下一个token)，已经没有token时返回None"""
+        index = self._index + offset
+        while index >= len(self._buffer) and self._iterator is not None:
+            token = next(self._iterator, None)
+            if token is None:
+                self._iterator = None
+                break
+            self._buffer.append(token)
+        return self._buffer[index] if index < len(self._buffer) else None
+
+    def advance(self, count: int = 1):
+        """消耗count个token"""
+        self._index += count
+        if self._iterator is not None and self._index >= 1024 and self._index * 2 >= len(self._buffer):
+            # 丢弃已经消耗的token，使缓冲区的大小不随输入增长
+            del self._buffer[:self._index]
+            self._index = 0
+
+    def buffered(self) -> tuple[list[Token], bool]:
+        """返回已经缓冲但还没有消耗的token，以及它们是否就是剩余的全部token"""
+        return self._buffer[self._index:], self._iterator is None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise StopIteration
+        self.advance()
+        return token
+
+
+# 定义树状数组
+class FenwickTree:
+    """树状数组：单点加、求前缀和、按前缀和查找下标都只需O(log n)"""
+
+    def __init__(self, values: list[int]):
+        self.tree = [0] + values  # tree[i]为values[i - (i & -i):i]的和(下标从1开始)
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, value: int):
+        """values[index] += value"""
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += value
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """求values[0] + ... + values[index]"""
+        total = 0
+        index += 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, value: int) -> tuple[int, int]:
+        """
+        查找第一个前缀和大于value的下标(要求values均非负)
+        :return: (下标, value减去该下标之前的前缀和)
+        """
+        index, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if index + step < len(self.tree) and self.tree[index + step] <= value:
+                index += step
+                value -= self.tree[index]
+            step >>= 1
+        return index, value
+
+
+# 定义分块的token列表
+class ChunkedTokenList:
+    """
+    分块的token列表(供增量词法分析使用)：token按顺序分成若干块，每一块的token数量和
+    之后的token需要平移的偏移量、行号都记录在树状数组上(对某一块之后的所有块的平移只是一次单点加)，
+    读取某一块的token时才把还没有加上的平移量加到这一块的token上，因此一次编辑只需要修改重新扫描的token
+    """
+
+    def __init__(self, tokens: Iterable[Token] = (), chunk_size: int = 256):
+        """
+        :param tokens: token序列(需要记录了位置)
+        :param chunk_size: 每一块的token数量，一块中的token超过它的两倍时拆分
+        """
+        tokens = list(tokens)
+        self.chunk_size = chunk_size
+        self.length = len(tokens)
+        self.chunks = [tokens[i:i + chunk_size] for i in range(0, len(tokens), chunk_size)] or [[]]
+        zeros = [0] * len(self.chunks)
+        self.build(zeros, zeros, zeros, zeros)
+
+    def build(self, start_deltas: list[int], line_deltas: list[int], applied_starts: list[int], applied_lines: list[int]):
+        """
+        由每一块的平移量重新构造树状数组
+        :param start_deltas: 每一块的token的偏移量的平移量
+        :param line_deltas: 每一块的token的行号的平移量
+        :param applied_starts: 每一块的token的偏移量已经加上的平移量
+        :param applied_lines: 每一块的token的行号已经加上的平移量
+        """
+        self.counts = FenwickTree([len(chunk) for chunk in self.chunks])
+        # 平移量按差分存储，某一块的平移量为前缀和，对之后所有块的平移只需要一次单点加
+        self.start_deltas = FenwickTree([b - a for a, b in zip([0] + start_deltas, start_deltas)])
+        self.line_deltas = FenwickTree([b - a for a, b in zip([0] + line_deltas, line_deltas)])
+        self.applied_starts = list(applied_starts)
+        self.applied_lines = list(applied_lines)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def locate(self, index: int) -> tuple[int, int]:
+        """求第index个token所在的(块编号, 块内下标)，index为token数量时返回最后一块的末尾"""
+        if index >= self.length:
+            return len(self.chunks) - 1, len(self.chunks[-1])
+        return self.counts.search(index)
+
+    def flush(self, chunk_index: int) -> list[Token]:
+        """把还没有加上的平移量加到第chunk_index块的token上，返回这一块"""
+        chunk = self.chunks[chunk_index]
+        start_delta = self.start_deltas.prefix(chunk_index) - self.applied_starts[chunk_index]
+        line_delta = self.line_deltas.prefix(chunk_index) - self.applied_lines[chunk_index]
+        if start_delta or line_delta:
+            for token in chunk:
+                token.start += start_delta
+                token.line += line_delta
+            self.applied_starts[chunk_index] += start_delta
+            self.applied_lines[chunk_index] += line_delta
+        return chunk
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        chunk_index, local_index = self.counts.search(index)
+        return self.flush(chunk_index)[local_index]
+
+    def __iter__(self):
+        for chunk_index in range(len(self.chunks)):
+            yield from self.flush(chunk_index)
+
+    def span_of(self, index: int) -> tuple[int, int]:
+        """求第index个token的(起始偏移量, 结束偏移量)(只读取，不修改这一块的token)"""
+        chunk_index, local_index = self.counts.search(index)
+        token = self.chunks[chunk_index][local_index]
+        start = token.start + self.start_deltas.prefix(chunk_index) - self.applied_starts[chunk_index]
+        return start, start + len(token.value)
+
+    def replace(self, first: int, stop: int, new_tokens: list[Token], delta: int, line_delta: int):
+        """
+        将第first到第stop个(不含)token替换为new_tokens，之后的token的偏移量平移delta，行号平移line_delta
+        (只修改替换范围所在的块，之后的块只记录平移量)
+        """
+        first_chunk, first_local = self.locate(first)
+        stop_chunk, stop_local = self.locate(stop)
+        for chunk_index in range(first_chunk, stop_chunk + 1):
+            self.flush(chunk_index)
+        tail = self.chunks[stop_chunk][stop_local:]
+        if delta or line_delta:
+            for token in tail:
+                token.start += delta
+                token.line += line_delta
+        for chunk_index in range(first_chunk + 1, stop_chunk + 1):
+            self.counts.add(chunk_index, -len(self.chunks[chunk_index]))
+            self.chunks[chunk_index] = []
+        chunk = self.chunks[first_chunk][:first_local] + new_tokens + tail
+        self.counts.add(first_chunk, len(chunk) - len(self.chunks[first_chunk]))
+        self.chunks[first_chunk] = chunk
+        if stop_chunk + 1 < len(self.chunks):
+            self.start_deltas.add(stop_chunk + 1, delta)
+            self.line_deltas.add(stop_chunk + 1, line_delta)
+        self.length += len(new_tokens) - (stop - first)
+        if len(chunk) > 2 * self.chunk_size:
+            self.rebalance()
+
+    def rebalance(self):
+        """拆分过大的块、删除空块，然后重新构造树状数组(每插入或删除约chunk_size个token才需要一次)"""
+        chunks, start_deltas, line_deltas, applied_starts, applied_lines = [], [], [], [], []
+        for chunk_index, chunk in enumerate(self.chunks):
+            for i in range(0, len(chunk), self.chunk_size):
+                chunks.append(chunk[i:i + self.chunk_size])
+                start_deltas.append(self.start_deltas.prefix(chunk_index))
+                line_deltas.append(self.line_deltas.prefix(chunk_index))
+                applied_starts.append(self.applied_starts[chunk_index])
+                applied_lines.append(self.applied_lines[chunk_index])
+        self.chunks = chunks or [[]]
+        self.build(start_deltas or [0], line_deltas or [0], applied_starts or [0], applied_lines or [0])
+
+
 # 定义字符集(借鉴正则表达式的字符集)
 class SignSet:
     """定义SignSet字符集：借鉴正则表达式的字符集表示方法，定义了\s\w\d等字符集"""
@@ -99,8 +405,9 @@ class DFA:
     """DFA确定有限自动机类"""
 
     def __init__(self, *, edges: list, start: int, end: dict):
-        """输入 边(起点, 转移条件, 终点)、初态(状态编号)和终态(状态编号, 类型信息)，转为内部的数据结构(邻接表)"""
+        """输入 边(起点, 转移条件, 终点)、初态(状态编号)和终态(状态编号, 类型信息)，转为内部的数据结构(邻接表和稠密转移表)"""
         assert isinstance(edges, list)
+        edges = list(edges)  # 复制一份，不修改传入的边列表(DFA_SPEC会被多次使用)
         for i in range(len(edges)):
             edge = edges[i]
             assert isinstance(edge, tuple)
@@ -124,6 +431,24 @@ class DFA:
                 self.graph[edge[0]] = {}
             for char in edge[1]:
                 self.graph[edge[0]][char] = edge[2]
+        # 终态的类型信息预先拆分为(类型, 提示)，匹配时不再split
+        self.accept = {state: (info.split('@')[0], info.split('@')[1] if '@' in info else '')
+                       for state, info in end.items()}
+        # 稠密转移表：table[state][ord(char)]为后继状态，-1表示无后继；没有出边的状态为None
+        self.table = self.compile_table()
+
+    # 将邻接表编译为稠密转移表
+    def compile_table(self) -> list:
+        """将邻接表编译为按状态编号、字符编码(ASCII)索引的稠密转移表，匹配时只需查表"""
+        max_state = max([self.start] + list(self.end.keys()) + list(self.graph.keys()) +
+                        [next_state for row in self.graph.values() for next_state in row.values()])
+        table = [None] * (max_state + 1)
+        for state, row in self.graph.items():
+            table[state] = [-1] * 128
+            for char, next_state in row.items():
+                assert ord(char) < 128, f'字符集只支持ASCII字符: {char}'
+                table[state][ord(char)] = next_state
+        return table
 
     # 解析单元素正则表达式(即解析字符集)
     @staticmethod
@@ -189,32 +514,210 @@ class DFA:
     # 自动匹配函数
     def match(self, _code: str, _i: int, _j: int) -> (Token, int):
         """匹配字符串，返回Token实例和最后一个匹配的字符的下标"""
+        table = self.table
         state = self.start
+        row = table[state]
+        code_length = len(_code)
         # _j表示需要判断的字符的下标
-        while _j < len(_code) and state in self.graph:  # 没有后节点就停止（表示进入下一个token识别）
+        while _j < code_length and row is not None:  # 没有后节点就停止（表示进入下一个token识别）
             # 判断是否有下一步
-            if _code[_j] not in self.graph[state]:  # 通过char不能找到后继节点，停止
+            char_code = ord(_code[_j])
+            if char_code >= 128 or row[char_code] < 0:  # 通过char不能找到后继节点，停止
                 break
-            else:
-                state = self.graph[state][_code[_j]]  # 状态走一步
-                _j += 1  # 指针后移，判断下一个字符
+            state = row[char_code]  # 状态走一步
+            row = table[state]
+            _j += 1  # 指针后移，判断下一个字符
         _j -= 1
-        if state in self.end:
-            return Token(
-                self.end[state].split('@')[0],
-                _code[_i:_j + 1],
-                self.end[state].split('@')[1] if '@' in self.end[state] else ''
-            ), _j
+        if state in self.accept:
+            _type, hint = self.accept[state]
+            return Token(_type, _code[_i:_j + 1], hint), _j
         raise Exception('匹配失败')  # FIXME 之后可以改成警告
 
 
+# 各类词素的DFA定义(边、初态、终态)，用于预编译
+DFA_SPEC = {
+    # 字符串
+    'string': dict(
+        edges=[
+            (1, r'[^\"\\\n]', 1),
+            (1, r'\"', 2),
+            (1, r"\\", 3),
+            (3, r".", 1),
+        ],
+        start=1,
+        end={
+            1: 'error@双引号不成对',
+            2: 'string',
+            3: 'error@转义符无内容'
+        }
+    ),
+    # 字符
+    'char': dict(
+        edges=[
+            (1, r"[^\'\\\n]", 2),
+            (1, r"\\", 3),
+            (3, r".", 2),
+            (2, r"\'", 4),
+        ],
+        start=1,
+        end={
+            1: 'error@单引号不成对',
+            2: 'error@单引号不成对',
+            4: 'char',
+            3: 'error@转义符无内容'
+        }
+    ),
+    # 标识符(关键字在匹配后再判断)
+    'identifier': dict(
+        edges=[
+            (1, SignSet.sign_set_w, 1),
+        ],
+        start=1,
+        end={
+            1: 'identifier'
+        }
+    ),
+    # 数字(包括各种数字错误)
+    'number': dict(
+        edges=[
+            (0, r'0', 1),
+            (0, r'[1-9]', 2),
+            (0, r'\.', 3),
+            (1, r'[0-7]', 4),
+            (1, r'[89]', 5),
+            (1, r'[bB]', 6),
+            (1, r'[xX]', 9),
+            (1, r'[ac-wyzAC-WYZ_]', 12),
+            (1, r'\.', 13),
+            (2, r'\d', 2),
+            (2, r'[a-df-zA-DF-Z_]', 12),
+            (2, r'[eE]', 14),
+            (2, r'\.', 13),
+            (3, r'\d', 13),
+            (4, r'[0-7]', 4),
+            (4, r'[89a-zA-Z_\.]', 5),
+            (5, r'[\w\.]', 5),
+            (6, r'[01]', 7),
+            (6, r'[2-9a-zA-Z_\.]', 8),
+            (7, r'[01]', 7),
+            (7, r'[2-9a-zA-Z_\.]', 8),
+            (8, r'[\w\.]', 8),
+            (9, r'[\da-fA-F]', 10),
+            (9, r'[g-zG-Z_\.]', 11),
+            (10, r'[\da-fA-F]', 10),
+            (10, r'[g-zG-Z_\.]', 11),
+            (11, r'[\w\.]', 11),
+            (12, r'\w', 12),
+            (13, r'\d', 13),
+            (13, r'[eE]', 14),
+            (13, r'[a-df-zA-DF-Z_\.]', 17),
+            (14, r'[a-zA-Z_\.]', 17),
+            (14, r'[\+\-]', 15),
+            (14, r'\d', 16),
+            (15, r'[A-Za-z_\.]', 17),
+            (15, r'\d', 16),
+            (16, r'\d', 16),
+            (16, r'[a-zA-Z_\.]', 17),
+            (17, r'[\w\.]', 17)
+        ],
+        start=0,
+        end={
+            1: 'int_dec',
+            2: 'int_dec',
+            3: 'operator',
+            4: 'int_oct',
+            5: 'error@错误的八进制数',
+            6: 'error@缺少数值的二进制数',
+            7: 'int_bin',
+            8: 'error@错误的二进制数',
+            9: 'error@缺少数值的十六进制数',
+            10: 'int_hex',
+            11: 'error@错误的十六进制数',
+            12: 'error@数字开头的标识符',
+            13: 'float',
+            14: 'error@科学计数法缺少指数',
+            15: 'error@科学计数法缺少指数值',
+            16: 'float',
+            17: 'error@带有非法字符的小数'
+        }
+    ),
+    # 运算符
+    'operator': dict(
+        edges=[
+            (0, r'[\?\:\,\;\(\)\[\]\{\}\~]', 9),
+            (0, r'\+', 1),
+            (0, r'\-', 2),
+            (0, r'[\*\%\!\^\=]', 3),
+            (0, r'\<', 4),
+            (0, r'\>', 5),
+            (0, r'\&', 7),
+            (0, r'\|', 8),
+            (0, r'\\', 10),
+            (1, r'[\+\=]', 9),
+            (2, r'[\-\=\>]', 9),
+            (3, r'\=', 9),
+            (4, r'\=', 9),
+            (4, r'\<', 6),
+            (5, r'\=', 9),
+            (5, r'\>', 6),
+            (6, r'\=', 9),
+            (7, r'[\&\=]', 9),
+            (8, r'[\|\=]', 9),
+        ],
+        start=0,
+        end={
+            1: 'operator',
+            2: 'operator',
+            3: 'operator',
+            4: 'operator',
+            5: 'operator',
+            6: 'operator',
+            7: 'operator',
+            8: 'operator',
+            9: 'operator',
+            10: 'error@不在字符串中的转义字符',
+        }
+    ),
+    # 注释(单独的/为运算符)
+    'comment': dict(
+        edges=[
+            (1, r'\/', 2),
+            (1, r'\*', 3),
+            (2, r'.', 2),
+            (3, r'[^\*]', 3),
+            (3, r'\*', 4),
+            (4, r'[^\/]', 3),
+            (4, r'\/', 5),
+        ],
+        start=1,
+        end={
+            1: 'operator',
+            2: 'comment',
+            3: 'error@未成对的/*',
+            4: 'error@未成对的/*',
+            5: 'comment'
+        }
+    ),
+}
+
+# 导入模块时一次性预编译所有DFA，parse()只需查表匹配，不再为每个token重新构造DFA
+LEXER_DFA = {name: DFA(**spec) for name, spec in DFA_SPEC.items()}
+
+
 # 定义词法分析函数
 def parse(code: str) -> list:
-    """定义词法分析函数parse()：在该函数内进行词法分析，先根据词素的大类进行分支语句，然后实例化对应类别的DFA，然后用DFA类内部的匹配函数匹配(或直接用循环匹配函数匹配)"""
+    """定义词法分析函数parse()：在该函数内进行词法分析，先根据词素的大类进行分支语句，然后取出对应类别预编译好的DFA(LEXER_DFA)，用DFA类内部的匹配函数匹配(或直接用循环匹配函数匹配)"""
     token_list = []
     # i为token的起始位置, j为token的结束位置（token=code[i:j+1]）
     line_head = True  # 用于判断是否是行首（不考虑空白符）
     i, j = -1, -1
+    line_locate = LineIndex(code).locate
+
+    def add_token(token: Token):
+        # 记录token的位置，i为当前token的起始位置
+        token.start = i
+        token.line, token.column = line_locate(i)
+        token_list.append(token)
 
     while j < len(code) - 1:
         i = j + 1
@@ -224,225 +727,613 @@ def parse(code: str) -> list:
             j = loop_match(j, SignSet.sign_set_s, code)
             if '\n' in code[i:j + 1]:
                 line_head = True
-            token_list.append(Token('whitespace', code[i:j + 1]))
+            add_token(Token('whitespace', code[i:j + 1]))
             continue
         # command
         if code[j] == '#':
             j = loop_match(j, SignSet.sign_set_dot, code)
             if line_head:
-                token_list.append(Token('command', code[i:j + 1]))
+                add_token(Token('command', code[i:j + 1]))
             else:
-                token_list.append(Token('error', code[i:j + 1], 'command必须在行首'))
+                add_token(Token('error', code[i:j + 1], 'command必须在行首'))
             line_head = False
             continue
         # string
         if code[j] == '"':
             j += 1
-            fa = DFA(
-                edges=[
-                    (1, r'[^\"\\\n]', 1),
-                    (1, r'\"', 2),
-                    (1, r"\\", 3),
-                    (3, r".", 1),
-                ],
-                start=1,
-                end={
-                    1: 'error@双引号不成对',
-                    2: 'string',
-                    3: 'error@转义符无内容'
-                }
-            )
-            token, j = fa.match(code, i, j)
-            token_list.append(token)
+            token, j = LEXER_DFA['string'].match(code, i, j)
+            add_token(token)
             line_head = False
             continue
         # char
         if code[j] == "'":
             j += 1
-            fa = DFA(
-                edges=[
-                    (1, r"[^\'\\\n]", 2),
-                    (1, r"\\", 3),
-                    (3, r".", 2),
-                    (2, r"\'", 4),
-                ],
-                start=1,
-                end={
-                    1: 'error@单引号不成对',
-                    2: 'error@单引号不成对',
-                    4: 'char',
-                    3: 'error@转义符无内容'
-                }
-            )
-            token, j = fa.match(code, i, j)
-            token_list.append(token)
+            token, j = LEXER_DFA['char'].match(code, i, j)
+            add_token(token)
             line_head = False
             continue
         # identifier|keyword
         if code[j] in SignSet.sign_set_w - SignSet.sign_set_d:
             j += 1
-            fa = DFA(
-                edges=[
-                    (1, SignSet.sign_set_w, 1),
-                ],
-                start=1,
-                end={
-                    1: 'identifier'
-                }
-            )
-            token, j = fa.match(code, i, j)
+            token, j = LEXER_DFA['identifier'].match(code, i, j)
             # 判断是否是关键字
             if token.value in SignSet.keyword_set:
                 token.type = 'keyword'
-            token_list.append(token)
+            add_token(token)
             line_head = False
             continue
         # number
         if code[j] in SignSet.sign_set_d | {'.'}:
-            fa = DFA(
-                edges=[
-                    (0, r'0', 1),
-                    (0, r'[1-9]', 2),
-                    (0, r'\.', 3),
-                    (1, r'[0-7]', 4),
-                    (1, r'[89]', 5),
-                    (1, r'[bB]', 6),
-                    (1, r'[xX]', 9),
-                    (1, r'[ac-wyzAC-WYZ_]', 12),
-                    (1, r'\.', 13),
-                    (2, r'\d', 2),
-                    (2, r'[a-df-zA-DF-Z_]', 12),
-                    (2, r'[eE]', 14),
-                    (2, r'\.', 13),
-                    (3, r'\d', 13),
-                    (4, r'[0-7]', 4),
-                    (4, r'[89a-zA-Z_\.]', 5),
-                    (5, r'[\w\.]', 5),
-                    (6, r'[01]', 7),
-                    (6, r'[2-9a-zA-Z_\.]', 8),
-                    (7, r'[01]', 7),
-                    (7, r'[2-9a-zA-Z_\.]', 8),
-                    (8, r'[\w\.]', 8),
-                    (9, r'[\da-fA-F]', 10),
-                    (9, r'[g-zG-Z_\.]', 11),
-                    (10, r'[\da-fA-F]', 10),
-                    (10, r'[g-zG-Z_\.]', 11),
-                    (11, r'[\w\.]', 11),
-                    (12, r'\w', 12),
-                    (13, r'\d', 13),
-                    (13, r'[eE]', 14),
-                    (13, r'[a-df-zA-DF-Z_\.]', 17),
-                    (14, r'[a-zA-Z_\.]', 17),
-                    (14, r'[\+\-]', 15),
-                    (14, r'\d', 16),
-                    (15, r'[A-Za-z_\.]', 17),
-                    (15, r'\d', 16),
-                    (16, r'\d', 16),
-                    (16, r'[a-zA-Z_\.]', 17),
-                    (17, r'[\w\.]', 17)
-                ],
-                start=0,
-                end={
-                    1: 'int_dec',
-                    2: 'int_dec',
-                    3: 'operator',
-                    4: 'int_oct',
-                    5: 'error@错误的八进制数',
-                    6: 'error@缺少数值的二进制数',
-                    7: 'int_bin',
-                    8: 'error@错误的二进制数',
-                    9: 'error@缺少数值的十六进制数',
-                    10: 'int_hex',
-                    11: 'error@错误的十六进制数',
-                    12: 'error@数字开头的标识符',
-                    13: 'float',
-                    14: 'error@科学计数法缺少指数',
-                    15: 'error@科学计数法缺少指数值',
-                    16: 'float',
-                    17: 'error@带有非法字符的小数'
-                }
-            )
-            token, j = fa.match(code, i, j)
-            token_list.append(token)
+            token, j = LEXER_DFA['number'].match(code, i, j)
+            add_token(token)
             line_head = False
             continue
         # operator
         if code[j] in SignSet.sign_set_W - {'.', '/'} - SignSet.sign_set_s:
-            fa = DFA(
-                edges=[
-                    (0, r'[\?\:\,\;\(\)\[\]\{\}\~]', 9),
-                    (0, r'\+', 1),
-                    (0, r'\-', 2),
-                    (0, r'[\*\%\!\^\=]', 3),
-                    (0, r'\<', 4),
-                    (0, r'\>', 5),
-                    (0, r'\&', 7),
-                    (0, r'\|', 8),
-                    (0, r'\\', 10),
-                    (1, r'[\+\=]', 9),
-                    (2, r'[\-\=\>]', 9),
-                    (3, r'\=', 9),
-                    (4, r'\=', 9),
-                    (4, r'\<', 6),
-                    (5, r'\=', 9),
-                    (5, r'\>', 6),
-                    (6, r'\=', 9),
-                    (7, r'[\&\=]', 9),
-                    (8, r'[\|\=]', 9),
-                ],
-                start=0,
-                end={
-                    1: 'operator',
-                    2: 'operator',
-                    3: 'operator',
-                    4: 'operator',
-                    5: 'operator',
-                    6: 'operator',
-                    7: 'operator',
-                    8: 'operator',
-                    9: 'operator',
-                    10: 'error@不在字符串中的转义字符',
-                }
-            )
-            token, j = fa.match(code, i, j)
-            token_list.append(token)
+            token, j = LEXER_DFA['operator'].match(code, i, j)
+            add_token(token)
             line_head = False
             continue
         # comment
         if code[j] == '/':
             j += 1
-            fa = DFA(
-                edges=[
-                    (1, r'\/', 2),
-                    (1, r'\*', 3),
-                    (2, r'.', 2),
-                    (3, r'[^\*]', 3),
-                    (3, r'\*', 4),
-                    (4, r'[^\/]', 3),
-                    (4, r'\/', 5),
-                ],
-                start=1,
-                end={
-                    1: 'operator',
-                    2: 'comment',
-                    3: 'error@未成对的/*',
-                    4: 'error@未成对的/*',
-                    5: 'comment'
-                }
-            )
-            token, j = fa.match(code, i, j)
-            token_list.append(token)
+            token, j = LEXER_DFA['comment'].match(code, i, j)
+            add_token(token)
             line_head = False
             continue
         # error
         if code[j] in SignSet.sign_set_all:
             raise Exception(f'可能出现但未考虑到的字符: {code[j]}')
         else:
-            token_list.append(Token('error', code[j], '不应出现的字符(如中文等)'))
+            add_token(Token('error', code[j], '不应出现的字符(如中文等)'))
 
     return token_list
 
 
+# 定义字符类别表驱动的词法分析器：所有词素类别合并为一个状态机
+class TableLexer:
+    """
+    字符类别表驱动的词法分析器：
+    每个输入字符先通过查表映射为一个很小的整数(字符类别)，然后在合并后的状态机上查一次转移表即可走一步，
+    不再在每个token的开头做多次集合运算和集合查找
+    """
+
+    def __init__(self, *, char_class: dict, other_class: int, class_count: int, transitions: list,
+                 accept: list, kinds: list, start: int = 0):
+        """
+        :param char_class: 字符 -> 字符类别编号
+        :param other_class: 不在char_class中的字符(如中文等)的类别编号
+        :param class_count: 字符类别的数量
+        :param transitions: 扁平的转移表，transitions[state * class_count + char_class]为后继状态，-1表示无后继
+        :param accept: accept[state]为该状态接受的词素种类编号(kinds的下标)，-1表示不是终态
+        :param kinds: 词素种类列表，每一项为(类型, 提示)
+        :param start: 初态编号
+        """
+        assert len(transitions) % class_count == 0
+        assert len(accept) * class_count == len(transitions)
+        self.char_class = char_class
+        self.other_class = other_class
+        self.class_count = class_count
+        self.transitions = transitions
+        self.accept = accept
+        # 匹配后可能替换成的词素种类(行首判断、关键字判断)不一定是某个状态接受的种类，需要补充到kinds中
+        kinds = list(kinds)
+        for kind in [('keyword', ''), ('error', 'command必须在行首')]:
+            if kind not in kinds:
+                kinds.append(kind)
+        self.kinds = kinds
+        self.start = start
+        # 需要特殊处理的词素种类(空白符判断行首，预处理命令必须在行首，标识符判断是否是关键字)
+        self.whitespace_kind = kinds.index(('whitespace', '')) if ('whitespace', '') in kinds else -1
+        self.command_kind = kinds.index(('command', '')) if ('command', '') in kinds else -1
+        self.identifier_kind = kinds.index(('identifier', '')) if ('identifier', '') in kinds else -1
+        self.keyword_kind = kinds.index(('keyword', '')) if ('keyword', '') in kinds else -1
+        self.command_error_kind = \
+            kinds.index(('error', 'command必须在行首')) if ('error', 'command必须在行首') in kinds else -1
+        self.bad_char_kind = \
+            kinds.index(('error', '不应出现的字符(如中文等)')) if ('error', '不应出现的字符(如中文等)') in kinds else -1
+        self.keyword_set = frozenset(SignSet.keyword_set)
+
+    @classmethod
+    def from_dfa(cls, dfa_dict: dict[str, DFA]) -> TableLexer:
+        """
+        将parse()中按词素大类分支的空白符、预处理命令、各个DFA、非法字符合并为一个状态机。
+        新的初态按照parse()中的分支顺序转移到各个子DFA中(已经读入首字符后的状态)，
+        然后按照"各状态下转移结果都相同的字符"划分字符类别
+        :param dfa_dict: 各词素大类预编译好的DFA(LEXER_DFA)
+        :return: 表驱动的词法分析器
+        """
+        kinds = []
+        graph = [{}]  # graph[state][char] = next_state，0号状态为新的初态
+        accept = [-1]
+
+        def add_kind(kind: tuple[str, str]) -> int:
+            if kind not in kinds:
+                kinds.append(kind)
+            return kinds.index(kind)
+
+        def add_state(kind: tuple[str, str] | None) -> int:
+            graph.append({})
+            accept.append(-1 if kind is None else add_kind(kind))
+            return len(graph) - 1
+
+        def add_dfa(dfa: DFA) -> dict[int, int]:
+            state_map = {}
+            states = {dfa.start} | set(dfa.accept) | set(dfa.graph) | \
+                     {next_state for row in dfa.graph.values() for next_state in row.values()}
+            for state in sorted(states):
+                state_map[state] = add_state(dfa.accept.get(state))
+            for state, row in dfa.graph.items():
+                for char, next_state in row.items():
+                    graph[state_map[state]][char] = state_map[next_state]
+            return state_map
+
+        def add_entry(chars: set, targets: callable):
+            # 按分支顺序添加初态的转移，先添加的分支优先
+            for char in chars:
+                if char not in graph[0]:
+                    graph[0][char] = targets(char)
+
+        # whitespace
+        whitespace = add_state(('whitespace', ''))
+        for char in SignSet.sign_set_s:
+            graph[whitespace][char] = whitespace
+        add_entry(SignSet.sign_set_s, lambda char: whitespace)
+        # command
+        command = add_state(('command', ''))
+        for char in SignSet.sign_set_dot:
+            graph[command][char] = command
+        add_entry({'#'}, lambda char: command)
+        add_kind(('error', 'command必须在行首'))
+        # string、char、identifier|keyword：首字符已经读入，从DFA的初态开始匹配
+        for name, first_chars in [('string', {'"'}), ('char', {"'"}),
+                                  ('identifier', SignSet.sign_set_w - SignSet.sign_set_d)]:
+            state_map = add_dfa(dfa_dict[name])
+            add_entry(first_chars, lambda char: state_map[dfa_dict[name].start])
+        add_kind(('keyword', ''))
+        # number、operator：首字符由DFA的初态转移
+        for name, first_chars in [('number', SignSet.sign_set_d | {'.'}),
+                                  ('operator', SignSet.sign_set_W - {'.', '/'} - SignSet.sign_set_s)]:
+            state_map = add_dfa(dfa_dict[name])
+            start_row = dfa_dict[name].graph.get(dfa_dict[name].start, {})
+            add_entry({char for char in first_chars if char in start_row},
+                      lambda char: state_map[start_row[char]])
+        # comment：首字符已经读入
+        state_map = add_dfa(dfa_dict['comment'])
+        add_entry({'/'}, lambda char: state_map[dfa_dict['comment'].start])
+        # error：不在字符集中的字符(如中文等)，单独成为一个错误token
+        bad_char = add_state(('error', '不应出现的字符(如中文等)'))
+
+        # 划分字符类别：对每个ASCII字符，所有状态下的转移结果相同的字符属于同一类别
+        # 不在字符集中的字符(包括非ASCII字符)只能从初态转移到bad_char
+        other_signature = tuple([bad_char] + [-1] * (len(graph) - 1))
+        signature_to_class = {other_signature: 0}
+        char_class = {}
+        for char_code in range(128):
+            char = chr(char_code)
+            if char in SignSet.sign_set_all:
+                signature = tuple(row.get(char, -1) for row in graph)
+            else:
+                signature = other_signature
+            if signature not in signature_to_class:
+                signature_to_class[signature] = len(signature_to_class)
+            char_class[char] = signature_to_class[signature]
+        class_count = len(signature_to_class)
+        transitions = [-1] * (len(graph) * class_count)
+        for signature, class_index in signature_to_class.items():
+            for state, next_state in enumerate(signature):
+                transitions[state * class_count + class_index] = next_state
+        return cls(char_class=char_class, other_class=0, class_count=class_count, transitions=transitions,
+                   accept=accept, kinds=kinds)
+
+    def parse(self, code: str) -> list:
+        """
+        表驱动的词法分析，返回Token对象的列表
+        :param code: 代码字符串
+        :return: token列表，和parse(code)的结果相同
+        """
+        return list(self.tokenize(code))
+
+    def tokenize(self, code: str) -> TokenStore:
+        """
+        表驱动的词法分析：每个字符只做一次字符类别查表和一次转移表查表，最长匹配到没有后继状态为止。
+        结果只记录种类编号和偏移量，不创建Token对象
+        :param code: 代码字符串
+        :return: 紧凑的token存储
+        """
+        store = TokenStore(code, self.kinds)
+        self.scan(code, store)
+        return store
+
+    def scan(self, code: str, store: TokenStore, line_head: bool = True,
+             final: bool = True) -> tuple[int, bool, int]:
+        """
+        扫描code，将token追加到store中
+        :param code: 代码字符串
+        :param store: token存储
+        :param line_head: 扫描开始时是否是行首（不考虑空白符）
+        :param final: code之后是否已经没有内容。为False时，延伸到code末尾的token可能还没有结束，不扫描它
+        :return: (扫描停止的位置, 停止时是否是行首, 没有结束的token读到code末尾时的状态(没有这样的token时为-1))，
+                 之后可以用advance从这个状态继续读入后面的内容，不需要从token的开头重新扫描
+        """
+        kind_codes_append, starts_append, ends_append = store.kind_codes.append, store.starts.append, store.ends.append
+        char_class_get = self.char_class.get
+        other_class = self.other_class
+        class_count = self.class_count
+        transitions = self.transitions
+        accept = self.accept
+        whitespace_kind, command_kind, identifier_kind = self.whitespace_kind, self.command_kind, self.identifier_kind
+        keyword_kind, command_error_kind, bad_char_kind = self.keyword_kind, self.command_error_kind, self.bad_char_kind
+        keyword_set = self.keyword_set
+        start_row = self.start * class_count
+        code_length = len(code)
+        # i为token的起始位置, j为token的结束位置的下一个位置（token=code[i:j]）
+        i = 0
+        while i < code_length:
+            row = start_row
+            j = i
+            while j < code_length:
+                next_state = transitions[row + char_class_get(code[j], other_class)]
+                if next_state < 0:
+                    break
+                row = next_state * class_count
+                j += 1
+            if j == code_length and not final:
+                return i, line_head, row // class_count  # token可能跨越边界，留到之后和后面的内容一起扫描
+            kind = accept[row // class_count]
+            if kind < 0:
+                if j == i:
+                    raise Exception(f'可能出现但未考虑到的字符: {code[i]}')
+                # 停在非终态时回退到最后一次经过的终态(只有生成的状态机可能出现)
+                kind, j = self.backtrack(code, i, j)
+            if kind == whitespace_kind:
+                if code.find('\n', i, j) >= 0:
+                    line_head = True
+            elif kind == command_kind:
+                if not line_head:
+                    kind = command_error_kind
+                line_head = False
+            elif kind == identifier_kind:
+                # 判断是否是关键字
+                if code[i:j] in keyword_set:
+                    kind = keyword_kind
+                line_head = False
+            elif kind != bad_char_kind:
+                line_head = False
+            kind_codes_append(kind)
+            starts_append(i)
+            ends_append(j)
+            i = j
+        return i, line_head, -1
+
+    def advance(self, state: int, code: str) -> tuple[int, int]:
+        """
+        从state继续读入code，直到没有后继状态(token在这里结束)或者读完code
+        :param state: 开始时的状态(scan返回的没有结束的token的状态)
+        :param code: 后面的内容
+        :return: (停止时的状态, 停止的位置)，停止的位置为len(code)时token还可能没有结束
+        """
+        char_class_get = self.char_class.get
+        other_class = self.other_class
+        class_count = self.class_count
+        transitions = self.transitions
+        row = state * class_count
+        j = 0
+        code_length = len(code)
+        while j < code_length:
+            next_state = transitions[row + char_class_get(code[j], other_class)]
+            if next_state < 0:
+                break
+            row = next_state * class_count
+            j += 1
+        return row // class_count, j
+
+    def stream(self, file_path: str, window_size: int = 1 << 16) -> Iterator[Token]:
+        """
+        流式词法分析：用mmap映射文件，每次只解码一个窗口，边扫描边产生token，内存占用和文件大小无关(除了token本身)。
+        跨越窗口边界的token(如块注释、字符串)从scan停止时的状态继续读入之后的窗口(advance)，各个窗口的内容先放在列表中，
+        token结束后才拼接起来扫描一次，因此很长的token也只是线性的代价；行首状态、行号跨窗口保持
+        :param file_path: 文件路径(UTF-8编码)
+        :param window_size: 窗口大小(字节)
+        :return: token生成器，结果和tokenize(文件内容)相同
+        """
+        # 和以文本模式读取文件一样，将\r\n和\r转为\n(跨越窗口的\r\n也能正确处理)
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+        kinds = self.kinds
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size == 0:  # mmap不能映射空文件
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                pending = []  # 跨越窗口、还没有结束的token：从token开头起的各段内容
+                pending_state = -1  # 没有结束的token读到目前为止的状态
+                base = 0  # code[0]在整个文件中的偏移量(字符)
+                line, line_start = 1, 0  # 当前行号，当前行首的偏移量(字符)
+                line_head = True
+                for window_start in range(0, file_size, window_size):
+                    final = window_start + window_size >= file_size
+                    code = decoder.decode(source[window_start:window_start + window_size], final=final)
+                    if pending:
+                        pending_state, stop = self.advance(pending_state, code)
+                        pending.append(code)
+                        if stop == len(code) and not final:
+                            continue  # token还没有结束，只保存这个窗口的内容
+                        code = ''.join(pending)  # token结束了，拼接一次后和窗口的剩余内容一起扫描
+                        pending = []
+                    store = TokenStore(code, kinds)
+                    end, line_head, pending_state = self.scan(code, store, line_head, final)
+                    for kind_code, start, stop in zip(store.kind_codes, store.starts, store.ends):
+                        _type, hint = kinds[kind_code]
+                        value = code[start:stop]
+                        yield Token(_type, value, hint, base + start, line, base + start - line_start + 1)
+                        newline_count = value.count('\n')
+                        if newline_count:
+                            line += newline_count
+                            line_start = base + start + value.rfind('\n') + 1
+                    if end < len(code):
+                        pending = [code[end:]]
+                    base += end
+
+    def line_head_before(self, tokens: list[Token] | ChunkedTokenList, index: int) -> bool:
+        """tokens[index]之前是否是行首（不考虑空白符），和扫描时的行首状态相同"""
+        for k in range(index - 1, -1, -1):
+            token = tokens[k]
+            if token.type == 'whitespace':
+                if '\n' in token.value:
+                    return True
+            elif not (token.type == 'error' and token.hint == '不应出现的字符(如中文等)'):
+                return False
+        return True
+
+    def relex(self, tokens: list[Token] | ChunkedTokenList, code: str, edit: tuple[int, int, str]) -> ChunkedTokenList:
+        """
+        增量词法分析：代码被编辑后，只重新扫描编辑位置附近的token，其余token只平移位置。
+        从编辑位置之前最后一个安全的token边界开始扫描(最长匹配只会向后多看一个字符，因此结束位置在编辑位置之前的token不受影响)，
+        直到新token的边界和行首状态与编辑位置之后的某个旧token重合(重新同步)，然后把新token拼接进去。
+        之后的旧token的平移记录在ChunkedTokenList的块上，因此耗时只和编辑影响的范围有关，和文件大小无关
+        :param tokens: 编辑前的token列表(需要记录了位置)，ChunkedTokenList会被原地修改，列表只在第一次编辑时转换一次
+        :param code: 编辑后的代码
+        :param edit: 编辑操作(偏移量, 删除的长度, 插入的内容)，偏移量为编辑前代码中的位置
+        :return: 编辑后的token列表，和重新分析整个code的结果相同
+        """
+        if not isinstance(tokens, ChunkedTokenList):
+            tokens = ChunkedTokenList(tokens)
+        offset, deleted_length, inserted_text = edit
+        delta = len(inserted_text) - deleted_length
+        old_edit_end = offset + deleted_length  # 编辑范围在旧代码中的结束位置
+        # 二分查找第一个结束位置>=offset的token，从它开始重新扫描
+        low, high = 0, len(tokens)
+        while low < high:
+            middle = (low + high) // 2
+            if tokens.span_of(middle)[1] < offset:
+                low = middle + 1
+            else:
+                high = middle
+        first = low if low < len(tokens) else 0  # 没有这样的token时(如tokens为空)从头扫描
+        if first < len(tokens):
+            scan_start, line, column = tokens[first].start, tokens[first].line, tokens[first].column
+        else:
+            scan_start, line, column = 0, 1, 1
+        line_start = scan_start - column + 1  # 当前行首的偏移量
+        line_head = self.line_head_before(tokens, first)
+        # 第一个可能重新同步的旧token：起始位置在编辑范围之后
+        low, high = first, len(tokens)
+        while low < high:
+            middle = (low + high) // 2
+            if tokens.span_of(middle)[0] < old_edit_end:
+                low = middle + 1
+            else:
+                high = middle
+        old_index = low
+        new_tokens = []
+        kinds = self.kinds
+        position = scan_start
+        window_size = 256
+        while position < len(code):
+            # 分块扫描，块越来越大，通常第一块内就能重新同步
+            final = position + window_size >= len(code)
+            chunk = code[position:position + window_size]
+            store = TokenStore(chunk, kinds)
+            end, _, _ = self.scan(chunk, store, line_head, final)
+            for kind_code, start, stop in zip(store.kind_codes, store.starts, store.ends):
+                start += position
+                # 检查是否重新同步：新token的起始位置和旧token平移后的起始位置相同，且行首状态相同
+                while old_index < len(tokens) and tokens.span_of(old_index)[0] + delta < start:
+                    old_index += 1
+                if old_index < len(tokens) and tokens.span_of(old_index)[0] + delta == start and \
+                        line_head == self.line_head_before(tokens, old_index):
+                    return self.splice(tokens, first, old_index, new_tokens, delta, line, start - line_start + 1)
+                _type, hint = kinds[kind_code]
+                value = chunk[start - position:stop]
+                new_tokens.append(Token(_type, value, hint, start, line, start - line_start + 1))
+                newline_count = value.count('\n')
+                if newline_count:
+                    line += newline_count
+                    line_start = start + value.rfind('\n') + 1
+                # 扫描时的行首状态只在token之间变化，这里按照scan的规则跟踪
+                if _type == 'whitespace':
+                    if newline_count:
+                        line_head = True
+                elif not (_type == 'error' and hint == '不应出现的字符(如中文等)'):
+                    line_head = False
+            position += end
+            window_size *= 2
+        # 扫描到代码末尾都没有重新同步，编辑位置之后的旧token全部被替换
+        tokens.replace(first, len(tokens), new_tokens, 0, 0)
+        return tokens
+
+    @staticmethod
+    def splice(tokens: ChunkedTokenList, first: int, old_index: int, new_tokens: list[Token],
+               delta: int, line: int, column: int) -> ChunkedTokenList:
+        """
+        将tokens[first:old_index]替换为new_tokens，并平移之后的旧token的位置
+        (只修改和同步位置在同一行的token的列号，偏移量和行号的平移由tokens记录在块上)
+        :param line: tokens[old_index]在新代码中的行号
+        :param column: tokens[old_index]在新代码中的列号
+        """
+        line_delta = 0
+        if old_index < len(tokens):
+            sync_token = tokens[old_index]
+            line_delta, column_delta, sync_line = line - sync_token.line, column - sync_token.column, sync_token.line
+            # 和同步位置在同一行的token，列号也要平移
+            index = old_index
+            while index < len(tokens) and tokens[index].line == sync_line:
+                tokens[index].column += column_delta
+                index += 1
+        tokens.replace(first, old_index, new_tokens, delta, line_delta)
+        return tokens
+
+    def backtrack(self, code: str, i: int, j: int) -> tuple[int, int]:
+        """
+        从code[i]重新匹配到code[j]，返回最后一次经过的终态接受的词素种类和对应的结束位置
+        :param code: 代码字符串
+        :param i: token的起始位置
+        :param j: 最长匹配停止的位置
+        :return: (词素种类编号, token的结束位置的下一个位置)
+        """
+        state = self.start
+        last_kind, last_j = -1, i
+        for k in range(i, j):
+            state = self.transitions[state * self.class_count + self.char_class.get(code[k], self.other_class)]
+            if self.accept[state] >= 0:
+                last_kind, last_j = self.accept[state], k + 1
+        if last_kind < 0:
+            raise Exception('匹配失败')  # FIXME 之后可以改成警告
+        return last_kind, last_j
+
+
+# 导入模块时一次性构造合并后的状态机
+TABLE_LEXER = TableLexer.from_dfa(LEXER_DFA)
+
+
+# 将字符集转为正则表达式的字符类
+def regexp_class(sign_set: set, negative: bool = False) -> str:
+    """将字符集转为正则表达式的字符类(全部转义)，如{'a', '-'}转为[\\-a]，negative为True时转为[^...]"""
+    return ('[^' if negative else '[') + ''.join(re.escape(char) for char in sorted(sign_set)) + ']'
+
+
+# 定义re词法分析器的规则(和各个DFA的终态一一对应)
+def get_re_lexer_rules() -> list[tuple[str, str, str]]:
+    """
+    获取re词法分析器的规则列表，每一项为(正则表达式, 类型, 提示)。
+    每条规则的正则表达式恰好匹配到达DFA某个终态的字符串，再用否定的向前查找保证该终态无法继续转移，
+    因此任意位置至多只有一条规则能匹配，且匹配长度和DFA的最长匹配相同，规则的顺序不影响结果。
+    字符类全部由SignSet生成，不使用\\d\\w\\s(它们在re中会匹配Unicode字符)
+    """
+    all_ = SignSet.sign_set_all
+    dot = regexp_class(SignSet.sign_set_dot)
+    w = regexp_class(SignSet.sign_set_w)
+    w_dot = regexp_class(SignSet.sign_set_w | {'.'})
+    # 数字DFA中，13号状态(小数)和14号状态(科学计数法的e)之前的部分
+    p13 = r'(?:(?:0|[1-9][0-9]*)\.[0-9]*|\.[0-9]+)'
+    p14 = rf'(?:[1-9][0-9]*|{p13})[eE]'
+    # 字符串、字符、注释的循环体
+    string_body = rf'(?:{regexp_class(all_ - {chr(34), chr(92), chr(10)})}|\\{dot})*'
+    char_body = rf'(?:{regexp_class(all_ - {chr(39), chr(92), chr(10)})}|\\{dot})'
+    comment_body = rf'(?:{regexp_class(all_ - {"*"})}|\*{regexp_class(all_ - {"/"})})*'
+    return [
+        # whitespace
+        (rf'{regexp_class(SignSet.sign_set_s)}+', 'whitespace', ''),
+        # identifier|keyword(关键字在匹配后再判断)
+        (rf'{regexp_class(SignSet.sign_set_w - SignSet.sign_set_d)}{w}*', 'identifier', ''),
+        # operator
+        (r'<(?:<=?|=)?|>(?:>=?|=)?|\+[+=]?|-[-=>]?|[*%!^=]=?|&[&=]?|\|[|=]?|[?:,;()\[\]{}~]', 'operator', ''),
+        (r'\\', 'error', '不在字符串中的转义字符'),
+        # number
+        (rf'0[xX][0-9a-fA-F]+(?!{w_dot})', 'int_hex', ''),
+        (rf'0[xX][0-9a-fA-F]*[g-zG-Z_.]{w_dot}*', 'error', '错误的十六进制数'),
+        (rf'0[xX](?!{w_dot})', 'error', '缺少数值的十六进制数'),
+        (rf'0[bB][01]+(?!{w_dot})', 'int_bin', ''),
+        (rf'0[bB][01]*[2-9a-zA-Z_.]{w_dot}*', 'error', '错误的二进制数'),
+        (rf'0[bB](?!{w_dot})', 'error', '缺少数值的二进制数'),
+        (rf'0[0-7]+(?!{w_dot})', 'int_oct', ''),
+        (rf'0(?:[0-7]+[89a-zA-Z_.]|[89]){w_dot}*', 'error', '错误的八进制数'),
+        (rf'(?:0[ac-wyzAC-WYZ_]|[1-9][0-9]*[a-df-zA-DF-Z_]){w}*', 'error', '数字开头的标识符'),
+        (rf'{p14}[+\-]?[0-9]+(?!{w_dot})', 'float', ''),
+        (rf'{p14}[+\-](?!{w_dot})', 'error', '科学计数法缺少指数值'),
+        (rf'{p14}(?![0-9a-zA-Z_.+\-])', 'error', '科学计数法缺少指数'),
+        (rf'(?:{p13}[a-df-zA-DF-Z_.]|{p14}[+\-]?[0-9]*[a-zA-Z_.]){w_dot}*', 'error', '带有非法字符的小数'),
+        (rf'{p13}(?!{w_dot})', 'float', ''),
+        (rf'(?:0|[1-9][0-9]*)(?!{w_dot})', 'int_dec', ''),
+        (r'\.(?![0-9])', 'operator', ''),
+        # comment
+        (rf'//{dot}*', 'comment', ''),
+        (rf'/\*{comment_body}\*/', 'comment', ''),
+        (rf'/\*{comment_body}\*?(?!{regexp_class(all_)})', 'error', '未成对的/*'),
+        (r'/(?![/*])', 'operator', ''),
+        # string
+        (rf'"{string_body}"', 'string', ''),
+        (rf'"{string_body}\\(?!{dot})', 'error', '转义符无内容'),
+        (rf'"{string_body}(?!{dot})', 'error', '双引号不成对'),
+        # char
+        (rf"'{char_body}'", 'char', ''),
+        (rf"'{char_body}(?!')", 'error', '单引号不成对'),
+        (rf"'\\(?!{dot})", 'error', '转义符无内容'),
+        (rf"'(?!{regexp_class(all_ - {chr(39), chr(10)})})", 'error', '单引号不成对'),
+        # command(是否在行首在匹配后再判断)
+        (rf'#{dot}*', 'command', ''),
+        # error：不在字符集中的字符(如中文等)
+        (regexp_class(all_, negative=True), 'error', '不应出现的字符(如中文等)'),
+    ]
+
+
+# 定义re词法分析器：所有规则合并为一个正则表达式，由re模块(C实现)完成扫描
+class RegexLexer:
+    """re词法分析器：将所有规则合并为一个带分组的正则表达式，使用finditer扫描，每个分组对应一条规则"""
+
+    def __init__(self, rules: list[tuple[str, str, str]]):
+        """
+        :param rules: 规则列表，每一项为(正则表达式, 类型, 提示)，正则表达式中只能使用非捕获分组
+        """
+        for pattern, _type, hint in rules:
+            assert re.compile(pattern).groups == 0, f"规则中只能使用非捕获分组: {pattern}"
+        self.rules = rules
+        # 最后一个分组匹配任意字符，说明出现了没有规则能匹配的字符
+        self.pattern = re.compile('|'.join(f'({pattern})' for pattern, _type, hint in rules) + r'|([\s\S])')
+        self.kinds = [None] + [(_type, hint) for pattern, _type, hint in rules]  # 分组编号从1开始
+        self.keyword_set = frozenset(SignSet.keyword_set)
+
+    def parse(self, code: str) -> list:
+        """
+        使用合并后的正则表达式进行词法分析
+        :param code: 代码字符串
+        :return: token列表，和parse(code)的结果相同
+        """
+        token_list = []
+        kinds = self.kinds
+        unknown_index = len(kinds)
+        keyword_set = self.keyword_set
+        line_locate = LineIndex(code).locate
+        line_head = True  # 用于判断是否是行首（不考虑空白符）
+        for match in self.pattern.finditer(code):
+            index = match.lastindex
+            if index == unknown_index:
+                raise Exception(f'可能出现但未考虑到的字符: {match.group()}')
+            _type, hint = kinds[index]
+            value = match.group()
+            if _type == 'whitespace':
+                if '\n' in value:
+                    line_head = True
+            elif _type == 'command':
+                if not line_head:
+                    _type, hint = 'error', 'command必须在行首'
+                line_head = False
+            elif _type == 'identifier':
+                # 判断是否是关键字
+                if value in keyword_set:
+                    _type = 'keyword'
+                line_head = False
+            elif hint != '不应出现的字符(如中文等)':
+                line_head = False
+            start = match.start()
+            token_list.append(Token(_type, value, hint, start, *line_locate(start)))
+        return token_list
+
+
+# 导入模块时一次性编译合并后的正则表达式
+REGEX_LEXER = RegexLexer(get_re_lexer_rules())
+
+
 # 定义符号表输出函数
 def print_token_list(token_list, path=None):
     """根据对应词素类别来输出，内部隐式使用Token的__str__()函数，可以将whitespace类型转为空字符串(不输出)，error类型可以输出错误信息"""
@@ -480,11 +1371,72 @@ def show_token_list(token_list):
         print(Token.type_to_color[token.type] + str(token.value) + Style.RESET_ALL, end='')
 
 
-def get_token(sample_filepath: str):
-    """获取token列表的函数，输入为样例文件的路径，输出为token列表"""
+# 可选的词法分析实现，结果完全相同
+LEXER_BACKEND = {
+    'dfa': parse,  # 按词素大类分支 + 各类别的DFA匹配
+    'table': TABLE_LEXER.parse,  # 字符类别表驱动的合并状态机
+    're': REGEX_LEXER.parse,  # 合并的正则表达式(re模块)
+    'generated': lambda code: get_generated_lexer().parse(code),  # 由词法规则生成的最小化DFA(lexer_generator)
+}
+
+
+# 由词法规则生成的词法分析器，第一次使用时从磁盘缓存加载(或生成)
+_generated_lexer = None
+
+
+def get_generated_lexer() -> TableLexer:
+    """获取由lexer_generator.LEXER_SPEC生成的表驱动词法分析器(lexer_generator依赖本模块，因此延迟导入)"""
+    global _generated_lexer
+    if _generated_lexer is None:
+        import lexer_generator
+        _generated_lexer = lexer_generator.load_lexer()
+    return _generated_lexer
+
+
+# 差分检查各个词法分析实现
+def check_backend_equivalence(code: str, backends: list[str] | None = None):
+    """
+    差分检查：用各个词法分析实现分析同一段代码，token序列(类型, 值, 提示, 起始偏移量, 行号, 列号)必须和'dfa'实现完全相同，否则抛出断言异常
+    :param code: 代码字符串
+    :param backends: 要检查的实现(LEXER_BACKEND中的键)，默认检查全部
+    """
+    expected = [(token.type, token.value, token.hint, token.start, token.line, token.column) for token in parse(code)]
+    for backend in backends if backends is not None else LEXER_BACKEND:
+        actual = [(token.type, token.value, token.hint, token.start, token.line, token.column)
+                  for token in LEXER_BACKEND[backend](code)]
+        if actual != expected:
+            index = next((i for i in range(min(len(actual), len(expected))) if actual[i] != expected[i]),
+                         min(len(actual), len(expected)))
+            raise AssertionError(
+                f"词法分析实现{backend!r}的结果不同: 第{index}个token, "
+                f"期望{expected[index] if index < len(expected) else None}, "
+                f"实际{actual[index] if index < len(actual) else None}, 代码: {code!r}")
+
+
+def get_token_store(sample_filepath: str, lexer: TableLexer = TABLE_LEXER) -> TokenStore:
+    """获取紧凑的token存储的函数，输入为样例文件的路径和表驱动的词法分析器，输出为TokenStore(按需创建Token对象)"""
+    with open(f'{sample_filepath}', 'r', encoding='utf-8') as f:
+        code = f.read()
+    return lexer.tokenize(code)
+
+
+def get_token_stream(sample_filepath: str, lexer: TableLexer = TABLE_LEXER, window_size: int = 1 << 16) -> TokenStream:
+    """获取token流的函数，输入为样例文件的路径和表驱动的词法分析器，输出为TokenStream(边读取文件边词法分析)"""
+    return TokenStream(lexer.stream(sample_filepath, window_size))
+
+
+def relex(tokens: list[Token] | ChunkedTokenList, code: str, edit: tuple[int, int, str],
+          lexer: TableLexer = TABLE_LEXER) -> ChunkedTokenList:
+    """增量词法分析的函数，输入为编辑前的token列表、编辑后的代码、编辑操作(偏移量, 删除的长度, 插入的内容)，输出为编辑后的token列表"""
+    return lexer.relex(tokens, code, edit)
+
+
+def get_token(sample_filepath: str, backend: str = 'dfa'):
+    """获取token列表的函数，输入为样例文件的路径和词法分析实现(LEXER_BACKEND中的键)，输出为token列表"""
+    assert backend in LEXER_BACKEND, f"未知的词法分析实现: {backend}"
     # 读取代码
     with open(f'{sample_filepath}', 'r', encoding='utf-8') as f:
         code = f.read()
-    # 词法分析(函数循环匹配/DFA自动匹配)
-    _tokens = parse(code)
+    # 词法分析(函数循环匹配/DFA自动匹配/表驱动)
+    _tokens = LEXER_BACKEND[backend](code)
     return _tokens
@@ -5,16 +5,20 @@ from __future__ import annotations
 # %% md
 # 语法分析
 # %%
+import ast
 import builtins
-import importlib
+import hashlib
+import linecache
+import marshal
 import os
+import types
+from array import array
+from collections import deque
+from typing import Iterable, Iterator
 
 import my_sdt  # 导入语法文件
 import my_sdt_action  # 导入语义动作文件
-
-# 刷新模块, 防止修改文件后变量没有更新
-importlib.reload(my_sdt)
-importlib.reload(my_sdt_action)
+from task1_package import Token, TokenStore, TokenStream  # 导入词法分析结果的类型
 
 
 # %%
@@ -131,167 +135,271 @@ def get_augmented_grammar_to_index(_augmented_grammar: dict[str:list[my_sdt.SDT_
 
 
 # %%
-# 项集类，每一个实例都是一个项集
-class ItemSet:
-    def __init__(self, item_set: set | list):
+# 产生式表：给产生式编号，项用整数编码
+# 项(产生式编号, 点的位置)编码为一个整数：产生式编号 << DOT_BITS | 点的位置
+DOT_BITS = 8
+DOT_MASK = (1 << DOT_BITS) - 1
+
+
+class ProductionTable:
+    def __init__(self, _augmented_grammar: dict[str:list[my_sdt.SDT_right[str]]]):
         """
-        初始化项集
-        :param item_set: 项集
+        初始化产生式表，产生式的编号和get_augmented_grammar_to_index中的序号一致
+        :param _augmented_grammar: 增广文法
         """
-        # 项集，使用set变量便于进行集合运算
-        self.item_set = set(item_set)
-        # 项集(有序)，使用list变量可以按顺序遍历(set是无序的，所以加了一个list变量，内容一样)
-        self.item_set_order_list = list(self.item_set)
-        for item in self.item_set:
-            assert isinstance(item, Item)
-
-    def add(self, item):
+        self.left_symbols = []  # 产生式编号 -> 产生式左边的符号
+        self.right_symbols = []  # 产生式编号 -> 产生式右边的符号(元组)
+        self.productions_of = dict()  # 非终结符 -> 以它为左边的产生式编号列表(按文法中的顺序)
+        self.production_index = dict()  # (左边的符号, 右边的符号元组) -> 产生式编号
+        for left_symbol in _augmented_grammar.keys():
+            self.productions_of[left_symbol] = []
+            for right in _augmented_grammar[left_symbol]:
+                assert len(right) <= DOT_MASK, f"产生式右边的符号过多: {left_symbol} -> {' '.join(right)}"
+                production_id = len(self.left_symbols)
+                self.left_symbols.append(left_symbol)
+                self.right_symbols.append(tuple(right))
+                self.productions_of[left_symbol].append(production_id)
+                self.production_index[(left_symbol, tuple(right))] = production_id
+        # 项 -> 点后面的符号(点在最后时为None)，按需计算并缓存
+        self.next_symbol_cache = dict()
+        # 非终结符 -> 它的闭包：最左展开能到达的所有产生式的初始项(点在最前面)，每个文法只计算一次
+        self.closure_of = {symbol: self.get_nonterminal_closure(symbol) for symbol in self.productions_of}
+
+    def get_nonterminal_closure(self, symbol: str) -> tuple[int, ...]:
         """
-        添加项，同时更新set和list
-        :param item: 项
+        求非终结符的闭包：symbol的所有产生式的初始项，以及这些项点后面的非终结符的产生式的初始项，以此类推
+        :param symbol: 非终结符
+        :return: 闭包中的项(按广度优先的顺序)
         """
-        assert isinstance(item, Item)
-        self.item_set.add(item)
-        self.item_set_order_list.append(item)
+        closure = [production_id << DOT_BITS for production_id in self.productions_of[symbol]]
+        closure_set = set(closure)
+        queue_index = 0
+        while queue_index < len(closure):
+            right = self.right_symbols[closure[queue_index] >> DOT_BITS]
+            queue_index += 1
+            if len(right) > 0 and right[0] in self.productions_of:
+                for production_id in self.productions_of[right[0]]:
+                    item = production_id << DOT_BITS
+                    if item not in closure_set:
+                        closure_set.add(item)
+                        closure.append(item)
+        return tuple(closure)
 
     def __len__(self):
-        """返回长度"""
-        return len(self.item_set)
-
-    def __eq__(self, other):
-        """判断是否相等"""
-        assert isinstance(other, ItemSet)
-        return self.item_set == other.item_set
-
-    def hash_str(self):
-        """便于hash，hash时根据字符串产生hashID来判断是否相等"""
-        return str(
-            ','.join(
-                list(map(
-                    lambda item: item.hash_str(),
-                    list(sorted(
-                        self.item_set, key=lambda item:
-                        (item.left_symbol, item.right_symbol_list, item.dot_index)
-                    ))
-                ))
-            )
-        )
-
-    def __hash__(self):
-        """便于set去重，set会根据字符串产生hashID来判断是否相等，相等时调用__eq__判断是否真的相等"""
-        return hash(self.hash_str())
+        """返回产生式数量"""
+        return len(self.left_symbols)
+
+    @staticmethod
+    def item(production_id: int, dot_index: int) -> int:
+        """编码项，例如 E->E·+T 编码为 E->E+T的编号 << DOT_BITS | 1"""
+        return production_id << DOT_BITS | dot_index
+
+    def next_symbol(self, item: int) -> str | None:
+        """返回项中点后面的符号，点在最后时返回None"""
+        symbol = self.next_symbol_cache.get(item, 0)
+        if symbol == 0:
+            right = self.right_symbols[item >> DOT_BITS]
+            dot_index = item & DOT_MASK
+            symbol = self.next_symbol_cache[item] = right[dot_index] if dot_index < len(right) else None
+        return symbol
+
+    def item_str(self, item: int) -> str:
+        """输出项的字符串，例如 E -> E · + T"""
+        production_id, dot_index = item >> DOT_BITS, item & DOT_MASK
+        right = list(self.right_symbols[production_id])
+        return self.left_symbols[production_id] + ' -> ' + ' '.join(right[:dot_index] + ['·'] + right[dot_index:])
 
-    def __str__(self):
-        """输出字符串"""
-        return ' \n'.join(list(map(str, self.item_set_order_list)))
 
+# %%
+# 项集类，每一个实例都是一个项集
+class ItemSet:
+    __slots__ = ('kernel', 'kernel_set', 'productions', 'hash_value')
 
-# 项类，每一个实例都是一个项
-class Item:
-    def __init__(self, left_symbol: str, right_symbol_list: list, dot_index: int):
+    def __init__(self, kernel: Iterable[int], productions: ProductionTable):
         """
-        初始化项集, 例如 E->E·+T, 写作Item('E', ['E','+','T'], 1)
-        :param left_symbol: 产生式左边的符号，如'E'
-        :param right_symbol_list: 产生式右边的符号(列表)，如['E','+','T']
-        :param dot_index: 点的位置，dot_index ∈ [0,len(right_symbol_list)]，如1
+        初始化项集，只保存核心项(点不在最前面的项，以及S'->·S)，非核心项由核心项唯一确定，需要时再求闭包。
+        项集创建后不再修改
+        :param kernel: 核心项(整数编码)，按照加入的顺序
+        :param productions: 产生式表，用于求闭包和输出
         """
-        self.left_symbol = left_symbol
-        self.right_symbol_list = right_symbol_list
-        self.dot_index = dot_index
+        # 核心项(有序)
+        self.kernel = tuple(kernel)
+        # 核心项，使用frozenset便于判断相等(核心项相同的项集，闭包也相同)
+        self.kernel_set = frozenset(self.kernel)
+        self.productions = productions
+        # 哈希值只计算一次
+        self.hash_value = hash(self.kernel_set)
+
+    @property
+    def item_set_order_list(self) -> list[int]:
+        """项集中的所有项(有序)：核心项的闭包，按需计算"""
+        return get_closure(self.productions, self.kernel)
+
+    @property
+    def item_set(self) -> frozenset[int]:
+        """项集中的所有项"""
+        return frozenset(self.item_set_order_list)
+
+    def __len__(self):
+        """返回长度"""
+        return len(self.item_set_order_list)
 
     def __eq__(self, other):
         """判断是否相等"""
-        return self.left_symbol == other.left_symbol \
-            and self.right_symbol_list == other.right_symbol_list \
-            and self.dot_index == other.dot_index
-
-    def hash_str(self):
-        """便于hash，hash时根据字符串产生hashID来判断是否相等"""
-        return str((self.left_symbol, self.right_symbol_list, self.dot_index))
+        assert isinstance(other, ItemSet)
+        return self.hash_value == other.hash_value and self.kernel_set == other.kernel_set
 
     def __hash__(self):
-        """便于set去重，set会根据字符串产生hashID来判断是否相等，相等时调用__eq__判断是否真的相等"""
-        return hash(self.hash_str())
+        """便于set去重和字典查找"""
+        return self.hash_value
 
     def __str__(self):
         """输出字符串"""
-        return self.left_symbol + ' -> ' + \
-            ' '.join(self.right_symbol_list[:self.dot_index] + ['·'] + self.right_symbol_list[self.dot_index:])
+        return ' \n'.join(list(map(self.productions.item_str, self.item_set_order_list)))
 
 
 # %%
-# 根据增广文法中的信息，给定一个项集，返回这个项集的闭包
-def get_closure(_augmented_grammar: dict[str:list[list[str]]], itemSet: ItemSet) -> ItemSet:
+# 根据产生式表，给定一些项，返回这些项的闭包
+def get_closure(_productions: ProductionTable, items: Iterable[int]) -> list[int]:
     """
-    根据增广文法中的信息，给定一个项集，返回这个项集的闭包，和PPT中的算法一样，只不过将每次待计算的项加入队列，而非每次遍历直到项集不再增加
-    :param _augmented_grammar: 增广文法
-    :param itemSet: 项集
-    :return: 这个项集的闭包
-    """
-    itemSet_result = ItemSet(itemSet.item_set_order_list.copy())
-    item_queue = itemSet.item_set_order_list.copy()  # 待处理的项(队列)
-    while len(item_queue) > 0:  # 队列不为空
-        item = item_queue.pop(0)  # 取出第一个项
-        # 如果项集中的点不在最后，展开
-        if item.dot_index < len(item.right_symbol_list):
-            # 待展开的符号
-            symbol = item.right_symbol_list[item.dot_index]
-            # 如果是非终结符
-            if symbol in _augmented_grammar.keys():
-                # 展开
-                for right in _augmented_grammar[symbol]:
-                    new_item = Item(symbol, right, 0)
-                    if new_item not in itemSet_result.item_set:
-                        itemSet_result.add(new_item)
-                        item_queue.append(new_item)
-    return itemSet_result
+    根据产生式表，给定一些项，返回这些项的闭包：在这些项之后，依次并上每个项点后面的非终结符的闭包(已经预先计算好)
+    :param _productions: 产生式表
+    :param items: 项(整数编码)
+    :return: 闭包中的所有项(有序)
+    """
+    item_order_list = list(items)
+    item_set = set(item_order_list)
+    closure_of = _productions.closure_of
+    for item in tuple(item_order_list):
+        symbol = _productions.next_symbol(item)
+        # 如果是非终结符，并上它的闭包
+        if symbol in closure_of:
+            for new_item in closure_of[symbol]:
+                if new_item not in item_set:
+                    item_set.add(new_item)
+                    item_order_list.append(new_item)
+    return item_order_list
 
 
 # %%
-# 根据增广文法中的信息，给定一个项集和一个符号，返回这个项集关于这个符号的goto
-def get_goto(_augmented_grammar: dict[str:list[list[str]]], itemSet: ItemSet, X: str) -> ItemSet:
+# 根据产生式表，给定一个项集和一个符号，返回这个项集关于这个符号的goto
+def get_goto(_productions: ProductionTable, itemSet: ItemSet, X: str) -> ItemSet:
     """
-    获取项集I关于符号X的goto，和PPT中的算法一致
-    :param _augmented_grammar: 增广文法
+    获取项集I关于符号X的goto，和PPT中的算法一致(只保存核心项)
+    :param _productions: 产生式表
     :param itemSet: 项集
     :param X: 符号
     :return: 项集I关于符号X的goto
     """
-    J = ItemSet(list())
-    for item in itemSet.item_set_order_list:
-        if item.dot_index < len(item.right_symbol_list) and item.right_symbol_list[item.dot_index] == X:
-            new_item = Item(item.left_symbol, item.right_symbol_list, item.dot_index + 1)
-            J.add(new_item)
-    return get_closure(_augmented_grammar, J)
+    J = [item + 1 for item in itemSet.item_set_order_list if _productions.next_symbol(item) == X]  # 点后移一位
+    return ItemSet(J, _productions)
 
 
 # %%
-# 根据增广文法中的信息，获取项集族(所有项集)
-def get_itemSetFamily(_augmented_grammar: dict[str:list[list[str]]], _symbol_list: list[str]) -> list[ItemSet]:
+# 根据产生式表，获取项集族(所有项集)和项集之间的转移
+def get_itemSetFamily(_productions: ProductionTable, _symbol_list: list[str]) -> \
+        tuple[list[ItemSet], list[dict[str, int]]]:
     """
-    获取项集族(所有项集)，和PPT中的算法一致，只不过将每次待计算的项集合加入队列，而非每次遍历直到项集族不再增加
-    :param _augmented_grammar: 增广文法
+    获取项集族(所有项集)，和PPT中的算法一致，只不过将每次待计算的项集合加入队列，而非每次遍历直到项集族不再增加。
+    构造时同时记录转移表，填写分析表时直接读取，不需要重新求goto
+    :param _productions: 产生式表
     :param _symbol_list: 符号列表
-    :return: 项集族(所有项集)
+    :return: 项集族(所有项集)、转移表(transitions[项集编号][符号] = goto后的项集编号，没有转移的符号不在字典中)
     """
-    # 用于存储所有项集，使用set避免重复(set内部使用hash方法，我们已经在ItemSet类中重写了hash方法)
-    itemSet_set = set()
+    # 项集 -> 项集编号，使用dict避免重复(dict内部使用hash方法，我们已经在ItemSet类中重写了hash方法)
+    itemSet_to_index = dict()
     itemSet_set_order_list = list()
+    _transitions = list()
+    symbol_order = {symbol: index for index, symbol in enumerate(_symbol_list)}
     # 初始化
-    I0 = get_closure(_augmented_grammar, ItemSet({Item("S'", _augmented_grammar["S'"][0], 0)}))
-    itemSet_set.add(I0)
+    I0 = ItemSet([ProductionTable.item(_productions.productions_of["S'"][0], 0)], _productions)
+    itemSet_to_index[I0] = 0
     itemSet_set_order_list.append(I0)
-    # 待处理的项集
-    itemSet_queue = [I0]
-    while len(itemSet_queue) > 0:
-        itemSet = itemSet_queue.pop(0)
-        for X in _symbol_list:
-            J = get_goto(_augmented_grammar, itemSet, X)
-            if len(J) > 0 and J not in itemSet_set:
-                itemSet_set.add(J)
+    # 待处理的项集：itemSet_set_order_list[queue_index:]
+    queue_index = 0
+    while queue_index < len(itemSet_set_order_list):
+        itemSet = itemSet_set_order_list[queue_index]
+        queue_index += 1
+        # 按点后面的符号分组，每组的项点后移一位就是goto的核心项，不需要对每个符号都求一次goto，也不需要求goto的闭包
+        kernels = dict()
+        for item in itemSet.item_set_order_list:
+            X = _productions.next_symbol(item)
+            if X is not None:
+                kernels.setdefault(X, []).append(item + 1)
+        row = dict()
+        for X in sorted(kernels, key=symbol_order.__getitem__):  # 按符号列表的顺序编号新项集
+            J = ItemSet(kernels[X], _productions)
+            if J not in itemSet_to_index:
+                itemSet_to_index[J] = len(itemSet_set_order_list)
                 itemSet_set_order_list.append(J)
-                itemSet_queue.append(J)
-    return itemSet_set_order_list
+            row[X] = itemSet_to_index[J]
+        _transitions.append(row)
+    return itemSet_set_order_list, _transitions
+
+
+# %%
+# 在包含关系图上传播集合(DeRemer-Pennello的digraph算法)，First集、Follow集都归结为这个问题
+def digraph(_edges: list[list[int]], _initial: list[int]) -> list[int]:
+    """
+    求满足F(x) = F'(x) ∪ ∪{F(y) | x->y}的最小解，集合用整数位集表示。
+    用Tarjan算法找出强连通分量(同一个分量中的结点的集合相同)，每个结点只访问一次，按拓扑序传播。
+    为了不受递归深度的限制，这里用显式的栈模拟递归
+    :param _edges: 邻接表，_edges[x]是x指向的结点y的列表，表示F(x)包含F(y)
+    :param _initial: F'(x)，每个结点的初始集合
+    :return: F(x)
+    """
+    node_count = len(_edges)
+    infinity = node_count + 1
+    result = list(_initial)
+    depth = [0] * node_count  # 0表示未访问，infinity表示所在的强连通分量已经处理完毕
+    stack = []
+    for root in range(node_count):
+        if depth[root]:
+            continue
+        stack.append(root)
+        depth[root] = len(stack)
+        work = [(root, 0, len(stack))]  # (结点, 下一条边的序号, 结点在stack中的深度)
+        while work:
+            x, k, d = work[-1]
+            if k < len(_edges[x]):
+                work[-1] = (x, k + 1, d)
+                y = _edges[x][k]
+                if depth[y] == 0:
+                    stack.append(y)
+                    depth[y] = len(stack)
+                    work.append((y, 0, len(stack)))
+                else:
+                    depth[x] = min(depth[x], depth[y])
+                    result[x] |= result[y]
+                continue
+            work.pop()
+            if depth[x] == d:  # x是强连通分量的根，分量中的结点共享x的集合
+                while True:
+                    y = stack.pop()
+                    depth[y] = infinity
+                    result[y] = result[x]
+                    if y == x:
+                        break
+            if work:
+                parent = work[-1][0]
+                depth[parent] = min(depth[parent], depth[x])
+                result[parent] |= result[x]
+    return result
+
+
+def get_bits_to_set(bits: int, _symbol_list: list[str]) -> set[str]:
+    """
+    将位集转换为符号集合
+    :param bits: 位集，第i位表示_symbol_list[i]
+    :param _symbol_list: 符号列表
+    :return: 符号集合
+    """
+    symbol_set = set()
+    while bits:
+        low_bit = bits & -bits
+        symbol_set.add(_symbol_list[low_bit.bit_length() - 1])
+        bits ^= low_bit
+    return symbol_set
 
 
 # %%
@@ -299,39 +407,56 @@ def get_itemSetFamily(_augmented_grammar: dict[str:list[list[str]]], _symbol_lis
 def get_first(_augmented_grammar: dict[str:list[list[str]]], _nonterminal_symbol_list: list[str],
               _terminal_symbol_list: list[str]) -> dict[str:set[str]]:
     """
-    获取First集，和PPT中的算法一致
+    获取First集，结果和PPT中的迭代算法一致，但是不再反复迭代到不动点：
+    终结符和ε编号为位集的各个位，X->Y1Y2...Yn中Y1...Yk(Y1...Yk-1的First集包含ε)的First集都在First(X)中，
+    建立包含关系图，用digraph一次传播。
+    注意迭代算法中Yi的First集是整体并入的(包括ε)，所以Y1的First集包含ε时，First(X)也包含ε，这里保持这个行为
     :param _augmented_grammar: 增广文法
     :param _nonterminal_symbol_list: 非终结符列表
     :param _terminal_symbol_list: 终结符列表
     :return: First集
     """
-    _first = dict()
-    for X in _nonterminal_symbol_list:
-        _first[X] = set()
+    bit_symbol_list = _terminal_symbol_list + ['ε']
+    terminal_bit = {X: 1 << i for i, X in enumerate(_terminal_symbol_list)}
+    epsilon_bit = 1 << len(_terminal_symbol_list)
+    nonterminal_index = {X: i for i, X in enumerate(_nonterminal_symbol_list)}
+    # 1. 哪些非终结符的First集包含ε：有产生式X->ε，或者有产生式X->Y...且First(Y)包含ε，从X->ε开始沿X->Y...反向传播
+    has_epsilon = [False] * len(_nonterminal_symbol_list)
+    first_symbol_of = [[] for _ in _nonterminal_symbol_list]  # Y -> [X | X->Y...]
+    queue = []
+    for X, x in nonterminal_index.items():
+        for right in _augmented_grammar[X]:
+            if len(right) == 0:
+                if not has_epsilon[x]:
+                    has_epsilon[x] = True
+                    queue.append(x)
+            elif right[0] in nonterminal_index:
+                first_symbol_of[nonterminal_index[right[0]]].append(x)
+    while queue:
+        y = queue.pop()
+        for x in first_symbol_of[y]:
+            if not has_epsilon[x]:
+                has_epsilon[x] = True
+                queue.append(x)
+    # 2. 包含关系图：First(X)包含First(Yi)，终结符Yi直接放入初始集合
+    edges = [[] for _ in _nonterminal_symbol_list]
+    initial = [epsilon_bit if has_epsilon[x] else 0 for x in range(len(_nonterminal_symbol_list))]
+    for X, x in nonterminal_index.items():
+        for right in _augmented_grammar[X]:
+            for symbol in right:
+                if symbol in nonterminal_index:
+                    y = nonterminal_index[symbol]
+                    edges[x].append(y)
+                    if not has_epsilon[y]:
+                        break
+                else:
+                    initial[x] |= terminal_bit[symbol]
+                    break
+    # 3. 传播，再转换回集合
+    first_bits = digraph(edges, initial)
+    _first = {X: get_bits_to_set(first_bits[x], bit_symbol_list) for X, x in nonterminal_index.items()}
     for X in _terminal_symbol_list:
         _first[X] = {X}
-    # 用于判断First集是否改变
-    is_changed = True
-    while is_changed:
-        is_changed = False
-        for X in _nonterminal_symbol_list:
-            for right in _augmented_grammar[X]:
-                if len(right) == 0:  # X->ε
-                    if 'ε' not in _first[X]:
-                        _first[X].add('ε')
-                        is_changed = True
-                else:
-                    for symbol in right:
-                        if symbol in _nonterminal_symbol_list:  # X->Y...
-                            if _first[symbol] - _first[X] != set():
-                                _first[X] = _first[X] | _first[symbol]
-                                is_changed = True
-                        elif symbol in _terminal_symbol_list:
-                            if symbol not in _first[X]:
-                                _first[X].add(symbol)
-                                is_changed = True
-                        if 'ε' not in _first[symbol]:
-                            break
     return _first
 
 
@@ -350,6 +475,25 @@ def get_compound_first(compound_symbol_list: list[str], _first: dict[str, set |
     return compound_first
 
 
+def get_suffix_first(right: list[str], _first_bits: dict[str, int], epsilon_bit: int) -> list[int]:
+    """
+    从后往前一次求出产生式右部每个后缀的First集(位集)，和get_compound_first(right[i:])一致：
+    suffix_first[i] = First(right[i]) - {ε} ∪ (suffix_first[i+1]，如果First(right[i])包含ε)，suffix_first[len(right)] = {ε}
+    :param right: 产生式右部
+    :param _first_bits: 每个符号的First集(位集)
+    :param epsilon_bit: ε对应的位
+    :return: suffix_first
+    """
+    suffix_first = [epsilon_bit] * (len(right) + 1)
+    for i in range(len(right) - 1, -1, -1):
+        symbol_first = _first_bits[right[i]]
+        if symbol_first & epsilon_bit:
+            suffix_first[i] = symbol_first & ~epsilon_bit | suffix_first[i + 1]
+        else:
+            suffix_first[i] = symbol_first
+    return suffix_first
+
+
 # %%
 # 从增广文法中获取Follow集
 def get_follow(_augmented_grammar: dict[str:list[list[str]]], _nonterminal_symbol_list: list[str],
@@ -360,75 +504,139 @@ def get_follow(_augmented_grammar: dict[str:list[list[str]]], _nonterminal_symbo
     1)将$放到FOLLOW(S')中,其中S'是开始符号,而$是输入右端的结束标记。
     2)如果存在一个产生式A→aBβ，那么FIRST(β)中除ε之外的所有符号都在FOLLOW(B)中。
     3）如果存在一个产生式A→aB，或存在产生式A→aBβ且FIRST(β)包含ε,那么FOLLOW(A)中的所有符号都在FOLLOW(B)中,
+    1)和2)是每个Follow集的初始集合，3)（以及下面的4)）是Follow集之间的包含关系，都不依赖Follow集本身，
+    所以建立包含关系图后用digraph一次传播即可，不需要反复迭代
     :param _augmented_grammar: 增广文法
     :param _nonterminal_symbol_list: 非终结符列表
     :param _terminal_symbol_list: 终结符列表
     :param _first: First集
     :return: Follow集
     """
-    _follow = dict()
-    for A in _nonterminal_symbol_list:
-        _follow[A] = set()
+    bit_symbol_list = _terminal_symbol_list + ['ε']
+    epsilon_bit = 1 << len(_terminal_symbol_list)
+    symbol_bit = {symbol: 1 << i for i, symbol in enumerate(bit_symbol_list)}
+    first_bits = {X: sum(symbol_bit[symbol] for symbol in first_X) for X, first_X in _first.items()}
+    nonterminal_index = {A: i for i, A in enumerate(_nonterminal_symbol_list)}
+    has_empty_production = [list() in _augmented_grammar[A] for A in _nonterminal_symbol_list]
+    edges = [[] for _ in _nonterminal_symbol_list]
+    initial = [0] * len(_nonterminal_symbol_list)
     # 1)将$放到FOLLOW(S')中,其中S'是开始符号,而$是输入右端的结束标记。
-    _follow["S'"] = {'$'}
-    # 2)如果存在一个产生式A→αBβ，那么FIRST(β)中除ε之外的所有符号都在FOLLOW(B)中。
-    # 遍历所有产生式，将形如A->αBβ的β的FIRST集合加入FOLLOW(B)
-    for A in _nonterminal_symbol_list:
+    initial[nonterminal_index["S'"]] = symbol_bit['$']
+    for A, a in nonterminal_index.items():
         for right in _augmented_grammar[A]:
-            if len(right) == 0:
-                continue
-            for i in range(len(right) - 1):
-                B = right[i]
-                beta = right[i + 1:]
-                if B in _nonterminal_symbol_list:
-                    _follow[B] = _follow[B] | get_compound_first(beta, _first) - {'ε'}
-    # 3）如果存在一个产生式A→αB，或存在产生式A→αBβ且FIRST(β)包含ε,那么FOLLOW(A)中的所有符号都在FOLLOW(B)中,
-    # 4）如果A->αBC1C2...Cn，且C1->·，那么Follow(C1)全部都在Follow(B)中，如果又有C2->·，那么Follow(C2)全部都在Follow(B)中，直到n
-    # 遍历所有产生式，将形如A->αB的FOLLOW(A)加入FOLLOW(B)，或者将形如A->αBβ且FIRST(β)包含ε的FOLLOW(A)加入FOLLOW(B)
-    # 未变
+            suffix_first = get_suffix_first(right, first_bits, epsilon_bit)
+            for i in range(len(right)):
+                if right[i] not in nonterminal_index:  # 非终结符才需要考虑，设为B
+                    continue
+                b = nonterminal_index[right[i]]
+                # 2)如果存在一个产生式A→αBβ，那么FIRST(β)中除ε之外的所有符号都在FOLLOW(B)中。
+                # 3）如果存在一个产生式A→αB，或存在产生式A→αBβ且FIRST(β)包含ε,那么FOLLOW(A)中的所有符号都在FOLLOW(B)中,
+                # （B位于最后时suffix_first[i + 1] = {ε}）
+                initial[b] |= suffix_first[i + 1] & ~epsilon_bit
+                if suffix_first[i + 1] & epsilon_bit:
+                    edges[b].append(a)
+                # 4）如果A->αBC1C2...Cn，且C1->·，那么Follow(C1)全部都在Follow(B)中，如果又有C2->·，那么Follow(C2)全部都在Follow(B)中，直到n
+                for C in right[i + 1:]:
+                    if C not in nonterminal_index or not has_empty_production[nonterminal_index[C]]:
+                        break
+                    edges[b].append(nonterminal_index[C])
+    follow_bits = digraph(edges, initial)
+    return {A: get_bits_to_set(follow_bits[a], bit_symbol_list) for A, a in nonterminal_index.items()}
+
+
+# %%
+# 在LR(0)自动机上求LALR(1)的向前看符号(DeRemer-Pennello的关系，不构造LR(1)项集再合并)
+def get_LALR_lookahead(_productions: ProductionTable, _terminal_symbol_list: list[str],
+                       _itemSetFamily: list[ItemSet], _transitions: list[dict[str, int]]) -> list[dict[int:set[str]]]:
+    """
+    求LALR(1)向前看符号，(p, A)表示从状态p经过非终结符A的转移：
+    DR(p, A) = {t | p经过A到达r，r经过终结符t有转移}，另外(0, S)读入结束符$
+    (p, A) reads (r, C)：p经过A到达r，r经过C有转移，且C能推出ε。Read = DR ∪ ∪{Read(r, C)}
+    (p, A) includes (p', B)：B->βAγ，γ能推出ε，p'经过β到达p。Follow = Read ∪ ∪{Follow(p', B)}
+    (q, A->ω) lookback (p, A)：p经过ω到达q。LA(q, A->ω) = ∪{Follow(p, A)}
+    两个传播都用digraph完成，代价和LR(0)自动机的规模成正比
+    :param _productions: 产生式表
+    :param _terminal_symbol_list: 终结符列表
+    :param _itemSetFamily: 状态集(LR(0)项集族)
+    :param _transitions: 转移表(get_itemSetFamily的结果)
+    :return: 每个状态中，归约的产生式编号 -> 向前看符号集合
+    """
+    productions_of = _productions.productions_of
+    right_symbols = _productions.right_symbols
+    terminal_bit = {X: 1 << i for i, X in enumerate(_terminal_symbol_list)}
+    # 能推出ε的非终结符：有产生式右边全部能推出ε
+    nullable = set()
     is_changed = True
     while is_changed:
         is_changed = False
-        for A in _nonterminal_symbol_list:
-            for right in _augmented_grammar[A]:
-                if len(right) == 0:
-                    continue
-                for i in range(len(right)):
-                    B = right[i]
-                    if B in _nonterminal_symbol_list:  # 非终结符才需要考虑，设为B
-                        if i == len(right) - 1:  # B位于产生式最后，即A->αB（3.1的情况）
-                            if _follow[A] - _follow[B] != set():
-                                _follow[B] = _follow[B] | _follow[A]
-                                is_changed = True
-                        else:
-                            beta = right[i + 1:]  # B不位于产生式最后，即A->αBβ（3.2的情况）
-                            if 'ε' in get_compound_first(beta, _first):  # FIRST(β)包含ε
-                                if _follow[A] - _follow[B] != set():
-                                    _follow[B] = _follow[B] | _follow[A]
-                                    is_changed = True
-                            # 判断（4）的情况
-                            for ii in range(i + 1, len(right)):
-                                C = right[ii]
-                                if C not in _nonterminal_symbol_list:
-                                    break
-                                if list() not in _augmented_grammar[C]:
-                                    break
-                                if _follow[C] - _follow[B] != set():
-                                    _follow[B] = _follow[B] | _follow[C]
-                                    is_changed = True
-    return _follow
+        for A, production_ids in productions_of.items():
+            if A not in nullable and any(all(X in nullable for X in right_symbols[production_id])
+                                         for production_id in production_ids):
+                nullable.add(A)
+                is_changed = True
+    # 给非终结符转移(p, A)编号
+    nonterminal_transitions = [(p, A) for p, row in enumerate(_transitions) for A in row if A in productions_of]
+    transition_index = {transition: i for i, transition in enumerate(nonterminal_transitions)}
+    # DR和reads
+    direct_read = []
+    reads = []
+    for p, A in nonterminal_transitions:
+        r = _transitions[p][A]
+        bits = 0
+        edges = []
+        for X in _transitions[r]:
+            if X not in productions_of:
+                bits |= terminal_bit[X]
+            elif X in nullable:
+                edges.append(transition_index[(r, X)])
+        direct_read.append(bits)
+        reads.append(edges)
+    start_symbol = right_symbols[productions_of["S'"][0]][0]
+    direct_read[transition_index[(0, start_symbol)]] |= terminal_bit['$']
+    read = digraph(reads, direct_read)
+    # includes和lookback：从p'出发沿B的每个产生式右边走一遍
+    includes = [[] for _ in nonterminal_transitions]
+    lookback = [dict() for _ in _itemSetFamily]
+    for t, (p, B) in enumerate(nonterminal_transitions):
+        for production_id in productions_of[B]:
+            right = right_symbols[production_id]
+            path = []  # path[i]是读入right[i]之前的状态
+            state = p
+            for X in right:
+                path.append(state)
+                state = _transitions[state][X]
+            lookback[state].setdefault(production_id, []).append(t)
+            for i in range(len(right) - 1, -1, -1):
+                if right[i] in productions_of:
+                    includes[transition_index[(path[i], right[i])]].append(t)
+                if right[i] not in nullable:
+                    break
+    follow = digraph(includes, read)
+    _lookahead = []
+    for state_lookback in lookback:
+        state_lookahead = dict()
+        for production_id, transition_ids in state_lookback.items():
+            bits = 0
+            for t in transition_ids:
+                bits |= follow[t]
+            state_lookahead[production_id] = get_bits_to_set(bits, _terminal_symbol_list)
+        _lookahead.append(state_lookahead)
+    return _lookahead
 
 
 # %%
 # 给定增广文法，根据上面求出的项集族、First集、Follow集，获取SLR分析表
-def get_SLR_table(_augmented_grammar: dict[str:list[list[str]]],
-                  _augmented_grammar_to_index: dict[tuple[str, tuple[str]]:int],
+# 分析表的类型：SLR(1)按Follow集归约，LALR(1)按向前看符号归约，二者的LR(0)自动机(状态、移入、跳转)相同
+PARSER_MODES = ('SLR', 'LALR')
+
+
+def get_SLR_table(_productions: ProductionTable,
                   _symbol_list: list[str], _nonterminal_symbol_list: list[str], _terminal_symbol_list: list[str],
                   _first: dict[str, set | set[str]], _follow: dict[str, set | set[str]],
-                  _itemSetFamily: list[ItemSet]) -> \
+                  _itemSetFamily: list[ItemSet], _transitions: list[dict[str, int]], _mode: str = 'SLR') -> \
         tuple[dict[int:dict[str:str]], dict[int:dict[str:str]]]:
     """
-    获取SLR分析表\n
+    获取SLR分析表(_mode='SLR'，按Follow集归约)或LALR分析表(_mode='LALR'，按get_LALR_lookahead的向前看符号归约)\n
     格式样例：\n
     itemSetFamily = [I0, I1, I2] 每个Ii都是一个ItemSet\n
     action = {0: {'i': 's1', '+': 's2'  '$': ''   },\n
@@ -439,18 +647,20 @@ def get_SLR_table(_augmented_grammar: dict[str:list[list[str]]],
             2: {'E': '',  'T': '' }}\n
     action每个格子都有值，缺省为''   \n
     goto每个格子都有值，缺省为''   \n
-    :param _augmented_grammar: 增广文法
-    :param _augmented_grammar_to_index: 增广文法序号
+    :param _productions: 产生式表(产生式编号即增广文法序号)
     :param _symbol_list: 符号列表
     :param _nonterminal_symbol_list: 非终结符列表
     :param _terminal_symbol_list: 终结符列表
     :param _first: First集
     :param _follow: Follow集
     :param _itemSetFamily: 状态集(每个状态其实就是一个ItemSet)
+    :param _transitions: 转移表(get_itemSetFamily的结果)
+    :param _mode: 分析表的类型，'SLR'或'LALR'
     :return: action表、goto表
     """
-    # 项集族是一个有序的list，我将其编号并存储在字典中，方便查找
-    itemSetFamily_to_index = {_itemSetFamily[i]: i for i in range(len(_itemSetFamily))}
+    assert _mode in PARSER_MODES, f"未知的分析表类型: {_mode}"
+    if _mode == 'LALR':
+        _lookahead = get_LALR_lookahead(_productions, _terminal_symbol_list, _itemSetFamily, _transitions)
     # 将goto表初始化为空表
     _goto = dict()
     for i in range(len(_itemSetFamily)):
@@ -464,31 +674,32 @@ def get_SLR_table(_augmented_grammar: dict[str:list[list[str]]],
         for X in _terminal_symbol_list:
             _action[i][X] = ''
     # 对项集族中的每个项集，判断它们能通过哪个符号连接到哪个项集，记入action和goto表；再判断是否能够归约，把归约记录在action中
-    for itemSet in _itemSetFamily:
-        itemSet_index = itemSetFamily_to_index[itemSet]
-        # 遍历文法符号，试图操作(移入和跳转)
+    for itemSet_index, itemSet in enumerate(_itemSetFamily):
+        # 遍历文法符号，试图操作(移入和跳转)，转移在构造项集族时已经记录
         for X in _symbol_list:
-            goto_itemSet = get_goto(_augmented_grammar, itemSet, X)
-            if len(goto_itemSet) > 0:
-                assert goto_itemSet in itemSetFamily_to_index.keys()
-                goto_itemSet_index = itemSetFamily_to_index[goto_itemSet]
+            if X in _transitions[itemSet_index]:
+                goto_itemSet_index = _transitions[itemSet_index][X]
                 # 如果X是非终结符，goto加一条'跳转'边
-                if X in _augmented_grammar.keys():
+                if X in _productions.productions_of:
                     _goto[itemSet_index][X] += str(goto_itemSet_index)  # FIXME 冲突时优先移入(=号而不是+=号)
                 # 如果X是终结符，action加一条'移入'边
                 else:
                     _action[itemSet_index][X] += 's' + str(goto_itemSet_index)  # FIXME 冲突时优先移入(=号而不是+=号)
         # 试图归约
         reduce_items = list(  # 找出所有可以归约的项
-            filter(lambda _item: _item.dot_index == len(_item.right_symbol_list), itemSet.item_set_order_list))
+            filter(lambda _item: _productions.next_symbol(_item) is None, itemSet.item_set_order_list))
         for reduce_item in reduce_items:  # 对于每一个可以归约的项
-            if reduce_item.left_symbol == "S'":  # 如果是S'->S，那么acc
+            reduce_item_index = reduce_item >> DOT_BITS  # 归约的产生式编号
+            left_symbol = _productions.left_symbols[reduce_item_index]
+            if left_symbol == "S'":  # 如果是S'->S，那么acc
                 _action[itemSet_index]['$'] += 'acc'
-            else:  # 否则，找到归约的产生式，加入action表
-                reduce_item_index = \
-                    _augmented_grammar_to_index[(reduce_item.left_symbol, tuple(reduce_item.right_symbol_list))]
+            else:  # 否则，把归约的产生式加入action表
+                if _mode == 'SLR':
+                    lookahead = _follow[left_symbol]
+                else:
+                    lookahead = _lookahead[itemSet_index][reduce_item_index]
                 for X in _terminal_symbol_list:
-                    if X in _follow[reduce_item.left_symbol]:  # 如果X在FOLLOW(A)中，才会归约
+                    if X in lookahead:  # 如果X在FOLLOW(A)(LALR时为向前看符号)中，才会归约
                         _action[itemSet_index][X] += 'r' + str(reduce_item_index)  # FIXME 冲突时优先移入(=号而不是+=号)
 
     return _action, _goto
@@ -496,26 +707,179 @@ def get_SLR_table(_augmented_grammar: dict[str:list[list[str]]],
 
 # %%
 # 检查SLR冲突
-def check_SLR(_action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]]):
+def get_conflicts(_action: dict[int:dict[str:str]]) -> list[str]:
     """
-    检查SLR分析表是否有冲突，有冲突则抛出断言异常
+    找出action表中的所有冲突(一个格子中有多个动作)
     :param _action: action表
-    :param _goto: goto表
+    :return: 冲突的描述列表
     """
+    conflicts = []
     for i in _action.keys():
         for X in _action[i].keys():
             if _action[i][X] != '' and _action[i][X] != 'acc':
-                assert _action[i][X].count('s') + _action[i][X].count('r') < 2, \
-                    f"归约归约冲突或移入归约冲突: 当I{i}遇到{X}执行{_action[i][X]}"
-                assert _action[i][X] == '' or _action[i][X] == 'acc' or \
-                       (_action[i][X][0] in ['s', 'r'] and _action[i][X][1:].isnumeric()), \
-                    f"未知的action表动作(理论上不可能, 似乎是action表的生成存在问题): 当I{i}遇到{X}执行{_action[i][X]}"
+                shift_count, reduce_count = _action[i][X].count('s'), _action[i][X].count('r')
+                if shift_count + reduce_count >= 2:
+                    conflict_type = "归约归约冲突" if shift_count == 0 else "移入归约冲突"
+                    conflicts.append(f"{conflict_type}: 当I{i}遇到{X}执行{_action[i][X]}")
+    return conflicts
+
+
+def check_SLR(_action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]], _mode: str = 'SLR'):
+    """
+    检查分析表是否有冲突，有冲突则抛出断言异常(列出所有冲突)
+    :param _action: action表
+    :param _goto: goto表
+    :param _mode: 分析表的类型(get_SLR_table的_mode)，用于报错
+    """
+    conflicts = get_conflicts(_action)
+    assert len(conflicts) == 0, f"{_mode}分析表有{len(conflicts)}个冲突:\n" + "\n".join(conflicts)
+    for i in _action.keys():
+        for X in _action[i].keys():
+            assert _action[i][X] == '' or _action[i][X] == 'acc' or \
+                   (_action[i][X][0] in ['s', 'r'] and _action[i][X][1:].isnumeric()), \
+                f"未知的action表动作(理论上不可能, 似乎是action表的生成存在问题): 当I{i}遇到{X}执行{_action[i][X]}"
     for i in _goto.keys():
         for X in _goto[i].keys():
             if _goto[i][X] != '':
                 assert _goto[i][X].isnumeric(), f"goto表的值不是数字: 当I{i}遇到{X}跳转到{_goto[i][X]}"
 
 
+# %%
+# 分析表的磁盘缓存：文法不变时直接加载上次构造的分析表，不再求First集、Follow集、项集族
+# 缓存文件格式：文件头(PARSER_CACHE_MAGIC + 2字节版本号 + 32字节文法指纹) + marshal序列化的分析表
+PARSER_CACHE_MAGIC = b'SLRT'
+PARSER_CACHE_VERSION = 1
+# 磁盘缓存目录(和lexer_generator相同)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+
+def update_code_digest(sha256, code: types.CodeType):
+    """
+    把函数的代码(字节码、常量、名字)加入摘要，不包含行号和文件名，因此只移动代码的位置时摘要不变
+    :param sha256: hashlib的摘要对象
+    :param code: 函数的代码对象
+    """
+    sha256.update(code.co_code)
+    sha256.update(repr((code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars)).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):  # 嵌套的函数、推导式
+            update_code_digest(sha256, const)
+        elif isinstance(const, frozenset):  # `x in {...}`的常量，repr的顺序和字符串的哈希种子有关
+            sha256.update(repr(sorted(map(repr, const))).encode('utf-8'))
+        else:
+            sha256.update(repr(const).encode('utf-8'))
+
+
+def get_generator_fingerprint() -> bytes:
+    """
+    分析表构造代码的指纹：构造分析表的函数和类(项的编码、闭包、项集族、First集、Follow集、LALR向前看符号、填表、压缩)的代码的摘要，
+    修改这些代码后旧的缓存自动失效，不需要手动修改PARSER_CACHE_VERSION
+    :return: sha256摘要(32字节)
+    """
+    global _generator_fingerprint
+    if _generator_fingerprint is None:
+        sha256 = hashlib.sha256()
+        sha256.update(repr((DOT_BITS, DOT_MASK, ACTION_TAG_BITS, ACTION_ERROR, ACTION_SHIFT, ACTION_REDUCE,
+                            ACTION_ACCEPT)).encode('utf-8'))
+        functions = [get_symbol_list, get_closure, get_goto, get_itemSetFamily, digraph, get_bits_to_set, get_first,
+                     get_compound_first, get_suffix_first, get_follow, get_LALR_lookahead, get_SLR_table,
+                     encode_action, get_table_rows, get_compact_array, compress_parser_tables, build_parser_tables]
+        for cls in (ProductionTable, ItemSet, CompressedTable, CompressedParserTables):
+            for attr in vars(cls).values():
+                attr = getattr(attr, '__func__', getattr(attr, 'fget', attr))  # staticmethod、property
+                if isinstance(attr, types.FunctionType):
+                    functions.append(attr)
+        for function in functions:
+            update_code_digest(sha256, function.__code__)
+        _generator_fingerprint = sha256.digest()
+    return _generator_fingerprint
+
+
+_generator_fingerprint = None  # get_generator_fingerprint的结果(每个进程只计算一次)
+
+
+def get_grammar_fingerprint(_augmented_grammar: dict[str:list[my_sdt.SDT_right[str]]], _mode: str = 'SLR') -> bytes:
+    """
+    文法指纹：缓存版本、分析表类型、产生式(按顺序)、my_sdt.py的源码和分析表构造代码都相同时才相同，
+    因此修改my_sdt.py或构造分析表的代码后缓存自动失效
+    :param _augmented_grammar: 增广文法
+    :param _mode: 分析表的类型
+    :return: sha256摘要(32字节)
+    """
+    sha256 = hashlib.sha256()
+    productions = [(left_symbol, tuple(right)) for left_symbol in _augmented_grammar
+                   for right in _augmented_grammar[left_symbol]]
+    sha256.update(repr((PARSER_CACHE_VERSION, _mode, productions)).encode('utf-8'))
+    with open(my_sdt.__file__, 'rb') as f:
+        sha256.update(f.read())
+    sha256.update(get_generator_fingerprint())
+    return sha256.digest()
+
+
+def build_parser_tables(_augmented_grammar: dict[str:list[my_sdt.SDT_right[str]]], _mode: str = 'SLR') -> dict:
+    """
+    构造分析表，结果只包含marshal能序列化的类型
+    :param _augmented_grammar: 增广文法
+    :param _mode: 分析表的类型
+    :return: {'symbol_list', 'nonterminal_symbol_list', 'terminal_symbol_list',
+              'productions': 按顺序的(左边的符号, 右边的符号元组), 'kernels': 每个状态的核心项, 'transitions', 'action', 'goto',
+              'table': 推导时查表用的压缩后的分析表(不使用缺省归约，见CompressedParserTables.get_lists)}
+    """
+    _symbol_list, _nonterminal_symbol_list, _terminal_symbol_list = get_symbol_list(_augmented_grammar)
+    _productions = ProductionTable(_augmented_grammar)
+    _first = get_first(_augmented_grammar, _nonterminal_symbol_list, _terminal_symbol_list)
+    _follow = get_follow(_augmented_grammar, _nonterminal_symbol_list, _terminal_symbol_list, _first)
+    _itemSetFamily, _transitions = get_itemSetFamily(_productions, _symbol_list)
+    _action, _goto = get_SLR_table(_productions, _symbol_list, _nonterminal_symbol_list, _terminal_symbol_list,
+                                   _first, _follow, _itemSetFamily, _transitions, _mode)
+    return {
+        'symbol_list': _symbol_list,
+        'nonterminal_symbol_list': _nonterminal_symbol_list,
+        'terminal_symbol_list': _terminal_symbol_list,
+        'productions': list(zip(_productions.left_symbols, _productions.right_symbols)),
+        'kernels': [itemSet.kernel for itemSet in _itemSetFamily],
+        'transitions': _transitions,
+        'action': _action,
+        'goto': _goto,
+        'table': compress_parser_tables(_action, _goto, _nonterminal_symbol_list, _terminal_symbol_list,
+                                        default_reductions=False).get_lists(),
+    }
+
+
+def load_parser_tables(_augmented_grammar: dict[str:list[my_sdt.SDT_right[str]]], _mode: str = 'SLR',
+                       cache_dir: str = CACHE_DIR) -> dict:
+    """
+    获取分析表：磁盘缓存中有指纹相同的分析表时直接加载，否则构造并写入缓存
+    :param _augmented_grammar: 增广文法
+    :param _mode: 分析表的类型
+    :param cache_dir: 缓存目录
+    :return: 分析表(格式见build_parser_tables)
+    """
+    fingerprint = get_grammar_fingerprint(_augmented_grammar, _mode)
+    header = PARSER_CACHE_MAGIC + PARSER_CACHE_VERSION.to_bytes(2, 'little') + fingerprint
+    cache_filepath = os.path.join(cache_dir, f'parser_{_mode}_{fingerprint.hex()[:16]}.bin')
+    tables = None
+    if os.path.exists(cache_filepath):
+        try:
+            with open(cache_filepath, 'rb') as f:
+                data = f.read()  # 一次读入再反序列化(marshal.load逐段读文件比较慢)
+            if data[:len(header)] == header:  # 文件头不同(版本或文法不同)时重新构造
+                tables = marshal.loads(data[len(header):])
+        except (OSError, EOFError, ValueError, TypeError):  # 缓存损坏时重新构造
+            tables = None
+    if tables is None:
+        tables = build_parser_tables(_augmented_grammar, _mode)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_filepath + '.tmp', 'wb') as f:
+                f.write(header)
+                marshal.dump(tables, f)
+            os.replace(cache_filepath + '.tmp', cache_filepath)
+        except OSError:  # 无法写入缓存时，只是下次启动需要重新构造
+            pass
+    return tables
+
+
 # %%
 # 输出SLR分析表到文本文件
 def print_SLR_table(_nonterminal_symbol_list: list[str], _terminal_symbol_list: list[str],
@@ -649,22 +1013,477 @@ def print_SLR_table_to_excel(_nonterminal_symbol_list: list[str], _terminal_symb
 
 
 # %%
+# 定义类型映射，避免混淆。将下面的这些类型的Token映射为对应的终结符，而其他类型直接用value当作终结符
+# （本质为调用type_map.get(token.type, token.value)，如token(1)会映射为'num', token(;)则不变';'）
+type_map = {
+    'int_dec': 'num',
+    'int_oct': 'num',
+    'int_bin': 'num',
+    'int_hex': 'num',
+    'float': 'num',
+    # 'char': 'char_value',
+    # 'string': 'string_value',
+    'identifier': 'id',
+}
+
+
+# 获取token对应的终结符编号
+def get_terminal_id(_token: Token, _terminal_index: dict[str, int]) -> int:
+    """
+    获取token对应的终结符编号(终结符列表的下标)，token中已经记录了编号时直接返回
+    :param _token: token
+    :param _terminal_index: 终结符 -> 终结符编号
+    :return: 终结符编号，不是终结符时为-1
+    """
+    if _token.terminal < 0:
+        _token.terminal = _terminal_index.get(type_map.get(_token.type, _token.value), -1)
+    return _token.terminal
+
+
+# action表的整数编码：低ACTION_TAG_BITS位为动作类型，其余的位为移入的状态编号或归约的产生式编号
+ACTION_TAG_BITS = 2
+ACTION_TAG_MASK = (1 << ACTION_TAG_BITS) - 1
+ACTION_ERROR, ACTION_SHIFT, ACTION_REDUCE, ACTION_ACCEPT = 0, 1, 2, 3
+
+
+def encode_action(_action_str: str) -> int:
+    """
+    将action表的一个格子编码为整数，例如''->0，'s12'->12<<2|1，'r5'->5<<2|2，'acc'->3
+    :param _action_str: action表的格子(没有冲突)
+    :return: 整数编码
+    """
+    if _action_str == '':
+        return ACTION_ERROR
+    if _action_str == 'acc':
+        return ACTION_ACCEPT
+    assert _action_str[0] in ['s', 'r'] and _action_str[1:].isnumeric(), f"无法编码的action表动作: {_action_str}"
+    return int(_action_str[1:]) << ACTION_TAG_BITS | (ACTION_SHIFT if _action_str[0] == 's' else ACTION_REDUCE)
+
+
+def decode_action(_action_code: int) -> str:
+    """
+    encode_action的逆运算
+    :param _action_code: 整数编码
+    :return: action表的格子
+    """
+    tag, value = _action_code & ACTION_TAG_MASK, _action_code >> ACTION_TAG_BITS
+    return ['', 's' + str(value), 'r' + str(value), 'acc'][tag]
+
+
+# 将action表和goto表转为按编号索引的二维列表
+def get_table_rows(_action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]],
+                   _nonterminal_symbol_list: list[str], _terminal_symbol_list: list[str]) -> \
+        tuple[list[list[int]], list[list[int]]]:
+    """
+    将action表和goto表转为二维列表，推导时用状态编号和终结符编号(非终结符编号)直接索引，不需要字符串哈希；
+    格子预先解码为整数：action表的格子用encode_action编码，goto表的格子为跳转到的状态(没有跳转时为-1)，
+    推导时只需要整数比较，不再解析字符串(分析表的合法性由check_SLR检查，encode_action也会拒绝无法解析的格子)
+    :param _action: action表
+    :param _goto: goto表
+    :param _nonterminal_symbol_list: 非终结符列表
+    :param _terminal_symbol_list: 终结符列表
+    :return: action_rows[state][terminal_id]，goto_rows[state][nonterminal_id]
+    """
+    _action_rows = [[encode_action(_action[state].get(symbol, '')) for symbol in _terminal_symbol_list]
+                    for state in range(len(_action))]
+    _goto_rows = [[int(_goto[state][symbol]) if _goto[state].get(symbol, '') != '' else -1
+                   for symbol in _nonterminal_symbol_list]
+                  for state in range(len(_goto))]
+    return _action_rows, _goto_rows
+
+
+# %%
+# 行偏移压缩(row displacement / comb vector)的分析表：action表和goto表中大部分格子是空的，只存储非缺省的格子
+def get_compact_array(values: list[int]) -> array:
+    """
+    用能容纳所有值的最小的整数类型保存
+    :param values: 整数列表
+    :return: array
+    """
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode in ['b', 'h', 'i', 'q']:
+        bits = array(typecode).itemsize * 8 - 1
+        if -(1 << bits) <= low and high < (1 << bits):
+            return array(typecode, values)
+    raise OverflowError(f"值超出范围: {low}~{high}")
+
+
+class CompressedTable:
+    __slots__ = ('base', 'check', 'value', 'default')
+
+    def __init__(self, rows: list[list[int]], default: list[int]):
+        """
+        压缩二维表：每一行中不等于缺省值的格子按偏移base[row]放入一维数组value，check记录value的每个位置属于哪一行，
+        table[row][column] = value[base[row] + column]，如果check[base[row] + column] == row，否则为default[row]。
+        放置时按非缺省格子数从多到少，每行取不和已放置的格子重叠、也不和其他行相同的最小偏移(first fit)，
+        因此偏移也可以代替行号(check中的行号换成偏移即可)
+        :param rows: 二维表(每一行的长度相同)
+        :param default: 每一行的缺省值
+        """
+        column_count = max(map(len, rows), default=0)
+        entries = [[(column, x) for column, x in enumerate(row) if x != default[row_index]]
+                   for row_index, row in enumerate(rows)]
+        base = [0] * len(rows)
+        used_bases = set()
+        occupied = 0  # 已经占用的位置(位集)
+        for row_index in sorted(range(len(rows)), key=lambda i: -len(entries[i])):
+            # fits的第offset位为1 <=> 这一行的格子放在偏移offset时都落在空位上(负数表示后面的位都是1)
+            mask, fits = 0, -1
+            for column, _ in entries[row_index]:
+                mask |= 1 << column
+                fits &= ~occupied >> column
+            while True:
+                offset = (fits & -fits).bit_length() - 1
+                if offset not in used_bases:
+                    break
+                fits &= ~(1 << offset)
+            base[row_index] = offset
+            used_bases.add(offset)
+            occupied |= mask << offset
+        # 末尾补齐一行的长度，这样查找时base[row] + column不会越界
+        check = [-1] * (max(base, default=0) + column_count)
+        value = [0] * len(check)
+        for row_index, row_entries in enumerate(entries):
+            for column, x in row_entries:
+                check[base[row_index] + column] = row_index
+                value[base[row_index] + column] = x
+        self.base = get_compact_array(base)
+        self.check = get_compact_array(check)
+        self.value = get_compact_array(value)
+        self.default = get_compact_array(default)
+
+    def lookup(self, row: int, column: int) -> int:
+        """查表，等价于table[row][column]"""
+        index = self.base[row] + column
+        return self.value[index] if self.check[index] == row else self.default[row]
+
+    def get_row(self, row: int, column_count: int) -> list[int]:
+        """取出一整行(用于检查和输出)"""
+        return [self.lookup(row, column) for column in range(column_count)]
+
+    def __sizeof__(self):
+        """各个数组占用的内存(字节)"""
+        return object.__sizeof__(self) + sum(x.__sizeof__() for x in (self.base, self.check, self.value, self.default))
+
+
+class CompressedParserTables:
+    __slots__ = ('table', 'state_count', 'terminal_count', 'nonterminal_count')
+
+    def __init__(self, table: CompressedTable, state_count: int, terminal_count: int, nonterminal_count: int):
+        """
+        压缩后的分析表，见compress_parser_tables
+        :param table: 按状态压缩的分析表，每一行为action表的格子(整数编码，见encode_action)接goto表的格子(编码为移进)
+        """
+        self.table = table
+        self.state_count = state_count
+        self.terminal_count = terminal_count
+        self.nonterminal_count = nonterminal_count
+
+    def action_of(self, state: int, terminal_id: int) -> int:
+        """查action表，返回整数编码的动作"""
+        return self.table.lookup(state, terminal_id)
+
+    def goto_of(self, state: int, nonterminal_id: int) -> int:
+        """查goto表，返回跳转到的状态(没有跳转时为-1)"""
+        code = self.table.lookup(state, self.terminal_count + nonterminal_id)
+        return code >> ACTION_TAG_BITS if code & ACTION_TAG_MASK == ACTION_SHIFT else -1
+
+    def get_lists(self, state_ids: list[int] | None = None) -> tuple[list[int], list[int], list[int]]:
+        """
+        推导时查表用的一维列表(直接索引列表比索引array快，也不需要解码goto)：
+        i = base[state] + terminal_id，action表的格子为value[i]，如果check[i] == state_ids[state]，否则为default[state]；
+        goto表的格子为value[base[state] + terminal_count + nonterminal_id]，推导时查的goto一定存在，不需要check。
+        value中移进和goto的目标状态也换成state_ids[目标状态]，例如state_ids为base时推导可以直接在栈中保存偏移，省去查base
+        :param state_ids: 每个状态在check和value中的编号，默认为状态本身
+        :return: base, check, value
+        """
+        if state_ids is None:
+            state_ids = list(range(self.state_count))
+        base = list(self.table.base)
+        check, value = [-1] * len(self.table.check), list(self.table.value)
+        for index, state in enumerate(self.table.check):
+            if state < 0:
+                continue
+            check[index] = state_ids[state]
+            code = value[index]
+            if index - base[state] >= self.terminal_count:  # goto
+                value[index] = state_ids[code >> ACTION_TAG_BITS]
+            elif code & ACTION_TAG_MASK == ACTION_SHIFT:
+                value[index] = state_ids[code >> ACTION_TAG_BITS] << ACTION_TAG_BITS | ACTION_SHIFT
+        return base, check, value
+
+    def __sizeof__(self):
+        """占用的内存(字节)"""
+        return object.__sizeof__(self) + self.table.__sizeof__()
+
+
+def compress_parser_tables(_action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]],
+                           _nonterminal_symbol_list: list[str], _terminal_symbol_list: list[str],
+                           default_reductions: bool = True) -> CompressedParserTables:
+    """
+    压缩分析表(分析表中不能有冲突)：每个状态的action表和goto表的格子接成一行，放入同一个一维数组
+    action表每个状态的缺省值为出现最多的归约(default_reductions为False或者没有归约时为报错)，
+    这个状态中所有的报错格子也按这个归约处理：只会推迟发现错误(报错前多做几次归约)，不会接受错误的输入；
+    goto表的格子编码为移进(和缺省值不同)，空的goto格子取缺省值(不占位置)，所以存在的goto格子都可以不经过check直接查到
+    :param _action: action表
+    :param _goto: goto表
+    :param _nonterminal_symbol_list: 非终结符列表
+    :param _terminal_symbol_list: 终结符列表
+    :param default_reductions: 是否使用缺省归约，为False时查表结果和原表完全相同
+    :return: 压缩后的分析表
+    """
+    action_rows, _goto_rows = get_table_rows(_action, _goto, _nonterminal_symbol_list, _terminal_symbol_list)
+    rows, default = [], []
+    for action_row, goto_row in zip(action_rows, _goto_rows):
+        reduce_counts = dict()
+        for code in action_row:
+            if code & ACTION_TAG_MASK == ACTION_REDUCE:
+                reduce_counts[code] = reduce_counts.get(code, 0) + 1
+        if default_reductions and reduce_counts:
+            default.append(max(reduce_counts, key=reduce_counts.get))
+            action_row = [default[-1] if code == ACTION_ERROR else code for code in action_row]
+        else:
+            default.append(ACTION_ERROR)
+        rows.append(action_row + [target << ACTION_TAG_BITS | ACTION_SHIFT if target >= 0 else default[-1]
+                                  for target in goto_row])
+    return CompressedParserTables(CompressedTable(rows, default),
+                                  len(rows), len(_terminal_symbol_list), len(_nonterminal_symbol_list))
+
+
+# %%
+# 推导过程的输出(流式)：推导时每一步把栈的增量交给TraceSink，不在内存中保存完整的推导过程
+import csv
+import json
+
+from openpyxl.cell import WriteOnlyCell
+
+
+class TraceStack:
+    """由栈的增量(出栈个数、入栈的(状态, 符号))重建完整的状态栈和符号栈，只在渲染推导过程时使用"""
+
+    def __init__(self):
+        self.states = []
+        self.symbols = []
+
+    def update(self, pop: int, push: Iterable[tuple[int, str]]):
+        """
+        执行一步的栈增量(不渲染)
+        :param pop: 出栈的个数
+        :param push: 入栈的(状态, 符号)
+        """
+        if pop > 0:
+            del self.states[-pop:]
+            del self.symbols[-pop:]
+        for state, symbol in push:
+            self.states.append(state)
+            self.symbols.append(symbol)
+
+    def apply(self, pop: int, push: Iterable[tuple[int, str]]) -> tuple[str, str]:
+        """
+        执行一步的栈增量
+        :param pop: 出栈的个数
+        :param push: 入栈的(状态, 符号)
+        :return: 执行后的stack列和symbols列
+        """
+        self.update(pop, push)
+        return ' '.join([str(i) for i in self.states]), ' '.join([str(i) for i in self.symbols])
+
+
+class TraceSink:
+    """
+    推导过程的输出接口，可以直接作为SLR_parsing的_trace参数：推导时每一步调用一次step，
+    栈以增量给出(上一步之后出栈的个数和入栈的(状态, 符号))，需要完整的栈时用TraceStack重建
+    """
+    needs_input = False  # 是否需要完整的input列(剩余输入的字符串，生成的代价和剩余输入的长度成正比)
+
+    def step(self, pop: int, push: list[tuple[int, str]], advance: int, input_str: str | None, action: str):
+        """
+        记录一步推导过程
+        :param pop: 上一步之后出栈的个数
+        :param push: 上一步之后入栈的(状态, 符号)
+        :param advance: 上一步之后读入的token数
+        :param input_str: 剩余输入(needs_input为False时为None)
+        :param action: 这一步的动作
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ListTraceSink(TraceSink):
+    """把推导过程渲染为(stack, symbols, input, action)的行，保存在列表中('full'级别使用)"""
+    needs_input = True
+
+    def __init__(self, rows: list[list[str]] | None = None):
+        self.rows = rows if rows is not None else []
+        self._stack = TraceStack()
+
+    def step(self, pop, push, advance, input_str, action):
+        self.rows.append([*self._stack.apply(pop, push), input_str, action])
+
+
+class CsvTraceSink(TraceSink):
+    """推导过程(栈的增量)流式写入csv文件，每行为(pop, push_states, push_symbols, advance, action)"""
+    columns = ('pop', 'push_states', 'push_symbols', 'advance', 'action')
+
+    def __init__(self, filepath: str):
+        self._file = open(filepath, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def step(self, pop, push, advance, input_str, action):
+        self._writer.writerow((pop, ' '.join([str(state) for state, _ in push]),
+                               ' '.join([symbol for _, symbol in push]), advance, action))
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlTraceSink(TraceSink):
+    """推导过程(栈的增量)流式写入jsonl文件，每行为{"pop", "push": [[状态, 符号], ...], "advance", "action"}"""
+
+    def __init__(self, filepath: str):
+        self._file = open(filepath, 'w', encoding='utf-8')
+
+    def step(self, pop, push, advance, input_str, action):
+        self._file.write(json.dumps({'pop': pop, 'push': push, 'advance': advance, 'action': action},
+                                    ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+
+# 推导过程文件的扩展名对应的TraceSink
+TRACE_FILE_SINKS = {'.csv': CsvTraceSink, '.jsonl': JsonlTraceSink}
+
+
+def open_trace_file(filepath: str) -> TraceSink:
+    """
+    按扩展名(.csv/.jsonl)打开推导过程文件
+    :param filepath: 推导过程文件路径
+    :return: 写入该文件的TraceSink
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    assert extension in TRACE_FILE_SINKS, f"不支持的推导过程文件类型: {filepath}"
+    return TRACE_FILE_SINKS[extension](filepath)
+
+
+def read_trace_file(filepath: str, _input_symbols: list[str] | None = None) -> Iterator[list[str]]:
+    """
+    读取推导过程文件(csv/jsonl)，由栈的增量重建每一步的(stack, symbols, input, action)
+    :param filepath: 推导过程文件路径
+    :param _input_symbols: 预处理后的输入符号(和推导过程中input列的显示一致)，为None时input列为空
+    :return: 推导过程的行的生成器
+    """
+    stack = TraceStack()
+    input_index = 0
+    with open(filepath, 'r', encoding='utf-8', newline='') as f:
+        if filepath.lower().endswith('.csv'):
+            reader = csv.reader(f)
+            next(reader)  # 表头
+            records = ((int(pop), list(zip(map(int, states.split()), symbols.split())), int(advance), action)
+                       for pop, states, symbols, advance, action in reader)
+        else:
+            records = ((record['pop'], record['push'], record['advance'], record['action'])
+                       for record in map(json.loads, f))
+        for pop, push, advance, action in records:
+            input_index += advance
+            input_str = ' '.join(_input_symbols[input_index:]) if _input_symbols is not None else ''
+            yield [*stack.apply(pop, push), input_str, action]
+
+
+class ExcelTraceSink(TraceSink):
+    """
+    推导过程流式写入一个或多个excel文件(openpyxl的write_only模式，行直接写入临时文件)，
+    多个文件(例如全部列和仅符号、动作两列)在推导时一次写完
+    """
+    column_widths = {"Stack": 10, "Symbols": 100, "Input": 80, "Action": 50}  # 每列的宽度
+    column_indexes = {"Stack": 0, "Symbols": 1, "Input": 2, "Action": 3}  # 每列在推导过程的行中的下标
+
+    def __init__(self, outputs: dict[str, tuple]):
+        """
+        :param outputs: 输出文件路径 -> 要输出的列名
+        """
+        self._stack = TraceStack()
+        self._outputs = []
+        for output_filepath, column_names in outputs.items():
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            # 设置每一列的对应宽度(write_only模式下必须在写入行之前设置)
+            for i, column_name in enumerate(column_names):
+                ws.column_dimensions[get_column_letter(i + 1)].width = self.column_widths[column_name]
+            self._outputs.append((output_filepath, wb, ws, [self.column_indexes[i] for i in column_names]))
+            self._append(ws, column_names)  # 表头
+        self.needs_input = any(self.column_indexes["Input"] in indexes for *_, indexes in self._outputs)
+
+    @staticmethod
+    def _append(ws, values: Iterable[str]):
+        # 每个单元格设置为字符串格式，防止识别成公式或者数字之类的
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value)
+            cell.data_type = 's'
+            cells.append(cell)
+        ws.append(cells)
+
+    def write_row(self, row: list[str]):
+        """
+        直接写入一行推导过程(stack, symbols, input, action)，用于写入已经渲染好的推导过程
+        :param row: 推导过程的一行
+        """
+        for _, _, ws, indexes in self._outputs:
+            self._append(ws, [row[i] for i in indexes])
+
+    def step(self, pop, push, advance, input_str, action):
+        self.write_row([*self._stack.apply(pop, push), input_str, action])
+
+    def close(self):
+        for output_filepath, wb, _, _ in self._outputs:
+            wb.save(output_filepath)
+        self._outputs = []
+
+
+# %%
+# 推导过程的记录级别：
+# off不记录；actions只记录每一步的动作(其他列为空)；
+# ring只在环形缓冲区中保留最近的若干步，出现语法错误时才输出错误前后的这些步骤(中间省略的步数用一行…表示)；
+# full记录每一步完整的状态栈、符号栈、剩余输入和动作(每一步的代价和栈、输入的长度成正比，只适合小的输入)；
+# 也可以直接传入TraceSink，推导时每一步的栈增量流式交给它(例如写入文件)，不在内存中保存推导过程
+TRACE_LEVELS = ('off', 'actions', 'ring', 'full')
+
+
 # 开始推导过程
-def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
+def SLR_parsing(_tokens: list[Token] | Iterable[Token], _token_place: list[tuple[int, int]] | None,
                 _augmented_grammar_order_list: list[tuple[str, my_sdt.SDT_right[str]]],
                 _nonterminal_symbol_list: list[str], _terminal_symbol_list: list[str],
-                _itemSetFamily: list[ItemSet], _action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]]) \
+                _itemSetFamily: list[ItemSet], _action: dict[int:dict[str:str]], _goto: dict[int:dict[str:str]],
+                _trace: bool | str | TraceSink = True, _trace_ring_size: int = 32,
+                _context: my_sdt_action.CompilationContext | None = None,
+                _table: tuple[list[int], list[int], list[int]] | None = None) \
         -> tuple[list[list[str]], list[list[str]]]:
     """
     SLR推导
-    :param _tokens: 词法分析结果
-    :param _token_place: token的位置(行号、列号)的列表
+    :param _tokens: 词法分析结果(预处理后的列表，或者预处理后的token生成器/TokenStream，此时边词法分析边推导)
+    :param _token_place: token的位置(行号、列号)的列表，为None时使用token中记录的位置
     :param _augmented_grammar_order_list: 增广文法序号列表
     :param _nonterminal_symbol_list: 非终结符列表
     :param _terminal_symbol_list: 终结符列表
     :param _itemSetFamily: 状态集
     :param _action: action表
     :param _goto: goto表
+    :param _trace: 推导过程的记录级别(见TRACE_LEVELS)，True和False分别相当于'full'和'off'；
+                   为TraceSink时每一步都交给它，返回的推导过程为空列表
+    :param _trace_ring_size: 'ring'级别时，错误前后各保留的步数(剩余输入也只显示这么多个token)
+    :param _context: 这次编译的状态(语义分析的三地址码、错误列表等都在里面)，为None时使用新的CompilationContext
+    :param _table: 压缩后的分析表(load_parser_tables的'table')，为None时由_action和_goto压缩
     :return: 推导过程输出到SLR_parsing_procedure变量，每行为(stack, symbols, input, action)；错误信息输出到SLR_parsing_error变量，每行为(line, column, error_token)
     """
     # 推导过程输出到SLR_parsing_procedure变量，每行为(stack, symbols, input, action)
@@ -672,30 +1491,153 @@ def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
     # 错误信息输出到SLR_parsing_error变量，每行为(line, column, error_token)
     _SLR_parsing_error = list()
     # 初始化
-    _stack = [0]  # 状态栈
-    _symbols = ['$']  # 符号栈
-    _symbols_value = [None]  # 符号栈的值
-    _symbols_place = [None]  # 符号栈中每个符号的起始位置（用于报错）
-    _input = _tokens  # 待处理的输入符号
-    _next_action = ''  # 下一步动作
+    # 状态栈、符号栈、符号栈的值、符号栈中每个符号的起始位置（用于报错）是四个平行的栈，预先分配空间，
+    # _top为栈顶的下标，出栈、入栈只移动_top，栈满时容量翻倍
+    _capacity = 256
+    _stack = [0] * _capacity  # 状态栈
+    _symbols = [None] * _capacity  # 符号栈
+    _symbols_value = [None] * _capacity  # 符号栈的值
+    _symbols_place = [None] * _capacity  # 符号栈中每个符号的起始位置（用于报错）
+    _stack[0], _symbols[0] = 0, '$'
+    _top = 0
+    _input = _tokens if isinstance(_tokens, TokenStream) else TokenStream(_tokens)  # 待处理的输入符号(游标，不复制列表)
+    _next_action = ACTION_ERROR  # 下一步动作
     _input_index = 0  # _input到了_tokens的第几个
     grammatical_mistake = False  # 是否有语法错误
+    # 推导时按编号查压缩后的分析表(不使用缺省归约，查表结果和原表相同)：
+    # action表的格子为_table_value[_table_base[state] + terminal_id](_table_check不等于state时为报错)，
+    # goto表的格子为_table_value[_table_base[state] + _goto_columns[nonterminal]]
+    _terminal_index = {symbol: index for index, symbol in enumerate(_terminal_symbol_list)}
+    _nonterminal_index = {symbol: index for index, symbol in enumerate(_nonterminal_symbol_list)}
+    if _table is None:
+        _table = compress_parser_tables(_action, _goto, _nonterminal_symbol_list, _terminal_symbol_list,
+                                        default_reductions=False).get_lists()
+    _table_base, _table_check, _table_value = _table
+    _goto_columns = {symbol: len(_terminal_symbol_list) + index for index, symbol in enumerate(_nonterminal_symbol_list)}
+    _left_goto_columns = [_goto_columns[left_symbol] for left_symbol, _ in _augmented_grammar_order_list]
+    # 语义动作预先编译为函数(绑定到这次编译的状态)，归约时按产生式编号调用
+    if _context is None:
+        _context = my_sdt_action.CompilationContext()
+    _sdt_actions = compile_sdt_actions(_augmented_grammar_order_list, _nonterminal_symbol_list, _context)
+
+    def get_place(_token: Token) -> tuple[int, int]:
+        # 当前输入token的位置
+        return _token_place[_input_index] if _token_place is not None else (_token.line, _token.column)
+
+    def get_input_str(_limit: int | None = None) -> str:
+        # 推导过程中的input列：输入为生成器时只能显示已经缓冲的token，给出_limit时只显示前_limit个token，后面用…表示
+        if _limit is None:
+            _buffered, _complete = _input.buffered()
+        else:
+            _buffered = [_input.peek(k) for k in range(_limit)]
+            _complete = _input.peek(_limit) is None
+            _buffered = [i for i in _buffered if i is not None]
+        _input_str = ' '.join([str(type_map.get(i.type, i.value)) for i in _buffered])
+        return _input_str if _complete else f"{_input_str} …"
+
+    def get_ring_input_str(_upcoming: list[Token | None], _offset: int) -> str:
+        # 'ring'级别时由保存的token渲染某一步的input列(和get_input_str(_trace_ring_size)相同)：
+        # _upcoming为从环形缓冲区中最早的一步的输入位置开始的token(结束后为None)，_offset为这一步的输入位置相对它的偏移
+        _buffered = [i for i in _upcoming[_offset:_offset + _trace_ring_size] if i is not None]
+        _input_str = ' '.join([str(type_map.get(i.type, i.value)) for i in _buffered])
+        return _input_str if _upcoming[_offset + _trace_ring_size] is None else f"{_input_str} …"
+
+    # 记录推导过程
+    if isinstance(_trace, TraceSink):
+        _trace_level, _trace_sink = 'full', _trace
+    else:
+        _trace_level = ('full' if _trace else 'off') if isinstance(_trace, bool) else _trace
+        assert _trace_level in TRACE_LEVELS, f"未知的推导过程记录级别: {_trace}"
+        _trace_sink = ListTraceSink(_SLR_parsing_procedure) if _trace_level == 'full' else None
+    # 已经交给_trace_sink的栈顶、上一次记录后栈顶到过的最低位置、已经交给_trace_sink的输入位置，用于求栈和输入的增量
+    _trace_top, _trace_low, _trace_input_index = -1, -1, 0
+    # 'ring'级别时最近的若干步，每一步只保存(出栈个数, 入栈的(状态, 符号), 输入位置, 当前输入token, 动作)，出错时才渲染
+    _trace_ring = deque()
+    _trace_base = TraceStack()  # 'ring'级别时环形缓冲区中最早的一步之前的栈(被挤出的步的增量在这里执行)
+    _trace_omitted = 0  # 'ring'级别时被挤出环形缓冲区的步数
+    _trace_after_error = 0  # 'ring'级别时错误后还要直接记录的步数
+
+    def get_action_str(_action: int | str) -> str:
+        # 推导过程中的action列：整数编码的动作(见encode_action)转为字符串，错误恢复的动作本身就是字符串
+        if isinstance(_action, str):
+            return _action
+        _action_tag, _action_value = _action & ACTION_TAG_MASK, _action >> ACTION_TAG_BITS
+        if _action_tag == ACTION_ACCEPT:  # 在执行action时break
+            return 'accept'
+        if _action_tag == ACTION_SHIFT:
+            return f'Shift to `{_action_value}`'
+        _left_symbol, _right_symbol_list = _augmented_grammar_order_list[_action_value]
+        return f"Reduce by `{_left_symbol + ' -> ' + ' '.join(_right_symbol_list)}`"
+
+    def record(_action: int | str, _is_error: bool = False):
+        # 按记录级别记录一步推导过程，_action为整数编码的动作或者错误恢复的动作字符串
+        nonlocal _trace_omitted, _trace_after_error, _trace_top, _trace_low, _trace_input_index
+        if _trace_level == 'actions':
+            _SLR_parsing_procedure.append(['', '', '', get_action_str(_action)])
+        elif _trace_level == 'full':
+            # 栈的增量：上一次记录后栈顶最低到过_trace_low，之后的位置都是新入栈的
+            _push = [(_stack[k], _symbols[k]) for k in range(_trace_low + 1, _top + 1)]
+            _trace_sink.step(_trace_top - _trace_low, _push, _input_index - _trace_input_index,
+                             get_input_str() if _trace_sink.needs_input else None, get_action_str(_action))
+            _trace_top = _trace_low = _top
+            _trace_input_index = _input_index
+        else:
+            _pop, _push = _trace_top - _trace_low, [(_stack[k], _symbols[k]) for k in range(_trace_low + 1, _top + 1)]
+            _trace_top = _trace_low = _top
+            if _is_error:  # 渲染并输出错误前的若干步，之后的若干步直接记录
+                if _trace_omitted > 0:
+                    _SLR_parsing_procedure.append(['…', '…', '…', f"… ({_trace_omitted} steps omitted)"])
+                # 环形缓冲区中的每个输入位置都是某一步的当前输入token，之后的token还在_input中
+                _first_index = _trace_ring[0][2] if _trace_ring else _input_index
+                _upcoming = []
+                for _, _, _step_index, _step_token, _ in _trace_ring:
+                    if _step_index - _first_index == len(_upcoming):
+                        _upcoming.append(_step_token)
+                _upcoming.extend(_input.peek(k) for k in range(_trace_ring_size + 1))
+                for _step_pop, _step_push, _step_index, _, _step_action in _trace_ring:
+                    _SLR_parsing_procedure.append([*_trace_base.apply(_step_pop, _step_push),
+                                                   get_ring_input_str(_upcoming, _step_index - _first_index),
+                                                   get_action_str(_step_action)])
+                _SLR_parsing_procedure.append([*_trace_base.apply(_pop, _push),
+                                               get_ring_input_str(_upcoming, _input_index - _first_index),
+                                               get_action_str(_action)])
+                _trace_ring.clear()
+                _trace_omitted, _trace_after_error = 0, _trace_ring_size
+            elif _trace_after_error > 0:
+                _SLR_parsing_procedure.append([*_trace_base.apply(_pop, _push), get_input_str(_trace_ring_size),
+                                               get_action_str(_action)])
+                _trace_after_error -= 1
+            else:
+                _trace_ring.append((_pop, _push, _input_index, _input.peek(), _action))
+                if len(_trace_ring) > _trace_ring_size:  # 挤出最早的一步
+                    _step_pop, _step_push = _trace_ring.popleft()[:2]
+                    _trace_base.update(_step_pop, _step_push)
+                    _trace_omitted += 1
+
+    def grow():
+        # 栈满时四个栈的容量都翻倍(原地扩展)
+        _stack.extend([0] * len(_stack))
+        for _parallel_stack in (_symbols, _symbols_value, _symbols_place):
+            _parallel_stack.extend([None] * len(_parallel_stack))
+
     # 开始推导
     while True:
         # 获取当前状态
-        now_state = _stack[-1]
+        now_state = _stack[_top]
         # 获取当前输入
-        now_input_token = _input[0]
-        now_input_value = type_map.get(now_input_token.type, now_input_token.value)
-        # 获取下一步动作
-        if now_input_value in _terminal_symbol_list:
-            _next_action = _action[now_state][now_input_value]
-        elif now_input_value in _nonterminal_symbol_list:
+        now_input_token = _input.peek()
+        now_input_id = get_terminal_id(now_input_token, _terminal_index)
+        # 获取下一步动作(预先解码的整数，见encode_action)
+        if now_input_id >= 0:
+            _table_index = _table_base[now_state] + now_input_id
+            _next_action = _table_value[_table_index] if _table_check[_table_index] == now_state else ACTION_ERROR
+        elif type_map.get(now_input_token.type, now_input_token.value) in _nonterminal_index:
             raise Exception(f"input中不可能直接出现非终结符(理论上不可能): {str(now_input_token)}")
         else:
             raise Exception(f"未知的Token(似乎没有在token预处理中过滤掉):{str(now_input_token)}")
+        _next_action_tag = _next_action & ACTION_TAG_MASK
         # 处理未定义的情况（错误恢复），并输出错误信息
-        if _next_action == '':
+        if _next_action_tag == ACTION_ERROR:
             # 错误处理的思路如下：
             # 一、记录错误的行列号和错误的token，注意防止重复记录
             # 二、找到替换的错误序列：
@@ -711,30 +1653,31 @@ def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
             # 六、完成错误处理，执行continue
             pass
             grammatical_mistake = True
-            _error_list.append("语法错误")
+            _context.error_list.append("语法错误")
             # 一、记录错误的行列号和错误的token，注意防止重复记录
+            now_input_place = get_place(now_input_token)
             if len(_SLR_parsing_error) == 0 or _SLR_parsing_error[-1] != \
-                    [_token_place[_input_index][0], _token_place[_input_index][1], now_input_token.value]:
+                    [now_input_place[0], now_input_place[1], now_input_token.value]:
                 _SLR_parsing_error.append(
-                    [_token_place[_input_index][0], _token_place[_input_index][1], now_input_token.value])
+                    [now_input_place[0], now_input_place[1], now_input_token.value])
             # 二、删除错误的序列
             # 1. 假设symbols[i+1:]和input[:j+1]需要替换, i指针初始为len-1，j指针初始为0
-            i, j = len(_symbols) - 1, 0
+            i, j = _top, 0
             # 2. 指针j向后移直到input[j] in ["}", ";"]，注意：如果读取到了"{"那么必须匹配到一个"}"，两个"{"也要匹配两个"}"，以此类推
             left_brace_count = 0
-            while j < len(_input):
-                if _input[j].value == "{":
+            while _input.peek(j) is not None:
+                if _input.peek(j).value == "{":
                     left_brace_count += 1
-                elif _input[j].value == "}":
+                elif _input.peek(j).value == "}":
                     left_brace_count -= 1
                     if left_brace_count == 0:
                         break
-                elif _input[j].value == ";" and left_brace_count == 0:
+                elif _input.peek(j).value == ";" and left_brace_count == 0:
                     break
                 j += 1
             # 2.1. 如果j已经到最后了还没有找到，那么判断是缺少;或}，或者function后多了一些不该有的符号。此时input的内容几乎没法分析，直接全部删除：j=len(input)-1，还要j-=1因为结尾有一个'$'
-            if j >= len(_input) - 1:
-                j = len(_input) - 1
+            if _input.peek(j + 1) is None:  # 即j >= len(input) - 1
+                j = j if _input.peek(j) is not None else j - 1  # 即j = len(input) - 1
                 j -= 1  # 因为结尾有一个'$'
             # 3. 指针i向前移直到set(["block", "(closed_/open_)statement", "function", "program"] & goto[stack[i]] != set()。如果指针i前移过程中，在symbols[i]中遇到了这些非终结符中的某一个，那么匹配的非终结符优先级更低(防止死循环)
             # target_goto_key_list = ["Block", "Closed_statement", "Open_statement", "Statement", "Function", "Program"] # FIXME 删掉了部分
@@ -744,8 +1687,9 @@ def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
                 goto_key_found = False
                 # 3.2. 记录匹配的goto操作，匹配的优先级为："block" > "(closed_>open_)statement" > "function" > "program"
                 for goto_key in target_goto_key_list:
-                    if _goto[_stack[i]].get(goto_key, ""):
-                        if not (j == -1 and i == len(_symbols) - 2 and target_goto_key_list.index(
+                    if goto_key in _goto_columns and \
+                            _table_check[_table_base[_stack[i]] + _goto_columns[goto_key]] == _stack[i]:
+                        if not (j == -1 and i == _top - 1 and target_goto_key_list.index(
                                 _symbols[i + 1]) >= target_goto_key_list.index(goto_key)):
                             goto_key_found = True
                             break
@@ -758,92 +1702,81 @@ def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
                 goto_key = "Program"
             assert goto_key in target_goto_key_list, "未知的goto_key(理论上不可能)"
             # 三、输出错误信息：[ERROR] Reduce by (closed_/open_)statement/.../program -> symbols[i+1:] + input[:j+1]
-            _next_action_str = f"[ERROR] Reduce by `{goto_key} -> {' '.join([str(i) for i in _symbols[i + 1:]])} {' '.join([type_map.get(i.type, i.value) for i in _input[:j + 1]])}`"
-            _SLR_parsing_procedure.append([
-                ' '.join([str(i) for i in _stack]),
-                ' '.join([str(i) for i in _symbols]),
-                ' '.join([str(type_map.get(i.type, i.value)) for i in _input]),
-                _next_action_str
-            ])
+            if _trace_level != 'off':
+                _next_action_str = f"[ERROR] Reduce by `{goto_key} -> {' '.join([str(i) for i in _symbols[i + 1:_top + 1]])} {' '.join([type_map.get(_input.peek(k).type, _input.peek(k).value) for k in range(j + 1)])}`"
+                record(_next_action_str, _is_error=True)
             # 四、删除错误的序列
-            _stack, _symbols, _input = _stack[:i + 1], _symbols[:i + 1], _input[j + 1:]
+            _top = i
+            if _top < _trace_low:
+                _trace_low = _top
+            _input.advance(j + 1)
             _input_index += j + 1
             # 五、放入一个(closed_/open_)statement/.../program，就完成了错误序列的替换，然后执行对应的goto操作
-            _symbols.append(goto_key)
-            now_state = _stack[-1]
-            _stack.append(int(_goto[now_state][goto_key]))
+            now_state = _stack[_top]
+            _top += 1
+            if _top == len(_stack):
+                grow()
+            _stack[_top] = _table_value[_table_base[now_state] + _goto_columns[goto_key]]
+            _symbols[_top], _symbols_value[_top], _symbols_place[_top] = goto_key, None, None
             # 六、完成错误处理，执行continue
             continue
 
-        # 判断action是否合法
-        assert _next_action.count('s') + _next_action.count('r') < 2, "归约归约冲突或移入归约冲突(似乎之前没检查出来)"
-        assert _next_action == 'acc' or (_next_action[0] in ['s', 'r'] and _next_action[1:].isnumeric()), \
-            "未知的action表动作(似乎之前没检查出来)"
-        # 动作转为对应字符串
-        _next_action_str = ''
-        if _next_action == 'acc':  # 在执行action时break
-            _next_action_str = 'accept'
-        elif _next_action[0] == 's' and _next_action[1:].isnumeric():
-            _next_action_str = f'Shift to `{_next_action[1:]}`'
-        elif _next_action[0] == 'r' and _next_action[1:].isnumeric():
-            _next_action_str = f'''Reduce by `{
-            _augmented_grammar_order_list[int(_next_action[1:])][0] + ' -> ' +
-            ' '.join(_augmented_grammar_order_list[int(_next_action[1:])][1])
-            }`'''
-        else:
-            raise Exception(f"未知的action表动作(似乎没有在上面处理掉): {_next_action}")
-        # 输出到output_table
-        _SLR_parsing_procedure.append([
-            ' '.join([str(i) for i in _stack]),
-            ' '.join([str(i) for i in _symbols]),
-            ' '.join([str(type_map.get(i.type, i.value)) for i in _input]),
-            _next_action_str
-        ])
+        # 动作转为对应字符串(action表的合法性已经由check_SLR检查过)
+        _next_action_value = _next_action >> ACTION_TAG_BITS
+        if _trace_level != 'off':
+            # 输出到output_table(动作在记录时才转为字符串，见get_action_str)
+            record(_next_action)
 
         # 执行action
-        if _next_action == 'acc':
+        if _next_action_tag == ACTION_ACCEPT:
             break
-        elif 's' in _next_action and _next_action[1:].isnumeric():
-            _stack.append(int(_next_action[1:]))
-            _symbols.append(now_input_value)
-            _symbols_value.append(get_lex_value(now_input_token))
-            _symbols_place.append(_token_place[_input_index])
-            _input = _input[1:]
+        elif _next_action_tag == ACTION_SHIFT:
+            _top += 1
+            if _top == len(_stack):
+                grow()
+            _stack[_top] = _next_action_value
+            _symbols[_top] = _terminal_symbol_list[now_input_id]
+            _symbols_value[_top] = get_lex_value(now_input_token)
+            _symbols_place[_top] = get_place(now_input_token)
+            _input.advance()
             _input_index += 1
-        elif 'r' in _next_action and _next_action[1:].isnumeric():
-            reduce_index = int(_next_action[1:])
+        else:
+            reduce_index = _next_action_value
             reduce_production = _augmented_grammar_order_list[reduce_index]
             left_symbol, right_symbol_list = reduce_production
-            my_sdt_action._tmp_right = right_symbol_list
-            my_sdt_action._tmp_token_place = []
-            popped_symbols_value = []
-            for _ in range(len(right_symbol_list)):
-                _stack.pop()
-                _symbols.pop()  # 这个值也是符号值的栈它应该有的类型
-                my_sdt_action._tmp_token_place.append(_symbols_place.pop())
-                popped_symbols_value.append(_symbols_value.pop())
-            my_sdt_action._tmp_token_place.reverse()  # 出栈的顺序是反过来的，所以要反转
-            popped_symbols_value.reverse()  # 出栈的顺序是反过来的，所以要反转
+            # 出栈：右部的符号在栈顶的len(right_symbol_list)个位置，按入栈的顺序取出
+            _bottom = _top - len(right_symbol_list) + 1
+            _context.tmp_right = right_symbol_list
+            _context.tmp_token_place = _symbols_place[_bottom:_top + 1]
+            popped_symbols_value = _symbols_value[_bottom:_top + 1]
+            _top = _bottom - 1
+            if _top < _trace_low:
+                _trace_low = _top
             if not grammatical_mistake:
-                left_symbol_value = get_reduce_value(left_symbol, right_symbol_list, popped_symbols_value,
-                                                     nonterminal_symbol_list)
+                # 执行语义动作，获取归约的值
+                try:
+                    left_symbol_value = _sdt_actions[reduce_index](*popped_symbols_value)
+                except Exception as e:
+                    print(f"执行{left_symbol} -> {' '.join(right_symbol_list.rights)}的action时出错: {e}")
+                    raise e
             else:
                 left_symbol_value = None
-            _symbols.append(left_symbol)
-            _symbols_value.append(left_symbol_value)
-            _symbols_place.append(  # None也没关系，因为空产生式不可能报错
-                my_sdt_action._tmp_token_place[0] if len(my_sdt_action._tmp_token_place) > 0 else None)
-            now_state = _stack[-1]
-            _stack.append(int(_goto[now_state][left_symbol]))
-        else:
-            raise Exception(f"未知的action表动作(似乎没有在上面处理掉): {_next_action}")
+            now_state = _stack[_top]
+            _top += 1
+            if _top == len(_stack):
+                grow()
+            _stack[_top] = _table_value[_table_base[now_state] + _left_goto_columns[reduce_index]]
+            _symbols[_top] = left_symbol
+            _symbols_value[_top] = left_symbol_value
+            _symbols_place[_top] = (  # None也没关系，因为空产生式不可能报错
+                _context.tmp_token_place[0] if len(_context.tmp_token_place) > 0 else None)
 
     # 处理break和continue不在loop中的错误的错误位置标记，已经在三地址码中标记了它们的位置，提取出来对号入座即可
-    _error_goto_in__result_code = list(filter(lambda code_line: "goto_____" in code_line, my_sdt_action._result_code))
+    _error_goto_in__result_code = list(filter(lambda code_line: "goto_____" in code_line, _context.result_code))
     _error_break_or_continue_in__error_list = list(filter(
         lambda _error_line: _error_line in \
                             ["Error: break statement not in loop", "Error: continue statement not in loop"],
-        my_sdt_action._error_list))
+        _context.error_list))
     assert len(_error_goto_in__result_code) == len(_error_break_or_continue_in__error_list), "break和continue的错误位置标记不对应"
     _error_break_or_continue_indexes = []
     for _error_goto, _error_b_or_c in zip(_error_goto_in__result_code, _error_break_or_continue_in__error_list):
@@ -852,17 +1785,17 @@ def SLR_parsing(_tokens: list[Token], _token_place: list[tuple[int, int]],
         _error_goto_place = (int(_error_goto_place_info[0]), int(_error_goto_place_info[1]))
         _error_break_or_continue_indexes.append(_error_goto_place)
     # 在错误中对号入座，添加上位置信息作为前缀（Line xxx, Column xxx, ）
-    for i in range(len(my_sdt_action._error_list)):
-        if my_sdt_action._error_list[i] in \
+    for i in range(len(_context.error_list)):
+        if _context.error_list[i] in \
                 ["Error: break statement not in loop", "Error: continue statement not in loop"]:
             _error_break_or_continue_index = _error_break_or_continue_indexes.pop(0)
-            my_sdt_action._error_list[i] = \
+            _context.error_list[i] = \
                 f"Line {_error_break_or_continue_index[0]}, Column {_error_break_or_continue_index[1]}, " + \
-                my_sdt_action._error_list[i]
-    # 完事后在my_sdt_action._result_code中删除标记信息
-    for i in range(len(my_sdt_action._result_code)):
-        if "goto_____" in my_sdt_action._result_code[i]:
-            my_sdt_action._result_code[i] = "goto_____  // 错误的break或continue位置标记"
+                _context.error_list[i]
+    # 完事后在_context.result_code中删除标记信息
+    for i in range(len(_context.result_code)):
+        if "goto_____" in _context.result_code[i]:
+            _context.result_code[i] = "goto_____  // 错误的break或continue位置标记"
     return _SLR_parsing_procedure, _SLR_parsing_error
 
 
@@ -877,76 +1810,81 @@ def print_SLR_parsing_procedure_to_excel(_SLR_parsing_procedure: list[list[str]]
     :param column_names: 要输出的列名
     :param output_filepath: 输出文件路径
     """
-    # 创建一个Excel工作簿
-    wb = Workbook()
-    # 选择默认的工作表
-    ws = wb.active
-
-    # 要输出的列名对应的顺序
-    column_indexes = [["Stack", "Symbols", "Input", "Action"].index(column_name) + 1 for column_name in column_names]
-    # 要输出的列名对应的宽度
-    column_widths = [{"Stack": 10, "Symbols": 100, "Input": 80, "Action": 50}[column_name] for column_name in
-                     column_names]
-
-    # 设置表头
-    ws.append(column_names)
-
-    # 输出表体
-    for row in _SLR_parsing_procedure:
-        ws.append([row[i - 1] for i in column_indexes])
-
-    # 设置每个单元格的为字符串格式
-    for i in range(1, len(_SLR_parsing_procedure) + 2):
-        for j in range(1, len(column_names) + 1):
-            ws.cell(row=i, column=j).data_type = 's'
-
-    # 设置每一列的对应宽度
-    for i, width in enumerate(column_widths):
-        column_letter = get_column_letter(i + 1)
-        ws.column_dimensions[column_letter].width = width
-
-    # 保存Excel文件
-    wb.save(output_filepath)
+    # 用write_only模式流式写入(需要同时输出多个文件时，直接用ExcelTraceSink一次写完)
+    with ExcelTraceSink({output_filepath: column_names}) as excel_sink:
+        for row in _SLR_parsing_procedure:
+            excel_sink.write_row(row)
 
 
 # %%
 # 预处理tokens
-def preprocessing_tokens(_tokens: list[Token], _token_place: list[tuple[int, int]]) -> \
-        tuple[list[Token], list[tuple[int, int]]]:
+# 预处理时过滤掉的token类型：空白符、预处理命令、注释
+IGNORED_TOKEN_TYPES = frozenset(['whitespace', 'command', 'comment'])
+# 支持的运算符
+SUPPORTED_OPERATORS = frozenset(['+', '+=', '-', '-=', '*', '*=', '/', '/=', '%', '%=', '!', '!=',
+                                 '<', '<=', '=', '==', '>', '>=',
+                                 '&&', '||', '&',
+                                 '(', ')', '[', ']', '{', '}', ';', ','])
+# 支持的关键字
+SUPPORTED_KEYWORDS = frozenset(['int', 'float', 'char', 'string', 'bool', 'void',
+                                'long', 'double',
+                                'true', 'false',
+                                'if', 'else', 'while', 'do', 'for', 'goto', 'break', 'continue',
+                                'return'])
+
+
+def filter_tokens(_tokens: Iterable[Token], _terminal_symbol_list: list[str] | None = None) -> Iterator[Token]:
     """
-    预处理tokens: 过滤掉不处理的类型：空白符、预处理命令、注释；末尾加一个结束符
-    :param _tokens: 词法分析结果
-    :param _token_place: token的位置(行号、列号)的列表
-    :return: 预处理后的tokens
+    预处理tokens的流水线(只遍历一次，可以直接接在流式词法分析后面)：
+    过滤掉不处理的类型：空白符、预处理命令、注释；检查错误token、不支持的运算符和关键字；
+    给出终结符列表时同时记录每个token的终结符编号(推导时不再需要查找)；末尾加一个结束符
+    :param _tokens: 词法分析结果(Token列表、TokenStore或者token生成器)
+    :param _terminal_symbol_list: 终结符列表
+    :return: 预处理后的token生成器
     """
-    assert isinstance(_tokens, list) and len(_tokens) > 0, "词法分析结果为空，可能你的输入路径有问题"
-    # 过滤掉不处理的类型：空白符、预处理命令、注释
-    _token_place = [_token_place[i] for i in range(len(_token_place))
-                    if _tokens[i].type not in ['whitespace', 'command', 'comment']]
-    _tokens = list(filter(lambda _token: _token.type not in ['whitespace', 'command', 'comment'], _tokens))
-    # 报错，不该有的类型：错误
-    assert len(list(filter(lambda _token: _token.type in ['error'], _tokens))) == 0, \
-        f"不该有的类型: error，你的词法分析未通过，请检查代码的词法错误，可以使用上次的可视化"
-    # 报错，暂不支持的运算符
+    if isinstance(_tokens, TokenStore):  # 在数组上过滤，不为被过滤掉的token创建Token对象
+        _tokens = _tokens.exclude_types(IGNORED_TOKEN_TYPES)
+    _terminal_index = {symbol: index for index, symbol in enumerate(_terminal_symbol_list or [])}
     for token in _tokens:
-        if token.type == 'operator' and token.value not in \
-                ['+', '+=', '-', '-=', '*', '*=', '/', '/=', '%', '%=', '!', '!=',
-                 '<', '<=', '=', '==', '>', '>=',
-                 '&&', '||', '&',
-                 '(', ')', '[', ']', '{', '}', ';', ',']:
+        _type = token.type
+        if _type in IGNORED_TOKEN_TYPES:
+            continue
+        # 报错，不该有的类型：错误
+        assert _type != 'error', f"不该有的类型: error，你的词法分析未通过，请检查代码的词法错误，可以使用上次的可视化"
+        # 报错，暂不支持的运算符
+        if _type == 'operator' and token.value not in SUPPORTED_OPERATORS:
             raise Exception(f"暂不支持的运算符: {str(token)}")
-    # 报错，暂不支持的关键字
-    for token in _tokens:
-        if token.type == 'keyword' and token.value not in \
-                ['int', 'float', 'char', 'string', 'bool', 'void',
-                 'long', 'double',
-                 'true', 'false',
-                 'if', 'else', 'while', 'do', 'for', 'goto', 'break', 'continue',
-                 'return']:
+        # 报错，暂不支持的关键字
+        if _type == 'keyword' and token.value not in SUPPORTED_KEYWORDS:
             raise Exception(f"暂不支持的关键字: {str(token)}")
+        if _terminal_index:
+            get_terminal_id(token, _terminal_index)
+        yield token
     # 末尾加一个结束符
-    _token_place.append((-1, -1))
-    _tokens.append(Token('end', '$', ''))
+    end_token = Token('end', '$', '')
+    if _terminal_index:
+        get_terminal_id(end_token, _terminal_index)
+    yield end_token
+
+
+def preprocessing_tokens(_tokens: list[Token] | TokenStore, _token_place: list[tuple[int, int]] | None = None,
+                         _terminal_symbol_list: list[str] | None = None) -> \
+        tuple[list[Token], list[tuple[int, int]]]:
+    """
+    预处理tokens: 过滤掉不处理的类型：空白符、预处理命令、注释；末尾加一个结束符(见filter_tokens)
+    :param _tokens: 词法分析结果(Token列表或TokenStore，TokenStore只为保留下来的token创建Token对象)
+    :param _token_place: token的位置(行号、列号)的列表，为None时从过滤后的token中读取
+    :param _terminal_symbol_list: 终结符列表，给出时同时记录每个token的终结符编号
+    :return: 预处理后的tokens
+    """
+    assert isinstance(_tokens, (list, TokenStore)) and len(_tokens) > 0, "词法分析结果为空，可能你的输入路径有问题"
+    if _token_place is not None:
+        assert isinstance(_tokens, list), "TokenStore中的token自带位置，不需要传入_token_place"
+        _token_place = [place for token, place in zip(_tokens, _token_place) if token.type not in IGNORED_TOKEN_TYPES]
+        _token_place.append((-1, -1))
+    _tokens = list(filter_tokens(_tokens, _terminal_symbol_list))
+    if _token_place is None:
+        _token_place = get_token_place(_tokens)  # 结束符的位置为(-1, -1)
 
     return _tokens, _token_place
 
@@ -955,22 +1893,12 @@ def preprocessing_tokens(_tokens: list[Token], _token_place: list[tuple[int, int
 # 获取token的位置(行号、列号)
 def get_token_place(_tokens: list[Token]) -> list[tuple[int, int]]:
     """
-    获取token的位置(行号、列号)的列表，用于报错时提示错误位置，通过token_place[token_index]来使用
+    获取token的位置(行号、列号)的列表，用于报错时提示错误位置，通过token_place[token_index]来使用。
+    位置在词法分析时已经记录在token中，这里不再逐字符扫描
     :param _tokens: 词法分析结果，注意：此处需要过滤前的tokens
     :return: token的位置的列表(行号、列号)，查找时用token_place[token_index]
     """
-    _token_place = list()
-    _line_number = 1
-    _column_number = 1
-    for token in _tokens:
-        _token_place.append((_line_number, _column_number))
-        for char in token.value:
-            if char == '\n':
-                _line_number += 1
-                _column_number = 1
-            else:
-                _column_number += 1
-    return _token_place
+    return [(token.line, token.column) for token in _tokens]
 
 
 def get_lex_value(_token: Token) -> my_sdt_action.Symbol.id | my_sdt_action.Symbol.num | None:
@@ -991,56 +1919,124 @@ def get_lex_value(_token: Token) -> my_sdt_action.Symbol.id | my_sdt_action.Symb
         return None
 
 
-def get_reduce_value(_left_symbol: str,
-                     _right_symbol_list: my_sdt.SDT_right[str], _popped_symbols_value: list[my_sdt_action.Symbol],
-                     _nonterminal_symbol_list: list[str]) -> \
-        my_sdt_action.Symbol._symbol | None:
-    """
-    获取归约的值（其实也是执行对应语义动作）
-    :param _left_symbol: 归约的左侧符号
-    :param _right_symbol_list: 归约的右侧符号列表
-    :param _popped_symbols_value: 归约的右侧符号值列表
-    :param _nonterminal_symbol_list: 非终结符列表，用于判断是否有值
-    :return: 归约的值
-    """
-    # 步骤如下
-    # 产生每个右部符号对应的值的变量(有值的才生成变量)
-    # 看看需不需要引入my_sdt的内部变量
-    # 再产生一个归约的值的实例，用来存储结果
-    # 执行action的代码
-    # 返回值
-
-    try:
-        # 定义一个local_context，用于存储局部变量
-        local_context = dict()
-
-        # 产生每个右部符号对应的值的变量(有值的才生成变量)
-        for i in range(len(_right_symbol_list)):
-            # 断言两种判断方式相同
-            assert (_popped_symbols_value[i] is not None) \
-                   == (_right_symbol_list[i] in ['num',
-                                                 'id'] + _nonterminal_symbol_list), "两种判断方式不同, 可能是符号栈中的非终结符的值没有正确赋值"
-            if _popped_symbols_value[i] is not None:
-                local_context[_right_symbol_list.rights[i]] = _popped_symbols_value[i]  # 注意这里要用.rights[i]，而不是[i]
-        # 看看需不需要引入my_sdt的内部变量
-        inner_variable = [
-            'nextinstr', 'top', '_error_list',
-            'backpatch', 'merge', 'makelist', 'gen', 'newTemp', 'array', 'error', 'resultAccuracy',
-            'int', 'long', 'float', 'double', ]
-        for i in inner_variable:
-            if i in _right_symbol_list.a:
-                exec(f"from my_sdt_action import {i}", globals(), local_context)
-        # 再产生一个归约的值的实例，用来存储结果
-        exec(f"{_left_symbol} = my_sdt_action.Symbol.{_left_symbol}()", globals(), local_context)
-        # 执行action的代码
-        # exec(_right_symbol_list.a) # 应该分行执行（且去""""""长字符串所带来的空格，这个在导入的包中处理）
-        exec(_right_symbol_list.a, globals(), local_context)
-        # 返回值
-        result = local_context.get(_left_symbol)
-        return result
-    except Exception as e:
-        print(f"执行{_left_symbol} -> {' '.join(_right_symbol_list.rights)}的action时出错: {e}")
-        raise e
+# 语义动作工厂函数编译后的代码对象(按文法缓存，同一个文法只生成源码、编译一次，见get_sdt_action_key)
+_sdt_action_code_cache = dict()
+
+
+def get_sdt_action_key(_augmented_grammar_order_list: list[tuple[str, my_sdt.SDT_right[str]]],
+                       _nonterminal_symbol_list: list[str]) -> tuple:
+    """
+    语义动作缓存的键：生成的源码只由产生式(左部、带编号的右部、语义动作)和非终结符列表决定，
+    直接用它们作为键(不需要每次都生成源码再查找)
+    :param _augmented_grammar_order_list: 增广文法序号列表
+    :param _nonterminal_symbol_list: 非终结符列表
+    :return: 可哈希的键
+    """
+    return (tuple(_nonterminal_symbol_list),
+            tuple((left_symbol, tuple(right_symbol_list.rights), right_symbol_list.a)
+                  for left_symbol, right_symbol_list in _augmented_grammar_order_list))
+
+
+def get_copy_chain_child(_left_symbol: str, _right_symbol_list: my_sdt.SDT_right[str]) -> int | None:
+    """
+    判断语义动作是否只是把某一个右部符号的属性原样复制给左部(例如Expr -> Expr_Assign)，
+    是且复制了左部的全部属性、该右部符号的记录也有这些属性时，归约时直接复用它的记录，不再新建
+    :param _left_symbol: 产生式左部
+    :param _right_symbol_list: 产生式右部
+    :return: 复用的右部符号的下标，不能复用时为None
+    """
+    copied = dict()  # 左部的属性 -> 复制自的右部变量名
+    for statement in ast.parse(_right_symbol_list.a).body:
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Attribute) and isinstance(statement.value, ast.Attribute)):
+            return None
+        target, value = statement.targets[0], statement.value
+        if not (isinstance(target.value, ast.Name) and target.value.id == _left_symbol
+                and isinstance(value.value, ast.Name) and value.attr == target.attr):
+            return None
+        copied[target.attr] = value.value.id
+    if len(set(copied.values())) != 1:
+        return None
+    child_name = next(iter(copied.values()))
+    if child_name == _left_symbol or child_name not in _right_symbol_list.rights:
+        return None
+    # 同名的符号取后面的(和get_sdt_action_source中的参数一致)
+    child_index = len(_right_symbol_list.rights) - 1 - _right_symbol_list.rights[::-1].index(child_name)
+    left_fields = getattr(my_sdt_action.Symbol, _left_symbol).__slots__
+    child_fields = getattr(getattr(my_sdt_action.Symbol, _right_symbol_list[child_index], None), '__slots__', ())
+    if set(copied) != set(left_fields) or not set(left_fields) <= set(child_fields):
+        return None
+    return child_index
+
+
+def get_sdt_action_source(_augmented_grammar_order_list: list[tuple[str, my_sdt.SDT_right[str]]],
+                          _nonterminal_symbol_list: list[str]) -> str:
+    """
+    生成语义动作工厂函数make_sdt_actions(ctx)的源码：先把my_sdt_action.CONTEXT_NAMES中的名字绑定到ctx的同名属性，
+    再为每个产生式的语义动作定义一个函数：函数名为sdt_action_产生式编号，按位置接收右部符号的值
+    (有值的符号用.rights中的名字作为参数名，其他的用_下标)，先读取用到的my_sdt_action.CONTEXT_VALUES(例如nextinstr)，
+    再产生一个归约的值的实例，执行action的代码后返回它；只复制属性的单链归约直接返回右部符号的记录(见get_copy_chain_child)；
+    最后返回按产生式编号排列的语义动作函数列表
+    :param _augmented_grammar_order_list: 增广文法序号列表
+    :param _nonterminal_symbol_list: 非终结符列表，用于判断右部符号是否有值
+    :return: 语义动作工厂函数的源码
+    """
+    valued_symbols = set(['num', 'id'] + _nonterminal_symbol_list)  # 有值的符号
+    source_lines = ["def make_sdt_actions(ctx):"]
+    source_lines.extend(f"    {name} = ctx.{name}" for name in my_sdt_action.CONTEXT_NAMES)
+    source_lines.append("")
+    action_names = []
+    for index, (left_symbol, right_symbol_list) in enumerate(_augmented_grammar_order_list):
+        if not left_symbol.isidentifier():  # S'，不会归约
+            action_names.append("None")
+            continue
+        parameters = [f"_{i}" for i in range(len(right_symbol_list))]
+        for i in range(len(right_symbol_list)):
+            if right_symbol_list[i] in valued_symbols:
+                if right_symbol_list.rights[i] in parameters:  # 同名的符号取后面的符号的值
+                    k = parameters.index(right_symbol_list.rights[i])
+                    parameters[k] = f"_{k}"
+                parameters[i] = right_symbol_list.rights[i]  # 注意这里要用.rights[i]，而不是[i]
+        action_names.append(f"sdt_action_{index}")
+        source_lines.append(f"    def sdt_action_{index}({', '.join(parameters)}):")
+        source_lines.append(f"        # {left_symbol} -> {' '.join(right_symbol_list.rights)}")
+        child_index = get_copy_chain_child(left_symbol, right_symbol_list)
+        if child_index is not None:  # 只复制属性的单链归约，直接复用右部符号的记录
+            source_lines.append(f"        return {parameters[child_index]}")
+        else:
+            used_names = {node.id for node in ast.walk(ast.parse(right_symbol_list.a)) if isinstance(node, ast.Name)}
+            source_lines.extend(f"        {name} = ctx.{name}"
+                                for name in my_sdt_action.CONTEXT_VALUES if name in used_names)
+            source_lines.append(f"        {left_symbol} = Symbol.{left_symbol}()")
+            source_lines.extend(f"        {action_line}" for action_line in right_symbol_list.a.split('\n'))
+            source_lines.append(f"        return {left_symbol}")
+        source_lines.append("")
+    source_lines.append(f"    return [{', '.join(action_names)}]")
+    return '\n'.join(source_lines) + '\n'
+
+
+def compile_sdt_actions(_augmented_grammar_order_list: list[tuple[str, my_sdt.SDT_right[str]]],
+                        _nonterminal_symbol_list: list[str],
+                        _context: my_sdt_action.CompilationContext) -> list:
+    """
+    把语义动作编译为函数(整个文法只编译一次，每次编译只需要用_context调用一次工厂函数)，归约时直接按产生式编号调用：
+    sdt_actions[产生式编号](*右部符号的值) -> 归约的值；
+    top、gen等绑定到_context，nextinstr在执行语义动作前从_context读取，其他名字(Symbol、int等)在my_sdt_action模块中查找
+    :param _augmented_grammar_order_list: 增广文法序号列表
+    :param _nonterminal_symbol_list: 非终结符列表，用于判断右部符号是否有值
+    :param _context: 这次编译的状态
+    :return: 产生式编号 -> 语义动作函数(不会归约的产生式为None)
+    """
+    key = get_sdt_action_key(_augmented_grammar_order_list, _nonterminal_symbol_list)
+    if key not in _sdt_action_code_cache:
+        source = get_sdt_action_source(_augmented_grammar_order_list, _nonterminal_symbol_list)
+        filename = f"<sdt actions {hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]}>"
+        # 登记源码，语义动作出错时traceback可以显示对应的行
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        module_code = compile(source, filename, 'exec')
+        _sdt_action_code_cache[key] = next(code for code in module_code.co_consts
+                                           if isinstance(code, types.CodeType))
+    return types.FunctionType(_sdt_action_code_cache[key], vars(my_sdt_action))(_context)
 
 
 # 输出sdt_grammar
@@ -1082,9 +2078,154 @@ def print_error_list(_error_list: list[str]):
         print(f"{error}")
 
 
+# %%
+# 预先生成语法分析器模块：分析表以整数元组的字面量写入.py文件，导入时不需要任何文法分析(且可以使用.pyc缓存)
+# 生成的模块中的推导循环(接在generate_parser_module写入的分析表之后)
+GENERATED_PARSER_DRIVER = '''
+TERMINAL_INDEX = {symbol: index for index, symbol in enumerate(TERMINALS)}
+
+
+def get_terminal_ids(tokens):
+    """
+    将token序列转为终结符编号序列：过滤掉空白符、预处理命令、注释，末尾加一个结束符
+    :param tokens: 词法分析结果(有type和value属性)
+    :return: 终结符编号的生成器，不是终结符的token编号为-1
+    """
+    for token in tokens:
+        if token.type not in IGNORED_TOKEN_TYPES:
+            yield TERMINAL_INDEX.get(TYPE_MAP.get(token.type, token.value), -1)
+    yield TERMINAL_INDEX['$']
+
+
+def parse(terminal_ids, on_reduce=None):
+    """
+    表驱动的LR推导(不做错误恢复)：栈中保存状态在TABLE中的偏移，
+    action表的格子为TABLE[偏移 + 终结符编号]，TABLE_CHECK不等于偏移时为报错(ACCEPT状态遇到结束符时为接受)，
+    否则小于0时为移进到~TABLE[...]，大于等于0时为按这个编号的产生式归约；goto表的格子为TABLE[偏移 + PRODUCTION_GOTO]
+    :param terminal_ids: 终结符编号序列，以结束符$结尾
+    :param on_reduce: 归约时的回调，参数为产生式编号
+    :return: None表示接受，否则为出错的token在输入中的序号
+    """
+    table, table_check = TABLE, TABLE_CHECK
+    production_goto, production_length = PRODUCTION_GOTO, PRODUCTION_LENGTH
+    end = TERMINAL_INDEX['$']
+    top = START  # 栈顶(stack[-1])
+    stack = [top]
+    position = -1
+    for position, terminal_id in enumerate(terminal_ids):
+        while True:
+            index = top + terminal_id
+            if table_check[index] != top:  # 空的action格子，不是终结符的token(编号为-1)也会在这里报错
+                return None if top == ACCEPT and terminal_id == end else position
+            code = table[index]
+            if code < 0:  # 移进
+                top = ~code
+                stack.append(top)
+                break
+            length = production_length[code]  # 归约
+            if length:
+                del stack[-length:]
+            top = table[stack[-1] + production_goto[code]]
+            stack.append(top)
+            if on_reduce is not None:
+                on_reduce(code)
+    return position + 1
+
+
+if __name__ == '__main__':
+    import sys
+
+    from task1_package import get_token_store
+
+    for input_filepath in sys.argv[1:]:
+        token_list = list(get_token_store(input_filepath).exclude_types(IGNORED_TOKEN_TYPES))
+        error_position = parse(get_terminal_ids(token_list))
+        if error_position is None:
+            print(f"{input_filepath}: OK")
+        elif error_position < len(token_list):
+            token = token_list[error_position]
+            print(f"{input_filepath}: Line {token.line}, Column {token.column}: Unexpected token `{token.value}`")
+        else:
+            print(f"{input_filepath}: Unexpected end of file")
+'''
+
+
+def generate_parser_module(_augmented_grammar: dict[str:list[my_sdt.SDT_right[str]]], _mode: str = 'SLR',
+                           output_filepath: str = './generated_parser.py'):
+    """
+    生成独立的语法分析器模块，包含：文法指纹、终结符和非终结符列表、产生式的左边的符号编号和右边的长度、
+    压缩后的分析表(compress_parser_tables，整数编码的action表和goto表放在同一个一维数组中，状态用它在数组中的偏移表示)，
+    以及推导循环parse
+    :param _augmented_grammar: 增广文法
+    :param _mode: 分析表的类型
+    :param output_filepath: 输出文件路径
+    """
+    tables = load_parser_tables(_augmented_grammar, _mode)
+    check_SLR(tables['action'], tables['goto'], _mode)
+    _nonterminal_symbol_list, _terminal_symbol_list = tables['nonterminal_symbol_list'], tables['terminal_symbol_list']
+    nonterminal_index = {symbol: index for index, symbol in enumerate(_nonterminal_symbol_list)}
+    compressed = compress_parser_tables(tables['action'], tables['goto'], _nonterminal_symbol_list, _terminal_symbol_list,
+                                        default_reductions=False)
+    _table_base = list(compressed.table.base)
+    _, _table_check, _table_value = compressed.get_lists(_table_base)
+    # action表的格子改为推导循环直接使用的形式：移进为~偏移，归约为产生式编号，接受不放入TABLE(由ACCEPT判断)
+    accept_state = None
+    for state in range(compressed.state_count):
+        for terminal_id in range(compressed.terminal_count):
+            index = _table_base[state] + terminal_id
+            if _table_check[index] != _table_base[state]:
+                continue
+            code = _table_value[index]
+            tag, value = code & ACTION_TAG_MASK, code >> ACTION_TAG_BITS
+            if tag == ACTION_SHIFT:
+                _table_value[index] = ~value
+            elif tag == ACTION_REDUCE:
+                _table_value[index] = value
+            else:
+                accept_state = state
+                _table_check[index], _table_value[index] = -1, 0
+    lines = [
+        f"# 由task3.generate_parser_module根据my_sdt.sdt_grammar生成({_mode}分析表)，请勿手动修改",
+        f"# 修改my_sdt.py后运行 python task3.py --generate-parser {output_filepath} 重新生成",
+        f"FINGERPRINT = {get_grammar_fingerprint(_augmented_grammar, _mode).hex()!r}",
+        f"MODE = {_mode!r}",
+        f"TERMINALS = {tuple(_terminal_symbol_list)!r}",
+        f"NONTERMINALS = {tuple(_nonterminal_symbol_list)!r}",
+        f"TYPE_MAP = {type_map!r}",
+        f"IGNORED_TOKEN_TYPES = frozenset({sorted(IGNORED_TOKEN_TYPES)!r})",
+        f"PRODUCTION_LEFT = {tuple(nonterminal_index[left_symbol] for left_symbol, _ in tables['productions'])!r}",
+        f"PRODUCTION_LENGTH = {tuple(len(right) for _, right in tables['productions'])!r}",
+        f"PRODUCTION_GOTO = {tuple(len(_terminal_symbol_list) + nonterminal_index[left_symbol] for left_symbol, _ in tables['productions'])!r}",
+        f"START = {_table_base[0]!r}",
+        f"ACCEPT = {_table_base[accept_state]!r}",
+        f"TABLE = {tuple(_table_value)!r}",
+        f"TABLE_CHECK = {tuple(_table_check)!r}",
+    ]
+    with open(output_filepath, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+        f.write(GENERATED_PARSER_DRIVER)
+
+
 # %%
 # 主函数
 if __name__ == '__main__':
+    import argparse
+    import sys
+
+    arg_parser = argparse.ArgumentParser(description="语法分析和语义分析")
+    arg_parser.add_argument('--mode', choices=PARSER_MODES, default='SLR', help="分析表的类型")
+    arg_parser.add_argument('--trace', choices=TRACE_LEVELS, default='full',
+                            help="推导过程的记录级别(输出到SLR_parsing_procedure的excel文件)，输入很大时可以用off或ring")
+    arg_parser.add_argument('--trace-file', metavar='PATH',
+                            help="推导过程(栈的增量)流式写入csv/jsonl文件，代替推导过程的excel文件(可以用read_trace_file读取)")
+    arg_parser.add_argument('--generate-parser', nargs='?', const='./generated_parser.py', metavar='PATH',
+                            help="只生成独立的语法分析器模块(默认为./generated_parser.py)，不分析输入文件")
+    args, _ = arg_parser.parse_known_args()  # 忽略未知参数(例如在notebook中运行时)
+    if args.generate_parser is not None:
+        generate_parser_module(my_sdt.sdt_grammar, args.mode, args.generate_parser)
+        print(f"已生成语法分析器模块: {args.generate_parser}")
+        sys.exit(0)
+
     for file_id in ["1"]:
         # 定义文件路径
         input_filepath = rf'./data/input/{file_id}_sample.c'  # 输入文件
@@ -1109,47 +2250,34 @@ if __name__ == '__main__':
         print_redirect_builder(output_SDT_result_error_filepath, use_cache=False)("", end="", mode='w')
 
         # 导入词法分析器
-        from task1_package import Token, get_token
-
-        # 获取词法分析结果
-        tokens = get_token(input_filepath)
-        # 定义类型映射，避免混淆。将下面的这些类型的Token映射为对应的非终结符，而其他类型直接用value当作非终结符
-        # （本质为调用type_map.get(token.type, token.value)，如token(1)会映射为'int_value', token(;)则不变';'）
-        type_map = {
-            'int_dec': 'num',
-            'int_oct': 'num',
-            'int_bin': 'num',
-            'int_hex': 'num',
-            'float': 'num',
-            # 'char': 'char_value',
-            # 'string': 'string_value',
-            'identifier': 'id',
-        }
-        # 获取token的位置(行号、列号)，用于语法分析报错
-        token_place = get_token_place(tokens)
-        # 预处理tokens：过滤掉不处理的类型：空白符、预处理命令、注释；末尾加一个结束符
-        tokens, token_place = preprocessing_tokens(tokens, token_place)
+        from task1_package import get_token_store
 
+        # 获取词法分析结果(紧凑存储，空白符、注释等不会创建Token对象)
+        tokens = get_token_store(input_filepath)
         # 读取文法
         # from my_sdt import sdt_grammar as augmented_grammar
         from my_sdt import sdt_grammar as augmented_grammar
 
         # 检查文法格式
         check_grammar(augmented_grammar)
+        # 获取分析表：my_sdt.py没有修改时直接从磁盘缓存加载，否则求First集、Follow集、项集族并构造分析表
+        parser_mode = args.mode
+        parser_tables = load_parser_tables(augmented_grammar, parser_mode)
         # 获取符号列表
-        symbol_list, nonterminal_symbol_list, terminal_symbol_list = get_symbol_list(augmented_grammar)
+        symbol_list = parser_tables['symbol_list']
+        nonterminal_symbol_list = parser_tables['nonterminal_symbol_list']
+        terminal_symbol_list = parser_tables['terminal_symbol_list']
+        # 预处理tokens：过滤掉不处理的类型：空白符、预处理命令、注释；末尾加一个结束符
+        # 同时获取token的位置(行号、列号)，用于语法分析报错；记录token的终结符编号，用于推导时查表
+        tokens, token_place = preprocessing_tokens(tokens, _terminal_symbol_list=terminal_symbol_list)
         # 定义文法顺序
         augmented_grammar_to_index, augmented_grammar_order_list = get_augmented_grammar_to_index(augmented_grammar)
-        # 获取First集和Follow集
-        first = get_first(augmented_grammar, nonterminal_symbol_list, terminal_symbol_list)
-        follow = get_follow(augmented_grammar, nonterminal_symbol_list, terminal_symbol_list, first)
-        # 获取状态集
-        itemSetFamily = get_itemSetFamily(augmented_grammar, symbol_list)
+        # 获取产生式表(项用整数编码)
+        productions = ProductionTable(augmented_grammar)
+        # 获取状态集(由缓存的核心项恢复)
+        itemSetFamily = [ItemSet(kernel, productions) for kernel in parser_tables['kernels']]
         # 获取SLR分析表
-        action, goto = get_SLR_table(
-            augmented_grammar, augmented_grammar_to_index,
-            symbol_list, nonterminal_symbol_list, terminal_symbol_list,
-            first, follow, itemSetFamily)
+        action, goto = parser_tables['action'], parser_tables['goto']
         # 输出SLR分析表到文本文件
         print_SLR_table(nonterminal_symbol_list, terminal_symbol_list, itemSetFamily, action, goto,
                         output_SLR_parsing_table_filepath)
@@ -1157,36 +2285,48 @@ if __name__ == '__main__':
         print_SLR_table_to_excel(nonterminal_symbol_list, terminal_symbol_list, itemSetFamily, action, goto,
                                  output_SLR_parsing_table_excelPath)
         # 检查SLR冲突
-        check_SLR(action, goto)
+        check_SLR(action, goto, parser_mode)
+        # 推导过程的输出：指定了--trace-file时流式写入该文件；full级别时推导时直接流式写入两个excel文件；
+        # 其他级别的记录很少，推导后再写入excel文件
+        SLR_parsing_procedure_excel = {
+            output_SLR_parsing_procedure_all_excelPath: ("Stack", "Symbols", "Input", "Action"),
+            output_SLR_parsing_procedure_symbolAndAction_excelPath: ("Symbols", "Action"),
+        }
+        if args.trace_file is not None:
+            trace = open_trace_file(args.trace_file)
+        elif args.trace == 'full':
+            trace = ExcelTraceSink(SLR_parsing_procedure_excel)
+        else:
+            trace = args.trace
+        # 这个文件的编译状态(语义分析的结果也在里面)
+        compilation_context = my_sdt_action.CompilationContext()
         # 开始推导
         SLR_parsing_procedure, SLR_parsing_error = SLR_parsing(
             tokens, token_place,
             augmented_grammar_order_list, nonterminal_symbol_list, terminal_symbol_list,
-            itemSetFamily, action, goto)
+            itemSetFamily, action, goto, trace, _context=compilation_context, _table=parser_tables['table'])
+        if isinstance(trace, TraceSink):
+            trace.close()
         # 输出错误信息
         print = print_redirect_builder(output_SLR_parsing_error_filepath)
         for error in SLR_parsing_error:
             print(f"[ERROR] Line {error[0]}, Column {error[1]}: Unexpected token `{error[2]}`")
         print("\n", flush=True)
-        # 输出推导过程(all)到excel
-        print_SLR_parsing_procedure_to_excel(SLR_parsing_procedure, ("Stack", "Symbols", "Input", "Action"),
-                                             output_SLR_parsing_procedure_all_excelPath)
-        # 输出推导过程(仅符号和动作)到excel
-        print_SLR_parsing_procedure_to_excel(SLR_parsing_procedure, ("Symbols", "Action"),
-                                             output_SLR_parsing_procedure_symbolAndAction_excelPath)
-
-        # 获取语义分析结果
-        from my_sdt_action import _result_code, _error_list
+        # 输出推导过程(all和仅符号和动作)到excel，两个文件一次写完
+        if not isinstance(trace, TraceSink):
+            with ExcelTraceSink(SLR_parsing_procedure_excel) as excel_sink:
+                for row in SLR_parsing_procedure:
+                    excel_sink.write_row(row)
 
         # 输出sdt语法
         print = print_redirect_builder(output_SDT_file, use_cache=False)
         print_sdt_grammar(augmented_grammar)
         # 输出三地址代码
         print = print_redirect_builder(output_SDT_result_3code_filepath, use_cache=False)
-        print_three_address_code(_result_code)
+        print_three_address_code(compilation_context.result_code)
         # 输出语义错误列表
         print = print_redirect_builder(output_SDT_result_error_filepath, use_cache=False)
-        print_error_list(_error_list)
+        print_error_list(compilation_context.error_list)
 
         # 恢复输出，防止后续输出被重定向
         print = builtins.print